@@ -0,0 +1,18 @@
+"""
+Бенчмарки бота. Запуск: python -m benchmarks.<имя_модуля>
+
+Бенчмарки работают без сети и без .env: токен и канал подставляются фиктивные,
+а база по умолчанию создаётся во временном каталоге.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH-token")
+os.environ.setdefault("CHANNEL_ID", "-1001234567890")
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='tsobot-bench-'), 'bench.db')}",
+)
@@ -0,0 +1,87 @@
+"""
+Пропускная способность commit'ов SQLite: настройки по умолчанию против профиля
+(WAL, synchronous=NORMAL, busy_timeout, пул соединений).
+
+    python -m benchmarks.bench_commits [количество_commit'ов]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import benchmarks  # noqa: F401  (фиктивное окружение)
+from benchmarks.common import timer
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.db import create_db_engine
+from database.models import Base, Post, User
+
+WRITERS = 8
+READERS = 4
+
+
+async def run_profile(name: str, tuned: bool, n: int):
+    path = os.path.join(tempfile.mkdtemp(prefix="tsobot-commits-"), "commits.db")
+    db_engine = create_db_engine(f"sqlite+aiosqlite:///{path}", tuned=tuned)
+    session_maker = async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+    async with db_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_maker() as session:
+        session.add(User(user_id=1))
+        await session.commit()
+
+    async def commit_post():
+        async with session_maker() as session:
+            session.add(Post(user_id=1, post_type="free", content="x", status="pending"))
+            await session.commit()
+
+    # Последовательно: одна транзакция за другой
+    with timer() as t:
+        for _ in range(n):
+            await commit_post()
+    sequential = n / t.seconds
+
+    # Параллельно: несколько писателей и читатели, считающие очередь
+    locked = 0
+    writing = True
+
+    async def writer(count: int):
+        nonlocal locked
+        for _ in range(count):
+            try:
+                await commit_post()
+            except OperationalError:
+                locked += 1
+
+    async def reader():
+        reads = 0
+        while writing:
+            async with session_maker() as session:
+                await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
+            reads += 1
+        return reads
+
+    readers = [asyncio.create_task(reader()) for _ in range(READERS)]
+    with timer() as t:
+        await asyncio.gather(*(writer(n // WRITERS) for _ in range(WRITERS)))
+    writing = False
+    reads = sum(await asyncio.gather(*readers))
+    concurrent = (n // WRITERS * WRITERS - locked) / t.seconds
+    await db_engine.dispose()
+
+    print(
+        f"{name:>8}: последовательно {sequential:7.0f} commit/с, "
+        f"{WRITERS} писателей + {READERS} читателя {concurrent:7.0f} commit/с "
+        f"({reads} чтений, ошибок блокировки: {locked})"
+    )
+
+
+async def run(n: int):
+    await run_profile("default", False, n)
+    await run_profile("tuned", True, n)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
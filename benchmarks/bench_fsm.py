@@ -0,0 +1,52 @@
+"""
+Пропускная способность хранилищ FSM: MemoryStorage против SQLStorage.
+
+Один «апдейт» — то, что делает типичный обработчик: get_state, get_data,
+set_state и update_data.
+
+    python -m benchmarks.bench_fsm [апдейтов] [пользователей]
+"""
+import asyncio
+import sys
+
+import benchmarks  # noqa: F401  (фиктивное окружение)
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from benchmarks.common import count_queries, timer
+
+from database.db import init_db
+from states.states import PostStates
+from states.storage import SQLStorage
+
+
+async def run_updates(storage, n: int, users: int, write_through: bool = False):
+    for i in range(n):
+        key = StorageKey(bot_id=1, chat_id=i % users, user_id=i % users)
+        await storage.get_state(key)
+        await storage.get_data(key)
+        await storage.set_state(key, PostStates.waiting_free_post if i % 2 else PostStates.waiting_ad_post)
+        await storage.update_data(key, {"step": i})
+        if write_through:
+            await storage.flush()
+
+
+async def run(n: int, users: int):
+    await init_db()
+    cases = (
+        ("memory", MemoryStorage(), False),
+        ("sql write-behind", SQLStorage(flush_interval=1.0), False),
+        ("sql write-through", SQLStorage(flush_interval=1.0), True),
+    )
+    for name, storage, write_through in cases:
+        with count_queries() as stats, timer() as t:
+            await run_updates(storage, n, users, write_through)
+            await storage.close()
+        print(
+            f"{name:>18}: {n / t.seconds:9.0f} апдейтов/с, "
+            f"{stats.queries / n:5.3f} запросов/апдейт, {stats.commits} commit"
+        )
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    asyncio.run(run(args[0] if args else 20000, args[1] if len(args) > 1 else 500))
@@ -0,0 +1,129 @@
+"""
+Накладные расходы метрик на апдейт и на запрос к Bot API.
+
+Один и тот же поток апдейтов прогоняется через Dispatcher с пустым обработчиком:
+без middleware, с такими же, но пустыми слоями middleware и с MetricsMiddleware.
+Так видно отдельно цену механизма middleware в aiogram и цену кода метрик.
+Разница в несколько микросекунд при ~100 мкс на апдейт тонет в шуме, поэтому
+код метрик меряется ещё и напрямую: те же два вызова middleware без aiogram
+вокруг них против пустых. Для ApiMetrics — запрос, который сразу возвращает ответ.
+
+    python -m benchmarks.bench_metrics [апдейтов] [повторов]
+"""
+import asyncio
+import gc
+import sys
+import time
+
+import benchmarks  # noqa: F401  (фиктивное окружение)
+from aiogram import Bot, Dispatcher, Router
+from aiogram.methods import SendMessage
+from aiogram.types import Update
+
+from benchmarks.bench_sharding import simulated_update
+from middlewares.metrics import ApiMetrics, MetricsMiddleware, MetricsRegistry
+
+
+async def passthrough(handler, event, data):
+    return await handler(event, data)
+
+
+def build(mode: str) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def handle(message):
+        return None
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    if mode == "metrics":
+        MetricsMiddleware(MetricsRegistry()).setup(dp)
+    elif mode == "passthrough":
+        # Те же слои middleware, но пустые: цена самого механизма middleware в aiogram
+        dp.update.outer_middleware(passthrough)
+        for name, observer in dp.observers.items():
+            if name not in ("update", "error"):
+                observer.middleware(passthrough)
+    return dp
+
+
+async def per_update_us(dp: Dispatcher, bot: Bot, updates: list[Update]) -> float:
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / len(updates) * 1e6
+
+
+async def per_middleware_us(outer, inner, update: Update, data: dict, n: int) -> float:
+    """Внешний и внутренний middleware вокруг пустого обработчика, без диспетчера"""
+    async def handler(event, data):
+        return None
+
+    async def inner_chain(event, data):
+        return await inner(handler, event, data)
+
+    started = time.perf_counter()
+    for _ in range(n):
+        await outer(inner_chain, update, data)
+    return (time.perf_counter() - started) / n * 1e6
+
+
+async def per_request_us(middleware, bot: Bot, n: int) -> float:
+    method = SendMessage(chat_id=1, text="x")
+
+    async def make_request(bot, method):
+        return True
+
+    started = time.perf_counter()
+    for _ in range(n):
+        if middleware is None:
+            await make_request(bot, method)
+        else:
+            await middleware(make_request, bot, method)
+    return (time.perf_counter() - started) / n * 1e6
+
+
+async def run(n: int, repeats: int):
+    bot = Bot(token="123456:TEST-token")
+    # Разбор JSON в модели одинаков в обоих случаях и в замер не входит
+    updates = [Update.model_validate(simulated_update(i, 1000 + i % 100), context={"bot": bot}) for i in range(n)]
+    dispatchers = {mode: build(mode) for mode in ("plain", "passthrough", "metrics")}
+    metrics_middleware = MetricsMiddleware(MetricsRegistry())
+    capture = metrics_middleware._capture_handler("message")
+    data = {"handler": dispatchers["plain"].sub_routers[0].message.handlers[0]}
+    api = ApiMetrics(MetricsRegistry())
+
+    # Замеры чередуются, берётся лучший, сборщик мусора выключен: меньше шума
+    timings = {mode: [] for mode in dispatchers}
+    direct = {"passthrough": [], "metrics": []}
+    api_timings = {"plain": [], "metrics": []}
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            for mode, dp in dispatchers.items():
+                timings[mode].append(await per_update_us(dp, bot, updates))
+            direct["passthrough"].append(await per_middleware_us(passthrough, passthrough, updates[0], data, n))
+            direct["metrics"].append(await per_middleware_us(metrics_middleware, capture, updates[0], data, n))
+            api_timings["plain"].append(await per_request_us(None, bot, n))
+            api_timings["metrics"].append(await per_request_us(api, bot, n))
+            gc.collect()
+    finally:
+        gc.enable()
+    await bot.session.close()
+
+    base, layers, with_metrics = (min(timings[mode]) for mode in ("plain", "passthrough", "metrics"))
+    print(f"апдейт через Dispatcher без middleware:   {base:7.2f} мкс")
+    print(f"апдейт через Dispatcher, пустые слои:     {layers:7.2f} мкс")
+    print(f"апдейт через Dispatcher с метриками:      {with_metrics:7.2f} мкс")
+    empty, measured = min(direct["passthrough"]), min(direct["metrics"])
+    print(f"пара пустых middleware напрямую:          {empty:7.2f} мкс")
+    print(f"пара middleware метрик напрямую:          {measured:7.2f} мкс  (код метрик: +{measured - empty:.2f} мкс)")
+    api_base, api_with = min(api_timings["plain"]), min(api_timings["metrics"])
+    print(f"запрос к API без метрик:                  {api_base:7.2f} мкс")
+    print(f"запрос к API с метриками:                 {api_with:7.2f} мкс  (+{api_with - api_base:.2f} мкс)")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    asyncio.run(run(args[0] if args else 20000, args[1] if len(args) > 1 else 8))
@@ -0,0 +1,321 @@
+"""
+Как время горячих запросов растёт с размером таблиц.
+
+БД (схема из database/models.py) наполняется ступенями до 1M постов, 200k
+пользователей, 500k заявок на вступление и 50k платежей. Распределения близки к
+живым: у немногих пользователей большинство постов, в очереди модерации ~2%
+постов, почти все заявки уже обработаны пятью модераторами, даты — за год.
+На каждой ступени замеряются пути, по которым ходят обработчики:
+
+    moderation_first / moderation_deep   страница очереди модерации (первая и из середины)
+    user_posts_first / user_posts_deep   список постов самого активного пользователя
+    user_info                            карточка пользователя с числом постов
+    stats                                экран статистики (collect_stats)
+    pending_counts                       загрузка счётчиков pending при старте
+    ban_cache                            загрузка кэша банов при старте
+    record_payment                       запись платежа (проверка уникальности charge id)
+
+Итог — медиана по каждому пути на каждой ступени и показатель роста k: время
+растёт как n^k при росте таблиц в n раз (k≈0 — не зависит от размера, k≈1 —
+линейно). Для последней ступени печатается план SQLite каждого запроса: строки
+SCAN без индекса — полный проход по таблице.
+
+    python -m benchmarks.bench_scaling [--scale 1.0] [--steps 0.1,0.25,0.5,1] [--repeats 20] [--output scaling.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import benchmarks  # noqa: F401  (фиктивное окружение)
+from sqlalchemy import event, func, insert, select
+
+from database.db import engine, get_db, get_pending_post_page, get_user_posts_page, init_db, record_payment
+from database.models import ChatJoinRequest, Payment, Post, User
+from services.cache import BanCache
+from services.counters import PendingCounters
+from services.stats import collect_stats
+
+# Размеры таблиц при --scale 1.0
+TARGET = {"users": 200_000, "posts": 1_000_000, "join_requests": 500_000, "payments": 50_000}
+BATCH = 50_000
+CHANNEL = -1001234567890
+MODERATORS = (101, 102, 103, 104, 105)
+NOW = datetime(2026, 1, 1)
+LOREM = (
+    "Продам велосипед в хорошем состоянии, самовывоз с Киевской. Ищу попутчиков до Киева на выходные. "
+    "Потерялся кот, рыжий, отзывается на Барсик, вознаграждение гарантировано. "
+) * 8
+
+
+def weighted(rnd: random.Random, choices: tuple[tuple[str, float], ...]) -> str:
+    point = rnd.random()
+    for value, weight in choices:
+        point -= weight
+        if point < 0:
+            return value
+    return choices[-1][0]
+
+
+def skewed_user(rnd: random.Random, n_users: int) -> int:
+    # Степенное распределение: у пользователя 1 тысячи постов, у большинства — единицы
+    return 1 + int(n_users * rnd.random() ** 3)
+
+
+def some_moment(rnd: random.Random) -> datetime:
+    return NOW - timedelta(seconds=rnd.randrange(365 * 24 * 3600))
+
+
+class Seeder:
+    """Досыпает строки до нужных размеров; каждая ступень — случайная выборка одного распределения"""
+
+    def __init__(self, seed: int = 2024):
+        self.rnd = random.Random(seed)
+        self.sizes = dict.fromkeys(TARGET, 0)
+
+    async def grow(self, sizes: dict[str, int]) -> None:
+        rnd = self.rnd
+        async with engine.begin() as conn:
+            users_before = self.sizes["users"]
+            for start in range(users_before, sizes["users"], BATCH):
+                await conn.execute(insert(User), [
+                    {
+                        "user_id": user_id,
+                        "username": f"user{user_id}" if rnd.random() < 0.7 else None,
+                        "first_name": "Тест",
+                        "registration_date": some_moment(rnd),
+                        "is_banned": rnd.random() < 0.01,
+                    }
+                    for user_id in range(start + 1, min(start + BATCH, sizes["users"]) + 1)
+                ])
+            n_users = sizes["users"]
+
+            for start in range(self.sizes["posts"], sizes["posts"], BATCH):
+                rows = []
+                for _ in range(start, min(start + BATCH, sizes["posts"])):
+                    status = weighted(rnd, (("approved", 0.80), ("rejected", 0.18), ("pending", 0.02)))
+                    created_at = some_moment(rnd)
+                    rows.append({
+                        "user_id": skewed_user(rnd, n_users),
+                        "post_type": weighted(rnd, (("free", 0.85), ("ad35", 0.10), ("offtopic50", 0.05))),
+                        "content": LOREM[: rnd.randint(40, 800)],
+                        "media_file_id": f"AgAC{rnd.getrandbits(64):x}" if rnd.random() < 0.3 else None,
+                        "status": status,
+                        "created_at": created_at,
+                        "moderated_at": None if status == "pending" else created_at + timedelta(minutes=rnd.randint(1, 600)),
+                        "moderator_id": None if status == "pending" else rnd.choice(MODERATORS),
+                    })
+                await conn.execute(insert(Post), rows)
+
+            for start in range(self.sizes["join_requests"], sizes["join_requests"], BATCH):
+                rows = []
+                for _ in range(start, min(start + BATCH, sizes["join_requests"])):
+                    status = weighted(rnd, (("approved", 0.85), ("rejected", 0.14), ("pending", 0.01)))
+                    created_at = some_moment(rnd)
+                    rows.append({
+                        "user_id": 1_000_000 + rnd.randrange(10 * n_users),
+                        "chat_id": CHANNEL,
+                        "username": None,
+                        "full_name": "Заявитель",
+                        "status": status,
+                        "moderator_id": None if status == "pending" else rnd.choice(MODERATORS),
+                        "created_at": created_at,
+                        "handled_at": None if status == "pending" else created_at + timedelta(minutes=rnd.randint(1, 600)),
+                    })
+                await conn.execute(insert(ChatJoinRequest), rows)
+
+            for start in range(self.sizes["payments"], sizes["payments"], BATCH):
+                rows = []
+                for number in range(start, min(start + BATCH, sizes["payments"])):
+                    post_type = "ad35" if rnd.random() < 0.7 else "offtopic50"
+                    rows.append({
+                        "user_id": skewed_user(rnd, n_users),
+                        "post_type": post_type,
+                        "amount": 35 if post_type == "ad35" else 50,
+                        "currency": "XTR",
+                        "payment_method": "stars",
+                        "status": "completed",
+                        "transaction_id": f"seed-charge-{number}",
+                        "created_at": some_moment(rnd),
+                    })
+                await conn.execute(insert(Payment), rows)
+        async with engine.connect() as conn:
+            # Статистика планировщика SQLite, как после живой эксплуатации
+            await conn.exec_driver_sql("ANALYZE")
+        self.sizes = dict(sizes)
+
+
+async def hot_paths(sizes: dict[str, int]) -> dict:
+    """Пути обработчиков; параметры (курсор, активный пользователь) подбираются по текущим данным"""
+    async for session in get_db():
+        pending = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
+        middle = (
+            await session.execute(
+                select(Post.created_at, Post.post_id)
+                .filter(Post.status == "pending")
+                .order_by(Post.created_at.desc(), Post.post_id.desc())
+                .offset(pending // 2)
+                .limit(1)
+            )
+        ).first()
+        heavy_user, heavy_posts = (
+            await session.execute(
+                select(Post.user_id, func.count()).group_by(Post.user_id).order_by(func.count().desc()).limit(1)
+            )
+        ).one()
+    typical_user = max(sizes["users"] // 2, 1)
+    last_page = max(heavy_posts - 1, 0) // 5
+    payments = 0
+
+    async def moderation_first(session):
+        await get_pending_post_page(session)
+
+    async def moderation_deep(session):
+        await get_pending_post_page(session, (middle.created_at, middle.post_id), "next")
+
+    async def user_posts_first(session):
+        await get_user_posts_page(session, heavy_user, 0)
+
+    async def user_posts_deep(session):
+        await get_user_posts_page(session, heavy_user, last_page)
+
+    async def user_info(session):
+        # Те же запросы, что в show_user_info
+        await session.get(User, typical_user)
+        await session.scalar(select(func.count(Post.post_id)).filter(Post.user_id == typical_user))
+
+    async def stats(session):
+        await collect_stats(session)
+
+    async def pending_counts(session):
+        await PendingCounters().load()
+
+    async def ban_cache(session):
+        await BanCache().load()
+
+    async def payment(session):
+        nonlocal payments
+        payments += 1
+        await record_payment(session, 1, "user1", "Тест", "ad35", 35, "XTR", "stars", f"bench-charge-{time.monotonic_ns()}-{payments}")
+
+    return {
+        "moderation_first": moderation_first,
+        "moderation_deep": moderation_deep,
+        "user_posts_first": user_posts_first,
+        "user_posts_deep": user_posts_deep,
+        "user_info": user_info,
+        "stats": stats,
+        "pending_counts": pending_counts,
+        "ban_cache": ban_cache,
+        "record_payment": payment,
+    }
+
+
+async def time_path(path, repeats: int) -> float:
+    """Медиана времени пути в миллисекундах; первый прогон прогревает кэш страниц"""
+    timings = []
+    for attempt in range(repeats + 1):
+        started = time.perf_counter()
+        async for session in get_db():
+            await path(session)
+        if attempt:
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def query_plans(paths: dict) -> dict[str, list[str]]:
+    """Планы SQLite для SELECT-запросов каждого пути"""
+    captured: list[tuple[str, object]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    plans = {}
+    for name, path in paths.items():
+        captured.clear()
+        event.listen(engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            async for session in get_db():
+                await path(session)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", capture)
+        details = []
+        async with engine.connect() as conn:
+            for statement, parameters in captured:
+                rows = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", tuple(parameters))).all()
+                details.extend(row[-1] for row in rows if row[-1] not in details)
+        plans[name] = details
+    return plans
+
+
+def growth(first: float, last: float, rows_first: int, rows_last: int) -> float:
+    if first <= 0 or rows_first == rows_last:
+        return 0.0
+    return math.log(last / first) / math.log(rows_last / rows_first)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    await init_db()
+    seeder = Seeder()
+    steps = [float(step) for step in args.steps.split(",")]
+    report = {"scale": args.scale, "repeats": args.repeats, "steps": []}
+
+    for step in steps:
+        sizes = {table: max(int(size * args.scale * step), 1) for table, size in TARGET.items()}
+        started = time.perf_counter()
+        await seeder.grow(sizes)
+        seeded = time.perf_counter() - started
+        paths = await hot_paths(sizes)
+        timings = {name: round(await time_path(path, args.repeats), 3) for name, path in paths.items()}
+        report["steps"].append({"sizes": sizes, "seed_seconds": round(seeded, 1), "median_ms": timings})
+        print(
+            f"ступень {step:g}: постов {sizes['posts']}, пользователей {sizes['users']}, "
+            f"заявок {sizes['join_requests']}, платежей {sizes['payments']} (наполнение {seeded:.0f} с)"
+        )
+
+    first, last = report["steps"][0], report["steps"][-1]
+    header = "".join(f"{step['sizes']['posts']:>11}" for step in report["steps"])
+    print(f"\n{'путь, мс (медиана) / постов':>28}{header}{'k':>7}")
+    report["growth"] = {}
+    for name in first["median_ms"]:
+        k = growth(first["median_ms"][name], last["median_ms"][name], first["sizes"]["posts"], last["sizes"]["posts"])
+        report["growth"][name] = round(k, 2)
+        cells = "".join(f"{step['median_ms'][name]:>11.3f}" for step in report["steps"])
+        print(f"{name:>28}{cells}{k:>7.2f}")
+
+    report["plans"] = await query_plans(await hot_paths(seeder.sizes))
+    print("\nПланы запросов на последней ступени:")
+    for name, details in report["plans"].items():
+        print(f"  {name}" + ("" if details else " (только запись)"))
+        for detail in details:
+            marker = "!" if detail.startswith("SCAN") and "INDEX" not in detail else " "
+            print(f"   {marker} {detail}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультат записан в {args.output}")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--scale", type=float, default=1.0, help="доля целевых размеров таблиц")
+    parser.add_argument("--steps", default="0.1,0.25,0.5,1", help="ступени наполнения (доли от --scale)")
+    parser.add_argument("--repeats", type=int, default=20, help="замеров каждого пути на ступени")
+    parser.add_argument("--output", help="куда записать результат в JSON")
+    args = parser.parse_args()
+    # Загрузка кэшей пишет INFO на каждый вызов, а пачки наполнения — медленные запросы
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("database.db").setLevel(logging.ERROR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
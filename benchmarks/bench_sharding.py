@@ -0,0 +1,139 @@
+"""
+Масштабирование многопроцессного режима на симулированном потоке апдейтов.
+
+Фронт раскладывает апдейты по процессам (ShardRouter), процессы разбирают их в
+модели aiogram и прогоняют через Dispatcher с обработчиком, который делает то же,
+что типичный обработчик бота, кроме сети: читает и пишет FSM, собирает текст и
+клавиатуру и сериализует запрос к Bot API.
+
+Кроме общей пропускной способности печатается CPU на апдейт у фронта и у
+процессов: на машине с N ядрами потолок — min(N / CPU процесса, 1 / CPU фронта).
+
+    python -m benchmarks.bench_sharding [апдейтов] [пользователей] [процессы через запятую]
+"""
+import asyncio
+import os
+import sys
+import time
+
+import benchmarks  # noqa: F401  (фиктивное окружение)
+from aiogram import Bot, Dispatcher, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message
+
+from keyboards.user_kb import get_main_menu
+from states.states import PostStates
+from utils.sharding import ShardRouter, consume, start_workers, stop_workers
+from utils.texts import REQUEST_POST_MESSAGE
+
+BATCH = 100  # апдейтов в одном ответе getUpdates
+
+
+def simulated_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1717000000,
+            "chat": {"id": user_id, "type": "private", "first_name": "Тест", "username": f"user{user_id}"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Тест", "language_code": "ru"},
+            "text": "/send" if update_id % 2 else f"Текст поста номер {update_id} " * 5,
+        },
+    }
+
+
+def build_dispatcher() -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def handle(message: Message, state: FSMContext):
+        current = await state.get_state()
+        if current is None:
+            await state.set_state(PostStates.waiting_free_post)
+        else:
+            await state.update_data(text=message.text)
+            await state.clear()
+        # Ответ без отправки: собрать запрос к Bot API так же, как перед отправкой
+        method = message.answer(REQUEST_POST_MESSAGE, reply_markup=get_main_menu())
+        message.bot.session.build_form_data(message.bot, method)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+def bench_worker(index: int, shards: int, queue, results) -> None:
+    async def run():
+        dp = build_dispatcher()
+        bot = Bot(token="123456:TEST-token")
+        processed = 0
+
+        async def feed(update: dict):
+            nonlocal processed
+            await dp.feed_raw_update(bot, update)
+            processed += 1
+
+        results.put(("ready", index))
+        started = time.process_time()
+        await consume(queue, feed)
+        results.put(("done", index, processed, time.process_time() - started))
+        await bot.session.close()
+
+    asyncio.run(run())
+
+
+def run_case(updates: list[dict], shards: int) -> dict:
+    import multiprocessing
+
+    results = multiprocessing.get_context("spawn").Queue()
+    processes, queues = start_workers(shards, bench_worker, results)
+    # Запуск процессов (импорт aiogram и т.п.) в замер не входит
+    for _ in range(shards):
+        results.get()
+
+    router = ShardRouter(shards)
+    wall_started = time.perf_counter()
+    front_cpu = time.process_time()
+    for start in range(0, len(updates), BATCH):
+        router.dispatch(updates[start:start + BATCH], queues)
+    for q in queues:
+        q.put(None)
+    done = [results.get() for _ in range(shards)]
+    wall = time.perf_counter() - wall_started
+    # Включая поток очереди, который сериализует пачки для процессов
+    front_cpu = time.process_time() - front_cpu
+    stop_workers(processes, queues)
+
+    processed = sum(item[2] for item in done)
+    worker_cpu = sum(item[3] for item in done)
+    return {
+        "processed": processed,
+        "wall": wall,
+        "front_us": front_cpu / len(updates) * 1e6,
+        "worker_us": worker_cpu / processed * 1e6,
+        "per_shard": [item[2] for item in sorted(done, key=lambda item: item[1])],
+    }
+
+
+def main(n: int, users: int, shard_counts: list[int]) -> None:
+    updates = [simulated_update(i, 1000 + i % users) for i in range(n)]
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"{n} апдейтов от {users} пользователей, доступно ядер: {cores}")
+    for shards in shard_counts:
+        r = run_case(updates, shards)
+        assert r["processed"] == n
+        ceiling = min(shards / r["worker_us"], 1 / r["front_us"]) * 1e6
+        print(
+            f"  процессов {shards}: {r['processed'] / r['wall']:8.0f} апдейтов/с на этой машине, "
+            f"CPU фронта {r['front_us']:5.1f} мкс/апдейт, процесса {r['worker_us']:6.1f} мкс/апдейт, "
+            f"потолок на {shards} ядрах {ceiling:8.0f} апдейтов/с, по процессам {r['per_shard']}"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if args else 50000,
+        int(args[1]) if len(args) > 1 else 1000,
+        [int(x) for x in args[2].split(",")] if len(args) > 2 else [1, 2, 4, 8],
+    )
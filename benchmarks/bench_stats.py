@@ -0,0 +1,118 @@
+"""
+Экран статистики: десять отдельных COUNT против агрегатов GROUP BY и кэша снимка.
+
+    python -m benchmarks.bench_stats [размер ...]   (по умолчанию 100000 1000000 постов)
+"""
+import asyncio
+import random
+import sys
+from datetime import datetime
+
+import benchmarks  # noqa: F401  (фиктивное окружение)
+from benchmarks.common import count_queries, timer
+from sqlalchemy import delete, func, insert, select
+
+from database.db import get_db, init_db
+from database.models import ChatJoinRequest, Post, User
+from services.stats import STATUSES, StatsCache, collect_stats
+
+BATCH = 50_000
+REPEATS = 5
+
+
+async def seed(n_posts: int):
+    """Заполнить БД: n_posts постов, n/10 пользователей, n/20 заявок"""
+    rnd = random.Random(n_posts)
+    n_users = max(n_posts // 10, 1)
+    now = datetime.utcnow()
+    async for session in get_db():
+        for model in (Post, ChatJoinRequest, User):
+            await session.execute(delete(model))
+        await session.execute(
+            insert(User), [{"user_id": i, "is_banned": i % 50 == 0} for i in range(1, n_users + 1)]
+        )
+        for start in range(0, n_posts, BATCH):
+            await session.execute(
+                insert(Post),
+                [
+                    {
+                        "user_id": rnd.randint(1, n_users), "post_type": "free", "content": "x",
+                        "status": rnd.choice(STATUSES), "created_at": now,
+                    }
+                    for _ in range(start, min(start + BATCH, n_posts))
+                ],
+            )
+        await session.execute(
+            insert(ChatJoinRequest),
+            [
+                {
+                    "user_id": rnd.randint(1, n_users), "chat_id": -100, "status": rnd.choice(STATUSES),
+                    "moderator_id": rnd.randint(1, 5), "created_at": now, "handled_at": now,
+                }
+                for _ in range(max(n_posts // 20, 1))
+            ],
+        )
+
+
+async def legacy_stats():
+    """Запросы, которые делал moderator_stats_callback до агрегатов"""
+    async for session in get_db():
+        await session.scalar(select(func.count(Post.post_id)))
+        for status in STATUSES:
+            await session.scalar(select(func.count(Post.post_id)).filter(Post.status == status))
+        await session.scalar(select(func.count(User.user_id)))
+        await session.scalar(select(func.count(User.user_id)).filter(User.is_banned == True))
+        await session.scalar(select(func.count(ChatJoinRequest.id)))
+        for status in STATUSES:
+            await session.scalar(select(func.count(ChatJoinRequest.id)).filter(ChatJoinRequest.status == status))
+        # Последние заявки и активность модераторов в обоих вариантах одинаковые
+        (
+            await session.scalars(
+                select(ChatJoinRequest)
+                .filter(ChatJoinRequest.status != "pending")
+                .order_by(ChatJoinRequest.handled_at.desc())
+                .limit(5)
+            )
+        ).all()
+        (
+            await session.execute(
+                select(ChatJoinRequest.moderator_id, func.count())
+                .filter(ChatJoinRequest.status != "pending", ChatJoinRequest.moderator_id.isnot(None))
+                .group_by(ChatJoinRequest.moderator_id)
+                .order_by(func.count().desc())
+                .limit(5)
+            )
+        ).all()
+
+
+async def grouped_stats():
+    async for session in get_db():
+        await collect_stats(session)
+
+
+async def run(sizes: list[int]):
+    await init_db()
+    for n in sizes:
+        with timer() as t:
+            await seed(n)
+        print(f"\n{n:,} постов (заполнение {t.seconds:.1f} с)")
+
+        cache = StatsCache(ttl=30)
+        cases = (
+            ("legacy", legacy_stats),
+            ("grouped", grouped_stats),
+            ("cached", cache.get),
+        )
+        for name, job in cases:
+            await job()  # прогрев
+            with count_queries() as stats, timer() as t:
+                for _ in range(REPEATS):
+                    await job()
+            print(
+                f"{name:>9}: {stats.queries / REPEATS:5.1f} запросов/экран, "
+                f"{t.seconds / REPEATS * 1000:8.2f} мс/экран"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(run([int(a) for a in sys.argv[1:]] or [100_000, 1_000_000]))
@@ -0,0 +1,49 @@
+"""
+Сравнение старого и нового пути сохранения поста: запросы и commit'ы на один пост.
+
+    python -m benchmarks.bench_submission [количество_постов]
+"""
+import asyncio
+import sys
+
+import benchmarks  # noqa: F401  (фиктивное окружение)
+from benchmarks.common import count_queries, timer
+from sqlalchemy import func, select
+
+from database.db import create_post, create_submission, get_db, get_or_create_user, init_db
+from database.models import Moderator, Post
+
+
+async def legacy_submission(user_id: int):
+    """Путь, которым шли receive_* до единого конвейера"""
+    async for session in get_db():
+        await get_or_create_user(session, user_id, "bench", "Bench")
+        await create_post(session, user_id, "free", "текст поста")
+        await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
+        (await session.scalars(select(Moderator.moderator_id))).all()
+
+
+async def pipeline_submission(user_id: int):
+    """Путь единого конвейера submit_post (счётчик pending и получатели — из памяти)"""
+    async for session in get_db():
+        await create_submission(session, user_id, "bench", "Bench", "free", "текст поста")
+
+
+async def run(n: int):
+    await init_db()
+    for name, submit, first_id in (
+        ("legacy", legacy_submission, 1_000_000),
+        ("pipeline", pipeline_submission, 2_000_000),
+    ):
+        with count_queries() as stats, timer() as t:
+            # Половина постов от новых пользователей, половина — от уже известных
+            for i in range(n):
+                await submit(first_id + i // 2)
+        print(
+            f"{name:>9}: {stats.queries / n:5.2f} запросов/пост, "
+            f"{stats.commits / n:4.2f} commit/пост, {t.seconds / n * 1000:6.2f} мс/пост"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
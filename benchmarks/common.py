@@ -0,0 +1,36 @@
+"""
+Общие инструменты бенчмарков: подсчёт запросов к БД и замер времени
+"""
+import time
+from contextlib import contextmanager
+
+from database.db import QueryStats, current_queries
+
+
+@contextmanager
+def count_queries():
+    """Посчитать SQL-запросы и commit'ы, выполненные внутри блока.
+
+    Использует те же хуки движка, что и учёт запросов по обработчикам: считаются
+    запросы текущей задачи и задач, запущенных внутри блока.
+    """
+    stats = QueryStats()
+    token = current_queries.set(stats)
+    try:
+        yield stats
+    finally:
+        current_queries.reset(token)
+
+
+@contextmanager
+def timer():
+    """Замерить время выполнения блока; результат в поле `seconds`"""
+    class _Timer:
+        seconds = 0.0
+
+    t = _Timer()
+    started = time.perf_counter()
+    try:
+        yield t
+    finally:
+        t.seconds = time.perf_counter() - started
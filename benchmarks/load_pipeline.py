@@ -0,0 +1,433 @@
+"""
+Нагрузочный прогон всего конвейера апдейтов без сети.
+
+Собирается настоящий Dispatcher со всеми тремя роутерами и теми же middleware, что
+в bot.py; сессия бота подменена на OfflineSession — она отвечает на любой метод Bot
+API правдоподобным результатом, ничего не отправляя. Через диспетчер прогоняются
+синтетические потоки апдейтов:
+
+    submit_text   /send и текст поста
+    submit_media  /send и фото с подписью
+    approve       модератор одобряет посты из очереди
+    join_request  заявки на вступление в канал
+    join_approve  модератор одобряет заявки
+    payment       pre_checkout_query и successful_payment
+
+Апдейты разных пользователей обрабатываются параллельно, одного — по порядку
+(как в многопроцессном режиме). In-memory SQLite — одно общее соединение без
+изоляции транзакций, поэтому на ней апдейты идут строго по одному.
+
+Для каждого потока: апдейтов в секунду, p50/p95/p99 времени обработки апдейта,
+запросов к БД, commit'ов и запросов к Bot API на апдейт.
+Прогон повторяется на SQLite в памяти и в файле, результат пишется в JSON; с
+--compare печатается разница с прошлым прогоном.
+
+    python -m benchmarks.load_pipeline [--updates N] [--concurrency C] [--api-latency-ms MS]
+                                       [--backends memory,file] [--output load.json] [--compare old.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+import typing
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, AsyncGenerator, Callable, Dict, Optional
+
+import benchmarks  # noqa: F401  (фиктивное окружение)
+import aiogram
+import sqlalchemy
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import TelegramMethod
+from aiogram.types import Chat, Message, MessageId, Update
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+import database.db
+from config import CHANNEL_ID
+from database.db import create_db_engine, init_db
+from database.models import ChatJoinRequest, Moderator, Post
+from handlers import moderator_router, payments_router, user_router
+from middlewares.metrics import MetricsMiddleware, MetricsRegistry
+from middlewares.throttling import ThrottlingMiddleware
+from services.cache import ban_cache, moderator_roster
+from services.counters import pending_counters
+from utils.background import drain
+from utils.payload import encode_invoice_payload
+from utils.sharding import KeyedSequencer, update_owner
+
+# Модератор, от имени которого идут одобрения (добавляется в таблицу moderators)
+MODERATOR_ID = 4242
+DATE = 1717000000
+
+
+class OfflineSession(BaseSession):
+    """Сессия бота без сети: считает запросы по методам и возвращает готовый результат"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests: Counter[str] = Counter()
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.requests[method.__api_method__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._message_id += 1
+        return self._result(bot, method)
+
+    def _result(self, bot: Bot, method: TelegramMethod) -> Any:
+        returning = method.__returning__
+        if returning is bool:
+            return True
+        if returning is MessageId:
+            return MessageId(message_id=self._message_id)
+        if returning is Message:
+            chat_id = getattr(method, "chat_id", None)
+            chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else -1
+            return Message(
+                message_id=self._message_id,
+                date=datetime.now(timezone.utc),
+                chat=Chat(id=chat_id, type="private" if chat_id > 0 else "channel"),
+                text=getattr(method, "text", None),
+                caption=getattr(method, "caption", None),
+            ).as_(bot)
+        origin = typing.get_origin(returning)
+        if origin is typing.Union and bool in typing.get_args(returning):
+            return True  # editMessageText и т.п.: для inline-сообщений Telegram отвечает True
+        if origin is list:
+            return []
+        raise NotImplementedError(f"OfflineSession не знает, что вернуть на {method.__api_method__}")
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30, chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+def build_dispatcher() -> Dispatcher:
+    """Диспетчер как в bot.py; FSM в памяти, чтобы сравнивать именно обработку апдейтов"""
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(user_router)
+    dp.include_router(moderator_router)
+    dp.include_router(payments_router)
+    MetricsMiddleware(MetricsRegistry()).setup(dp)
+    ThrottlingMiddleware().setup(dp)
+    return dp
+
+
+# --- Синтетические апдейты ---
+class UpdateFactory:
+    def __init__(self):
+        self.update_id = 0
+
+    def _next(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Тест", "username": f"user{user_id}"}
+
+    def message(self, user_id: int, **content) -> dict:
+        update_id = self._next()
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": DATE,
+                "chat": {"id": user_id, "type": "private", "first_name": "Тест"},
+                "from": self._user(user_id),
+                **content,
+            },
+        }
+
+    def callback(self, user_id: int, data: str) -> dict:
+        update_id = self._next()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": "1",
+                "data": data,
+                "message": {
+                    "message_id": update_id,
+                    "date": DATE,
+                    "chat": {"id": user_id, "type": "private", "first_name": "Тест"},
+                    "text": "🆕 Новый пост на модерацию",
+                },
+            },
+        }
+
+    def join_request(self, user_id: int) -> dict:
+        return {
+            "update_id": self._next(),
+            "chat_join_request": {
+                "chat": {"id": int(CHANNEL_ID), "type": "channel", "title": "Канал"},
+                "from": self._user(user_id),
+                "user_chat_id": user_id,
+                "date": DATE,
+            },
+        }
+
+    def pre_checkout(self, user_id: int, payload: str) -> dict:
+        update_id = self._next()
+        return {
+            "update_id": update_id,
+            "pre_checkout_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "currency": "XTR",
+                "total_amount": 35,
+                "invoice_payload": payload,
+            },
+        }
+
+
+async def pending_ids(model, id_column, n: int) -> list[int]:
+    async for session in database.db.get_db():
+        return list((await session.scalars(select(id_column).filter(model.status == "pending").order_by(id_column).limit(n))).all())
+
+
+def scenarios(factory: UpdateFactory, first_user: int, n: int) -> Dict[str, Callable[[], Any]]:
+    """Потоки апдейтов; одобрения строятся по тому, что накопили предыдущие потоки"""
+
+    def submit_text():
+        updates = []
+        for i in range(n):
+            user_id = first_user + i
+            updates.append(factory.message(user_id, text="/send"))
+            updates.append(factory.message(user_id, text=f"Продам велосипед, почти новый, пользователь {user_id}. " * 3))
+        return updates
+
+    def submit_media():
+        updates = []
+        for i in range(n):
+            user_id = first_user + n + i
+            photo = [
+                {"file_id": f"photo-{user_id}-s", "file_unique_id": f"s{user_id}", "width": 90, "height": 90},
+                {"file_id": f"photo-{user_id}", "file_unique_id": f"p{user_id}", "width": 1280, "height": 960},
+            ]
+            updates.append(factory.message(user_id, text="/send"))
+            updates.append(factory.message(user_id, photo=photo, caption=f"Нашёл ключи у остановки, пользователь {user_id}"))
+        return updates
+
+    async def approve():
+        return [factory.callback(MODERATOR_ID, f"approve_{post_id}") for post_id in await pending_ids(Post, Post.post_id, n)]
+
+    def join_request():
+        return [factory.join_request(first_user + 2 * n + i) for i in range(n)]
+
+    async def join_approve():
+        request_ids = await pending_ids(ChatJoinRequest, ChatJoinRequest.id, n)
+        return [factory.callback(MODERATOR_ID, f"joinreq_approve_{request_id}") for request_id in request_ids]
+
+    def payment():
+        updates = []
+        for i in range(n):
+            user_id = first_user + 3 * n + i
+            payload = encode_invoice_payload("ad35", user_id, 35, DATE)
+            updates.append(factory.pre_checkout(user_id, payload))
+            updates.append(factory.message(user_id, successful_payment={
+                "currency": "XTR",
+                "total_amount": 35,
+                "invoice_payload": payload,
+                "telegram_payment_charge_id": f"bench-charge-{user_id}",
+                "provider_payment_charge_id": "",
+            }))
+        return updates
+
+    return {
+        "submit_text": submit_text,
+        "submit_media": submit_media,
+        "approve": approve,
+        "join_request": join_request,
+        "join_approve": join_approve,
+        "payment": payment,
+    }
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run_stream(dp: Dispatcher, bot: Bot, raw_updates: list[dict], concurrency: int, db_stats: Counter) -> dict:
+    """Прогнать поток через диспетчер и вернуть его показатели"""
+    session: OfflineSession = bot.session
+    updates = [Update.model_validate(raw, context={"bot": bot}) for raw in raw_updates]
+    latencies: list[float] = []
+
+    async def feed(update: Update):
+        started = time.perf_counter()
+        await dp.feed_update(bot, update)
+        latencies.append(time.perf_counter() - started)
+
+    db_before, api_before = db_stats.copy(), sum(session.requests.values())
+    sequencer = KeyedSequencer(concurrency)
+    started = time.perf_counter()
+    for raw, update in zip(raw_updates, updates):
+        await sequencer.submit(update_owner(raw) or update.update_id, feed(update))
+    await sequencer.drain()
+    # Рассылка постов модераторам идёт в фоне — тоже часть работы потока
+    await drain()
+    elapsed = time.perf_counter() - started
+
+    n = len(updates) or 1
+    latencies.sort()
+    return {
+        "updates": len(updates),
+        "errors": len(updates) - len(latencies),
+        "seconds": round(elapsed, 4),
+        "updates_per_sec": round(len(updates) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "queries_per_update": round((db_stats["statements"] - db_before["statements"]) / n, 2),
+        "commits_per_update": round((db_stats["commits"] - db_before["commits"]) / n, 2),
+        "api_requests_per_update": round((sum(session.requests.values()) - api_before) / n, 2),
+    }
+
+
+async def run_backend(dp: Dispatcher, bot: Bot, url: str, first_user: int, n: int, concurrency: int) -> dict:
+    """Все потоки на одной БД: движок и фабрика сессий database.db подменяются на время прогона"""
+    db_engine = create_db_engine(url)
+    database.db.engine = db_engine
+    database.db.async_session_maker = async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+    db_stats: Counter = Counter()
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        db_stats["statements"] += 1
+
+    def on_commit(conn):
+        db_stats["commits"] += 1
+
+    await init_db()
+    async for session in database.db.get_db():
+        session.add(Moderator(moderator_id=MODERATOR_ID, username="bench_moderator"))
+    await moderator_roster.load()
+    await ban_cache.load()
+    await pending_counters.load()
+
+    event.listen(db_engine.sync_engine, "before_cursor_execute", on_execute)
+    event.listen(db_engine.sync_engine, "commit", on_commit)
+    results = {}
+    try:
+        for name, build in scenarios(UpdateFactory(), first_user, n).items():
+            raw_updates = build()
+            if asyncio.iscoroutine(raw_updates):
+                raw_updates = await raw_updates
+            results[name] = await run_stream(dp, bot, raw_updates, concurrency, db_stats)
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", on_execute)
+        event.remove(db_engine.sync_engine, "commit", on_commit)
+        await db_engine.dispose()
+
+    total_updates = sum(r["updates"] for r in results.values())
+    total_seconds = sum(r["seconds"] for r in results.values())
+    results["total"] = {
+        "updates": total_updates,
+        "errors": sum(r["errors"] for r in results.values()),
+        "seconds": round(total_seconds, 4),
+        "updates_per_sec": round(total_updates / total_seconds, 1) if total_seconds else 0.0,
+        **{
+            key: round(sum(r[key] * r["updates"] for r in results.values()) / (total_updates or 1), 2)
+            for key in ("queries_per_update", "commits_per_update", "api_requests_per_update")
+        },
+    }
+    return results
+
+
+def print_results(backend: str, results: dict) -> None:
+    print(f"\n{backend}, апдейтов в обработке одновременно: {results.pop('concurrency')}")
+    print(f"{'поток':>13} {'апдейтов':>8} {'апд/с':>8} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8} {'запр/апд':>9} {'commit/апд':>10} {'API/апд':>8}")
+    for name, r in results.items():
+        # У строки total перцентилей нет: потоки слишком разные, чтобы их смешивать
+        latency = " ".join(f"{r[key]:>8.2f}" if key in r else f"{'—':>8}" for key in ("p50_ms", "p95_ms", "p99_ms"))
+        print(
+            f"{name:>13} {r['updates']:>8} {r['updates_per_sec']:>8.0f} {latency} "
+            f"{r['queries_per_update']:>9.2f} {r['commits_per_update']:>10.2f} {r['api_requests_per_update']:>8.2f}"
+        )
+    if results["total"]["errors"]:
+        print(f"ошибок обработки: {results['total']['errors']}")
+
+
+def print_comparison(previous: dict, current: dict) -> None:
+    """Разница с прошлым прогоном по пропускной способности и p95"""
+    print(f"\nСравнение с прогоном {previous.get('started_at')}")
+    for backend, results in current["backends"].items():
+        old_results = previous.get("backends", {}).get(backend, {})
+        for name, r in results.items():
+            old = old_results.get(name)
+            if not isinstance(r, dict) or not old:
+                continue
+            line = [f"{backend:>6} {name:>13}"]
+            for key in ("updates_per_sec", "p95_ms", "queries_per_update"):
+                if key in r and old.get(key):
+                    line.append(f"{key} {old[key]} → {r[key]} ({(r[key] - old[key]) / old[key] * 100:+.1f}%)")
+            print("  ".join(line))
+
+
+async def run(args: argparse.Namespace) -> dict:
+    bot = Bot(token="123456:BENCH-token", session=OfflineSession(args.api_latency_ms / 1000))
+    dp = build_dispatcher()
+    urls = {
+        "memory": "sqlite+aiosqlite:///:memory:",
+        "file": f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='tsobot-load-'), 'load.db')}",
+    }
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "aiogram": aiogram.__version__,
+        "sqlalchemy": sqlalchemy.__version__,
+        "cpu_count": os.cpu_count(),
+        "updates_per_stream": args.updates,
+        "api_latency_ms": args.api_latency_ms,
+        "backends": {},
+    }
+    for index, backend in enumerate(args.backends.split(",")):
+        concurrency = 1 if backend == "memory" else args.concurrency
+        # У каждой БД свои пользователи: счётчики антифлуда с прошлого прогона не мешают
+        results = await run_backend(dp, bot, urls[backend], 10_000_000 * (index + 1), args.updates, concurrency)
+        report["backends"][backend] = {"concurrency": concurrency, **results}
+        print_results(backend, dict(report["backends"][backend]))
+    await bot.session.close()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--updates", type=int, default=500, help="событий в каждом потоке")
+    parser.add_argument("--concurrency", type=int, default=20, help="апдейтов в обработке одновременно")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="задержка ответа Bot API")
+    parser.add_argument("--backends", default="memory,file")
+    parser.add_argument("--output", default="load_pipeline.json", help="куда записать результат")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    # Обработчики пишут INFO на каждый платёж и заявку — в замер это не должно входить
+    logging.basicConfig(level=logging.WARNING)
+    # Медленные запросы и апдейты под конкурентной записью видны в p95/p99; построчно они заслоняют таблицу
+    logging.getLogger("database.db").setLevel(logging.ERROR)
+    logging.getLogger("middlewares.metrics").setLevel(logging.ERROR)
+    report = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультат записан в {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Память FSM под потоком брошенных сессий: MemoryStorage против BoundedMemoryStorage.
+
+Каждая сессия — пользователь выбрал тип поста и ушёл, не прислав текст
+(set_state + update_data). Время симулируется: 20 новых сессий в секунду.
+Каждые N сессий печатаются число живых ключей, оценка объёма и RSS процесса.
+
+    python -m benchmarks.soak_fsm [сессий] [ttl] [max_keys]
+"""
+import asyncio
+import resource
+import sys
+
+import benchmarks  # noqa: F401  (фиктивное окружение)
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from states.states import PostStates
+from states.storage import BoundedMemoryStorage
+
+SESSIONS_PER_SECOND = 20
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() / 2**20
+
+
+async def soak(name: str, storage, clock: SimulatedClock, sessions: int, report_every: int):
+    print(f"--- {name}")
+    bounded = isinstance(storage, BoundedMemoryStorage)
+    next_sweep = storage.sweep_interval if bounded else None
+    for user_id in range(1, sessions + 1):
+        key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        await storage.set_state(key, PostStates.waiting_ad_post)
+        await storage.update_data(key, {"post_type": "ad35"})
+        clock.now += 1 / SESSIONS_PER_SECOND
+        if bounded and clock.now >= next_sweep:
+            # Фоновая очистка спит по реальному времени, поэтому по симулированному зовём её сами
+            storage.sweep()
+            next_sweep += storage.sweep_interval
+        if user_id % report_every == 0:
+            if bounded:
+                s = storage.snapshot()
+                extra = f"~{s['approx_bytes'] / 2**20:6.1f} МБ, истекло {s['expired']}, вытеснено {s['evicted']}"
+                live = s["live_keys"]
+            else:
+                live, extra = len(storage.storage), ""
+            print(f"{user_id:>9} сессий: живых ключей {live:>8}, RSS {rss_mb():7.1f} МБ {extra}")
+    await storage.close()
+
+
+async def run(sessions: int, ttl: float, max_keys: int):
+    # Ограниченное хранилище первым: RSS процесса после MemoryStorage уже не опустится
+    clock = SimulatedClock()
+    bounded = BoundedMemoryStorage(ttl=ttl, max_keys=max_keys, sweep_interval=60, clock=clock)
+    await soak(f"bounded (ttl={ttl:.0f} с, max_keys={max_keys})", bounded, clock, sessions, sessions // 8)
+    await soak("memory", MemoryStorage(), SimulatedClock(), sessions, sessions // 8)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(
+        run(
+            int(args[0]) if args else 2_000_000,
+            float(args[1]) if len(args) > 1 else 3600.0,
+            int(args[2]) if len(args) > 2 else 100_000,
+        )
+    )
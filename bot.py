@@ -3,18 +3,36 @@
 """
 import asyncio
 import logging
+import signal
 import sys
+from typing import Optional
 
 import aiohttp
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand
 
 from config import settings, MODERATOR_IDS
 from sqlalchemy import select, func
 from database.models import Moderator
-from database.db import init_db
+from database.db import checkpoint_wal, database_url, init_db, is_sqlite
 from handlers import moderator_router, payments_router, user_router
+from middlewares import api_metrics, metrics, metrics_middleware, rate_limiter, throttling_middleware
+from services.cache import ban_cache, moderator_roster
+from services.counters import pending_counters
+from services.mass_approval import mass_approval
+from services.publisher import publisher
+from services.scheduler import scheduler
+from states.storage import create_storage
+from utils.background import drain, spawn_periodic
+from utils.sharding import (
+    ShardRouter,
+    build_front_webhook_app,
+    consume,
+    poll_updates,
+    start_workers,
+    stop_workers,
+)
+from utils.webhook import run_webhook, serve_webhook, start_metrics_server, wait_for_stop_signal
 
 # Настройка логирования
 # Для Railway логи идут в stdout, файл не нужен
@@ -41,7 +59,25 @@ logger = logging.getLogger(__name__)
 
 # Создаем бота и диспетчер
 bot = Bot(token=settings.BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+# Все исходящие запросы проходят через общий лимитер (защита от 429 Flood control)
+bot.session.middleware(rate_limiter)
+# Время и статус запросов к Bot API; после лимитера, чтобы не считать ожидание в его очереди
+bot.session.middleware(api_metrics)
+# Состояния FSM хранятся в БД (FSM_STORAGE), чтобы пережить перезапуск
+dp = Dispatcher(storage=create_storage())
+dp.include_router(user_router)
+dp.include_router(moderator_router)
+dp.include_router(payments_router)
+# Метрики апдейтов по обработчикам и счётчики сервисов для GET /metrics
+metrics_middleware.setup(dp)
+# Антифлуд: лимиты на пользователя до фильтров и обработчиков (после метрик — отброшенное тоже считается)
+throttling_middleware.setup(dp)
+metrics.register_snapshot("ratelimit", rate_limiter.snapshot)
+metrics.register_snapshot("pending", pending_counters.snapshot)
+metrics.register_snapshot("ban_cache", ban_cache.snapshot)
+metrics.register_snapshot("throttling", throttling_middleware.snapshot)
+if hasattr(dp.storage, "snapshot"):
+    metrics.register_snapshot("fsm", dp.storage.snapshot)
 
 # URL для авто-пинга (чтобы бот не засыпал)
 PING_URL = "https://self-ping-guardian.vercel.app/health"
@@ -82,11 +118,14 @@ async def ping_keepalive():
             await asyncio.sleep(PING_INTERVAL)
 
 
-async def main():
-    """Главная функция"""
-    logger.info("Запуск бота...")
+async def startup(primary: bool = True) -> Optional[list[asyncio.Task]]:
+    """Подготовить процесс к обработке апдейтов; None — БД недоступна.
 
-    if not MODERATOR_IDS:
+    primary=False — дополнительный процесс многопроцессного режима: он только
+    обрабатывает апдейты, а публикацию, планировщик и обслуживание БД оставляет
+    процессу 0. Возвращает периодические задачи для shutdown().
+    """
+    if primary and not MODERATOR_IDS:
         logger.warning("Список модераторов пуст (MODERATORS не настроен). Владелец(и) будут уведомлены о проблемах с доставкой постов.")
     
     # Инициализация БД (путь к БД настраивается в database/db.py)
@@ -95,7 +134,26 @@ async def main():
         logger.info("База данных инициализирована")
     except Exception as e:
         logger.error(f"Ошибка инициализации БД: {e}")
-        return
+        return None
+
+    # Кэш банов и состава модерации: горячие проверки прав больше не ходят в БД
+    await ban_cache.load()
+    await moderator_roster.load()
+    await pending_counters.load()
+
+    # Периодическая сверка кэшей и счётчиков с БД. При WORKERS > 1 счётчики и так
+    # перечитываются из БД перед показом (их меняют все процессы), сверять нечего
+    periodic_tasks = []
+    if not pending_counters.shared:
+        periodic_tasks.append(spawn_periodic(settings.RECONCILE_INTERVAL, pending_counters.reconcile, "reconcile_counters"))
+    if not primary:
+        # Баны и модераторов меняют в процессе 0; здесь узнаём об этом из БД
+        periodic_tasks += [
+            spawn_periodic(settings.SHARD_SYNC_INTERVAL, ban_cache.verify, "reconcile_bans"),
+            spawn_periodic(settings.SHARD_SYNC_INTERVAL, moderator_roster.load, "reload_roster"),
+        ]
+        return periodic_tasks
+    periodic_tasks.append(spawn_periodic(settings.RECONCILE_INTERVAL, ban_cache.verify, "reconcile_bans"))
 
     # Проверим есть ли в БД добавленные модераторы (если в env не заданы модераторы)
     if not MODERATOR_IDS:
@@ -107,29 +165,134 @@ async def main():
             else:
                 logger.info(f"Найдено {db_count} модераторов в базе данных; они будут получать уведомления о постах.")
     
-    # Регистрация роутеров
-    dp.include_router(user_router)
-    dp.include_router(moderator_router)
-    dp.include_router(payments_router)
-    
     # Установка команд
     await set_bot_commands()
     
-    # Запуск фоновой задачи для keepalive пинга
-    ping_task = asyncio.create_task(ping_keepalive())
-    logger.info(f"Авто-пингер запущен (интервал: {PING_INTERVAL} сек)")
-    
-    # Запуск polling
+    # Воркеры публикации постов из outbox и планировщик слотов, который их будит
+    await publisher.start(bot)
+    await scheduler.start(publisher.notify)
+
+    # WAL растёт, пока его не перенесут в основной файл; делаем это по расписанию
+    if is_sqlite(database_url) and settings.SQLITE_WAL:
+        periodic_tasks.append(spawn_periodic(settings.SQLITE_CHECKPOINT_INTERVAL, checkpoint_wal, "wal_checkpoint"))
+    return periodic_tasks
+
+
+async def shutdown(periodic_tasks: list[asyncio.Task]) -> None:
+    """Остановить фоновые задачи и сохранить состояние процесса"""
+    for task in periodic_tasks:
+        task.cancel()
+    # Массовое одобрение останавливаем после текущей пачки (её транзакция завершится)
+    mass_approval.cancel()
+    await scheduler.stop()
+    await publisher.stop()
+    # Даём фоновым рассылкам завершиться
+    await drain(timeout=15)
+    logger.info(f"Статистика лимитера Bot API: {rate_limiter.snapshot()}")
+    # Диспетчер уже закрыл хранилище; сохраняем то, что фоновые задачи записали после этого
+    await dp.storage.close()
+    await bot.session.close()
+
+
+async def main():
+    """Главная функция"""
+    logger.info("Запуск бота...")
+    if settings.WORKERS > 1:
+        await run_sharded()
+        return
+
+    periodic_tasks = await startup()
+    if periodic_tasks is None:
+        return
+
+    ping_task = None
+    metrics_runner = None
     logger.info("Бот запущен и готов к работе!")
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if settings.WEBHOOK_URL:
+            # Апдейты приходят сами; входящие запросы Telegram не дают хостингу уснуть
+            await run_webhook(dp, bot)
+        else:
+            # Запуск фоновой задачи для keepalive пинга
+            ping_task = asyncio.create_task(ping_keepalive())
+            logger.info(f"Авто-пингер запущен (интервал: {PING_INTERVAL} сек)")
+            if settings.METRICS_PORT:
+                metrics_runner = await start_metrics_server(settings.METRICS_PORT)
+
+            # Если раньше был установлен webhook, getUpdates вернёт конфликт — снимаем его
+            await bot.delete_webhook()
+            # Запуск polling
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
         # Отменяем задачу пинга при остановке
-        ping_task.cancel()
-        try:
-            await ping_task
-        except asyncio.CancelledError:
-            logger.info("Авто-пингер остановлен")
+        if ping_task is not None:
+            ping_task.cancel()
+            try:
+                await ping_task
+            except asyncio.CancelledError:
+                logger.info("Авто-пингер остановлен")
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await shutdown(periodic_tasks)
+
+
+async def run_sharded():
+    """Фронт-процесс многопроцессного режима: принимает апдейты и раздаёт их WORKERS процессам"""
+    # Схему создаём здесь, до запуска процессов, чтобы они не делали это наперегонки
+    try:
+        await init_db()
+    except Exception as e:
+        logger.error(f"Ошибка инициализации БД: {e}")
+        return
+    await moderator_roster.load()
+    # Апдейты модераторов — в процесс 0, где работают публикация и массовое одобрение
+    router = ShardRouter(settings.WORKERS, pinned=moderator_roster.is_moderator)
+    processes, queues = start_workers(settings.WORKERS, run_shard)
+    roster_task = spawn_periodic(settings.SHARD_SYNC_INTERVAL, moderator_roster.load, "reload_roster")
+    allowed_updates = dp.resolve_used_update_types()
+
+    logger.info(f"Фронт-процесс запущен, процессов-обработчиков: {settings.WORKERS}")
+    try:
+        if settings.WEBHOOK_URL:
+            app = build_front_webhook_app(router, queues, settings.WEBHOOK_PATH, settings.WEBHOOK_SECRET or None)
+            await serve_webhook(app, bot, allowed_updates)
+        else:
+            ping_task = asyncio.create_task(ping_keepalive())
+            await bot.delete_webhook()
+            poll_task = asyncio.create_task(poll_updates(bot, router, queues, allowed_updates))
+            try:
+                await wait_for_stop_signal()
+            finally:
+                poll_task.cancel()
+                ping_task.cancel()
+    finally:
+        roster_task.cancel()
+        logger.info(f"Распределение апдейтов по процессам: {router.snapshot()}")
+        # Процессы дорабатывают уже полученные апдейты и завершаются
+        await asyncio.get_running_loop().run_in_executor(None, stop_workers, processes, queues)
+        await bot.session.close()
+
+
+def run_shard(index: int, shards: int, queue) -> None:
+    """Процесс-обработчик (точка входа multiprocessing)"""
+    # Ctrl+C получает вся группа процессов; останавливает нас фронт через очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(shard_main(index, shards, queue))
+
+
+async def shard_main(index: int, shards: int, queue) -> None:
+    periodic_tasks = await startup(primary=index == 0)
+    if periodic_tasks is None:
+        return
+    # У каждого процесса свои метрики: порт METRICS_PORT + 1 + номер процесса
+    metrics_runner = await start_metrics_server(settings.METRICS_PORT + 1 + index) if settings.METRICS_PORT else None
+    logger.info(f"Процесс {index + 1}/{shards} готов к работе")
+    try:
+        await consume(queue, lambda update: dp.feed_raw_update(bot, update))
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await shutdown(periodic_tasks)
 
 
 if __name__ == "__main__":
@@ -14,15 +14,94 @@ class Settings(BaseSettings):
     # Для Railway с volume используем /data/bot.db
     # Для локальной разработки используем ./bot.db
     DATABASE_URL: str = "sqlite+aiosqlite:///./bot.db"
-    
+
+    # Профиль SQLite (применяется к каждому новому соединению с файловой БД)
+    SQLITE_WAL: bool = True  # WAL-журнал + synchronous=NORMAL
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # Сколько ждать блокировку записи, прежде чем вернуть "database is locked"
+    SQLITE_CACHE_SIZE_KB: int = 65536  # Кэш страниц на соединение
+    SQLITE_MMAP_SIZE: int = 268435456  # Отображение файла БД в память (байты)
+    SQLITE_POOL_SIZE: int = 5  # Соединений aiosqlite (каждое — отдельный поток)
+    SQLITE_CHECKPOINT_INTERVAL: int = 300  # Как часто переносить WAL в основной файл (секунды)
+
+    # Пул соединений для Postgres и других серверных БД
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0  # Сколько ждать свободное соединение (секунды)
+    DB_POOL_RECYCLE: int = 1800  # Переоткрывать соединения старше N секунд
+
+    # Журнал медленных запросов и апдейтов
+    SLOW_QUERY_MS: float = 100.0  # Запросы к БД дольше N мс пишутся в лог с формой параметров
+    SLOW_UPDATE_MS: float = 1000.0  # Апдейты дольше N мс пишутся в лог со сводкой запросов к БД
+
     # Канал для публикации постов
     CHANNEL_ID: str
     
+    # Webhook: если задан WEBHOOK_URL, бот принимает апдейты на веб-сервере вместо polling
+    WEBHOOK_URL: Optional[str] = None  # Публичный адрес бота, например https://bot.example.com
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: Optional[str] = None  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+    WEBAPP_HOST: str = "0.0.0.0"
+    WEBAPP_PORT: int = 8080
+    # Порт для GET /metrics в режиме polling (в режиме webhook /metrics есть на WEBAPP_PORT)
+    METRICS_PORT: Optional[int] = None
+
+    # Многопроцессный режим: WORKERS > 1 — фронт-процесс раздаёт апдейты WORKERS процессам
+    WORKERS: int = 1
+    SHARD_SYNC_INTERVAL: int = 30  # Как часто процессы перечитывают баны и состав модерации (секунды)
+
     # Модераторы (через запятую, user_id)
     MODERATORS: str = ""
     # Владельцы бота (через запятую, user_id). По умолчанию добавлен один владелец (ID указан по запросу).
     OWNERS: str = "1716175980"
-    
+
+    # Рассылка новых постов модераторам
+    FANOUT_CONCURRENCY: int = 8  # Сколько отправок идёт одновременно
+    FANOUT_TIMEOUT: float = 10.0  # Таймаут на одного получателя (секунды)
+
+    # Ограничение частоты запросов к Bot API
+    RATE_LIMIT_GLOBAL: float = 25.0  # Сообщений в секунду суммарно
+    RATE_LIMIT_PRIVATE: float = 1.0  # Сообщений в секунду в личный чат
+    RATE_LIMIT_GROUP_PER_MINUTE: float = 20.0  # Сообщений в минуту в группу/канал
+    RATE_LIMIT_MAX_RETRIES: int = 3  # Повторов после ответа 429 (retry_after)
+
+    # Защита от флуда входящими апдейтами: "N/S" — не больше N событий за S секунд
+    # от одного пользователя (пусто — без ограничения). Модераторы и владельцы не ограничиваются
+    THROTTLE_COMMANDS: str = "5/10"  # Команды (/start, /send, ...)
+    THROTTLE_BUTTONS: str = "5/10"  # Кнопки reply-клавиатуры
+    THROTTLE_CALLBACKS: str = "10/10"  # Inline-кнопки
+    THROTTLE_MESSAGES: str = "30/60"  # Остальные сообщения (тексты и медиа постов)
+    THROTTLE_WARN: bool = True  # Один раз за эпизод флуда предупредить пользователя
+    THROTTLE_MAX_KEYS: int = 100000  # Сколько счётчиков держать в памяти максимум
+
+    # Публикация в канал через outbox
+    PUBLISHER_WORKERS: int = 2  # Количество воркеров публикации
+    PUBLISHER_MAX_ATTEMPTS: int = 5  # Попыток публикации до статуса 'failed'
+    PUBLISHER_RETRY_BASE: float = 5.0  # Базовая задержка между попытками (секунды)
+
+    # Расписание публикаций в канал
+    PUBLISH_INTERVAL_MINUTES: float = 5  # Минимальный интервал между постами в канале (0 — без каденции)
+    QUIET_HOURS: str = ""  # Тихие часы без публикаций, например "23:00-08:00"
+    PUBLISH_TIMEZONE: str = "Europe/Kyiv"  # Часовой пояс для тихих часов
+
+    # Хранилище FSM: "sql" — в БД бота (переживает перезапуск), "memory" — в памяти процесса,
+    # "bounded" — в памяти с TTL и ограничением числа ключей
+    FSM_STORAGE: str = "sql"
+    FSM_FLUSH_INTERVAL: float = 1.0  # Как часто сбрасывать изменения состояний в БД (секунды)
+    FSM_CACHE_SIZE: int = 10000  # Сколько ключей держать в кэше процесса
+    FSM_TTL: float = 86400.0  # Через сколько секунд без обращений забывать состояние ("bounded")
+    FSM_MAX_KEYS: int = 100000  # Сколько ключей держать в памяти максимум ("bounded")
+    FSM_SWEEP_INTERVAL: float = 60.0  # Как часто удалять истёкшие ключи ("bounded")
+
+    # Массовое одобрение
+    MASS_APPROVAL_BATCH: int = 100  # Постов в одной транзакции
+    MASS_APPROVAL_PROGRESS_INTERVAL: float = 2.0  # Как часто обновлять сообщение с прогрессом (секунды)
+
+    # Сколько секунд показывать один и тот же снимок статистики модераторам
+    STATS_CACHE_TTL: float = 30.0
+
+    # Как часто сверять кэши и счётчики в памяти с БД (секунды)
+    RECONCILE_INTERVAL: int = 600
+
     # Smart Glocal (для оплаты картой через Telegram)
     PROVIDER_TOKEN: Optional[str] = None  # Токен провайдера от Smart Glocal Bot
     
@@ -1,5 +1,5 @@
 from .db import get_db, init_db
-from .models import User, Post, Payment, Moderator
+from .models import User, Post, Payment, Moderator, Outbox, FSMRecord
 
-__all__ = ["get_db", "init_db", "User", "Post", "Payment", "Moderator"]
+__all__ = ["get_db", "init_db", "User", "Post", "Payment", "Moderator", "Outbox", "FSMRecord"]
 
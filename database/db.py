@@ -1,18 +1,29 @@
 """
 Подключение к базе данных и инициализация
 """
+import logging
 import os
-from typing import AsyncGenerator
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import AsyncGenerator, Optional
 
+from sqlalchemy import and_, event, func, inspect, make_url, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from config import settings
-from database.models import Base, User, Post, Payment, Moderator
+from config import CHANNEL_ID, settings
+from database.migrations import run_migrations
+from database.models import Base, User, Post, Payment, Moderator, Outbox
+
+logger = logging.getLogger(__name__)
 
 
 # Функция для получения правильного DATABASE_URL
@@ -26,13 +37,133 @@ def get_database_url() -> str:
     return settings.DATABASE_URL
 
 
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+
+def engine_options(url: str) -> dict:
+    """Параметры пула под тип БД"""
+    if is_sqlite(url):
+        if _is_memory_sqlite(url):
+            # In-memory БД живёт в единственном соединении (StaticPool), пул не настраиваем
+            return {}
+        # По умолчанию aiosqlite работает без пула (NullPool): каждая сессия открывает файл
+        # и поток заново. Пишет в SQLite всегда один, поэтому большой пул не нужен —
+        # несколько соединений для параллельного чтения (WAL) и без переполнения
+        return {
+            "poolclass": AsyncAdaptedQueuePool,
+            "pool_size": settings.SQLITE_POOL_SIZE,
+            "max_overflow": 0,
+            "pool_timeout": settings.DB_POOL_TIMEOUT,
+            "connect_args": {"timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000},
+        }
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        # Соединения, оборванные сервером или прокси, проверяются перед выдачей из пула
+        "pool_pre_ping": True,
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Профиль SQLite для продакшена: WAL, synchronous=NORMAL, таймаут блокировки, кэш и mmap"""
+    cursor = dbapi_connection.cursor()
+    try:
+        if settings.SQLITE_WAL:
+            # В WAL читатели не блокируют писателя, а commit не делает полный fsync
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA journal_size_limit=67108864")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+class QueryStats:
+    """Число запросов к БД, время в них и число commit'ов за один апдейт"""
+
+    __slots__ = ("queries", "seconds", "commits")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.commits = 0
+
+
+# Счётчик запросов текущего апдейта (ставит MetricsMiddleware). Задачи, запущенные
+# из обработчика, наследуют контекст, и их запросы тоже засчитываются обработчику
+current_queries: ContextVar[Optional[QueryStats]] = ContextVar("current_queries", default=None)
+
+
+def _value_shape(value) -> str:
+    if value is None:
+        return "None"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def parameter_shape(parameters, executemany: bool = False) -> str:
+    """Форма параметров запроса: типы и длины без самих значений (тексты постов в лог не попадают)"""
+    if executemany:
+        rows = list(parameters)
+        return f"{len(rows)} × {parameter_shape(rows[0])}" if rows else "[]"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {_value_shape(value)}" for key, value in parameters.items()) + "}"
+    return "(" + ", ".join(_value_shape(value) for value in parameters or ()) + ")"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    """Засчитать запрос текущему апдейту и записать в лог, если он медленный"""
+    elapsed = time.perf_counter() - context._query_started
+    stats = current_queries.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+    if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        logger.warning(
+            f"Медленный запрос ({elapsed * 1000:.1f} мс): {' '.join(statement.split())} "
+            f"| параметры: {parameter_shape(parameters, executemany)}"
+        )
+
+
+def _on_commit(conn) -> None:
+    stats = current_queries.get()
+    if stats is not None:
+        stats.commits += 1
+
+
+def create_db_engine(url: str, tuned: bool = True) -> AsyncEngine:
+    """Создать движок; tuned=False — настройки по умолчанию (для сравнения в бенчмарках)"""
+    if not tuned:
+        db_engine = create_async_engine(url, echo=False, future=True)
+    else:
+        db_engine = create_async_engine(url, echo=False, future=True, **engine_options(url))
+        if is_sqlite(url):
+            event.listen(db_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    # Время каждого запроса: журнал медленных и учёт по обработчикам
+    event.listen(db_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(db_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(db_engine.sync_engine, "commit", _on_commit)
+    return db_engine
+
+
 # Создаем движок БД
 database_url = get_database_url()
-engine = create_async_engine(
-    database_url,
-    echo=False,
-    future=True,
-)
+engine = create_db_engine(database_url)
 
 # Создаем фабрику сессий
 async_session_maker = async_sessionmaker(
@@ -46,6 +177,16 @@ async def init_db() -> None:
     """Инициализация базы данных (создание таблиц)"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # Изменения существующих таблиц (колонки, индексы) — через версионированные миграции
+        await conn.run_sync(run_migrations)
+
+
+async def checkpoint_wal() -> None:
+    """Перенести WAL в основной файл БД (PASSIVE — не блокирует читателей и писателя)"""
+    async with engine.connect() as conn:
+        busy, wal_pages, moved_pages = (await conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)")).one()
+    if busy or moved_pages < wal_pages:
+        logger.info(f"Checkpoint WAL неполный: перенесено {moved_pages} из {wal_pages} страниц")
 
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
@@ -83,6 +224,9 @@ async def create_post(
     post_type: str,
     content: str,
     media_file_id: str = None,
+    media_kind: str = None,
+    source_chat_id: int = None,
+    source_message_id: int = None,
 ) -> Post:
     """Создать пост"""
     post = Post(
@@ -90,6 +234,9 @@ async def create_post(
         post_type=post_type,
         content=content,
         media_file_id=media_file_id,
+        media_kind=media_kind,
+        source_chat_id=source_chat_id,
+        source_message_id=source_message_id,
         status="pending",
     )
     session.add(post)
@@ -98,27 +245,186 @@ async def create_post(
     return post
 
 
-async def create_payment(
+async def create_submission(
     session: AsyncSession,
     user_id: int,
+    username: str | None,
+    first_name: str | None,
     post_type: str,
-    amount: float,
-    currency: str,
-    payment_method: str,
-    transaction_id: str = None,
-) -> Payment:
-    """Создать платеж"""
-    payment = Payment(
+    content: str,
+    media_file_id: str = None,
+    media_kind: str = None,
+    source_chat_id: int = None,
+    source_message_id: int = None,
+) -> tuple[User, Post | None]:
+    """Создать пользователя (если нужно) и пост одной транзакцией.
+
+    В отличие от пары get_or_create_user + create_post, здесь нет промежуточных
+    commit/refresh: всё сбрасывается одним flush, а фиксирует транзакцию вызывающий
+    (get_db). Для забаненного пользователя пост не создаётся и возвращается None.
+    source_chat_id/source_message_id — сообщение автора, копия которого уйдёт в канал.
+    """
+    user = await session.get(User, user_id)
+    if not user:
+        user = User(
+            user_id=user_id,
+            username=username,
+            first_name=first_name,
+            registration_date=datetime.utcnow(),
+            is_banned=False,
+        )
+        session.add(user)
+    elif user.is_banned:
+        return user, None
+
+    post = Post(
         user_id=user_id,
         post_type=post_type,
-        amount=amount,
-        currency=currency,
-        payment_method=payment_method,
-        transaction_id=transaction_id,
+        content=content,
+        media_file_id=media_file_id,
+        media_kind=media_kind,
+        source_chat_id=source_chat_id,
+        source_message_id=source_message_id,
         status="pending",
+        created_at=datetime.utcnow(),
+    )
+    session.add(post)
+    await session.flush()
+    return user, post
+
+
+async def transition_from_pending(session: AsyncSession, model, key: int, status: str, **values):
+    """Атомарно перевести строку из 'pending' в `status` и вернуть её (или None).
+
+    Один условный `UPDATE ... WHERE status = 'pending' RETURNING`: если два
+    модератора (или два процесса) жмут кнопку одновременно, строку получит ровно
+    один из них, остальные увидят None. Фиксирует транзакцию вызывающий.
+    """
+    primary_key = inspect(model).primary_key[0]
+    result = await session.execute(
+        update(model)
+        .where(primary_key == key, model.status == "pending")
+        .values(status=status, **values)
+        .returning(model)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar_one_or_none()
+
+
+def enqueue_publication(
+    session: AsyncSession,
+    post: Post,
+    chat_id: str | int = CHANNEL_ID,
+    publish_at: datetime = None,
+) -> Outbox:
+    """Поставить пост в очередь публикации (outbox). Фиксирует транзакцию вызывающий"""
+    item = Outbox(
+        post_id=post.post_id,
+        chat_id=str(chat_id),
+        status="pending",
+        attempts=0,
+        available_at=publish_at or datetime.utcnow(),
+    )
+    session.add(item)
+    return item
+
+
+async def get_pending_post_page(
+    session: AsyncSession,
+    cursor: tuple[datetime, int] | None = None,
+    direction: str = "next",
+) -> tuple[Post, User] | None:
+    """Один пост очереди модерации вместе с автором (keyset-пагинация).
+
+    Очередь упорядочена от новых к старым по (created_at, post_id). Без курсора
+    возвращается самый новый пост; с курсором — соседний: "next" — более старый,
+    "prev" — более новый. Стоимость не зависит от длины очереди: ни OFFSET, ни
+    загрузки всех постов.
+    """
+    query = select(Post, User).join(User, User.user_id == Post.user_id).where(Post.status == "pending")
+    newest_first = (Post.created_at.desc(), Post.post_id.desc())
+    if cursor is None:
+        query = query.order_by(*newest_first)
+    else:
+        created_at, post_id = cursor
+        if direction == "prev":
+            query = query.where(
+                or_(Post.created_at > created_at, and_(Post.created_at == created_at, Post.post_id > post_id))
+            ).order_by(Post.created_at.asc(), Post.post_id.asc())
+        else:
+            query = query.where(
+                or_(Post.created_at < created_at, and_(Post.created_at == created_at, Post.post_id < post_id))
+            ).order_by(*newest_first)
+    row = (await session.execute(query.limit(1))).first()
+    return (row[0], row[1]) if row else None
+
+
+async def get_user_posts_page(
+    session: AsyncSession,
+    user_id: int,
+    page: int,
+    page_size: int = 5,
+) -> tuple[int, list[Post]]:
+    """Страница постов пользователя (от новых к старым) и общее число его постов.
+
+    Оба запроса идут по индексу ix_posts_user_created, поэтому стоимость зависит от
+    числа постов этого пользователя и номера страницы, а не от размера таблицы.
+    """
+    total = await session.scalar(select(func.count(Post.post_id)).filter(Post.user_id == user_id))
+    posts = (
+        await session.scalars(
+            select(Post)
+            .filter(Post.user_id == user_id)
+            .order_by(Post.created_at.desc())
+            .offset(page * page_size)
+            .limit(page_size)
+        )
+    ).all()
+    return total or 0, list(posts)
+
+
+def dialect_insert(session: AsyncSession, model):
+    """INSERT с ON CONFLICT для диалекта базы сессии (SQLite или PostgreSQL)"""
+    insert = postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+    return insert(model)
+
+
+async def record_payment(
+    session: AsyncSession,
+    user_id: int,
+    username: Optional[str],
+    first_name: Optional[str],
+    post_type: str,
+    amount: float,
+    currency: str,
+    payment_method: str,
+    transaction_id: str,
+) -> Optional[int]:
+    """Записать успешный платёж ровно один раз на charge id (одна транзакция, один commit).
+
+    Возвращает payment_id новой записи или None, если платёж с этим transaction_id
+    уже записан (Telegram повторно доставил successful_payment). Пользователь
+    создаётся в той же транзакции, если его ещё нет.
+    """
+    await session.execute(
+        dialect_insert(session, User)
+        .values(user_id=user_id, username=username, first_name=first_name)
+        .on_conflict_do_nothing(index_elements=[User.user_id])
+    )
+    payment_id = await session.scalar(
+        dialect_insert(session, Payment)
+        .values(
+            user_id=user_id,
+            post_type=post_type,
+            amount=amount,
+            currency=currency,
+            payment_method=payment_method,
+            transaction_id=transaction_id,
+            status="completed",
+        )
+        .on_conflict_do_nothing(index_elements=[Payment.transaction_id])
+        .returning(Payment.payment_id)
     )
-    session.add(payment)
     await session.commit()
-    await session.refresh(payment)
-    return payment
+    return payment_id
 
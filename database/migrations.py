@@ -0,0 +1,112 @@
+"""
+Версионированные миграции схемы
+
+`Base.metadata.create_all` создаёт только отсутствующие таблицы и не трогает
+существующие, поэтому новые колонки и индексы на уже работающих базах добавляются
+здесь. Применённые версии записываются в таблицу schema_version; каждая миграция
+идемпотентна (проверяет, есть ли уже колонка/индекс), так что на новой базе,
+созданной create_all, она просто отмечается применённой.
+
+Новую миграцию добавляйте в конец MIGRATIONS со следующим номером.
+"""
+import logging
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn
+
+from database.models import Base
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _add_column(conn: Connection, table_name: str, column_name: str) -> None:
+    """Добавить колонку модели в существующую таблицу, если её там ещё нет"""
+    existing = {col["name"] for col in inspect(conn).get_columns(table_name)}
+    if column_name in existing:
+        return
+    column = Base.metadata.tables[table_name].c[column_name]
+    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {ddl}"))
+
+
+def _create_indexes(conn: Connection, *names: str) -> None:
+    """Создать индексы, объявленные в моделях, если их ещё нет"""
+    indexes = {index.name: index for table in Base.metadata.sorted_tables for index in table.indexes}
+    for name in names:
+        indexes[name].create(conn, checkfirst=True)
+
+
+def _m1_post_publish_at(conn: Connection) -> None:
+    _add_column(conn, "posts", "publish_at")
+
+
+def _m2_hot_query_indexes(conn: Connection) -> None:
+    _create_indexes(
+        conn,
+        "ix_users_is_banned",
+        "ix_posts_status_created",
+        "ix_posts_user_created",
+        "ix_posts_publish_at",
+        "ix_join_requests_status_chat",
+        "ix_join_requests_moderator",
+        "ix_join_requests_handled_at",
+        "ix_outbox_status_available",
+        "ix_outbox_post_id",
+    )
+
+
+def _m3_unique_payment_charge(conn: Connection) -> None:
+    # Раньше повторная доставка successful_payment записывала платёж ещё раз; оставляем первую запись
+    result = conn.execute(
+        text(
+            "DELETE FROM payments WHERE transaction_id IS NOT NULL AND payment_id NOT IN "
+            "(SELECT MIN(payment_id) FROM payments WHERE transaction_id IS NOT NULL GROUP BY transaction_id)"
+        )
+    )
+    if result.rowcount:
+        logger.warning(f"Удалено дубликатов платежей: {result.rowcount}")
+    _create_indexes(conn, "ux_payments_transaction_id")
+
+
+def _m4_post_media_source(conn: Connection) -> None:
+    # У старых постов тип вложения и исходное сообщение неизвестны: они публикуются как раньше
+    for column in ("media_kind", "source_chat_id", "source_message_id"):
+        _add_column(conn, "posts", column)
+
+
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "posts.publish_at (слот публикации)", _m1_post_publish_at),
+    (2, "индексы для горячих запросов", _m2_hot_query_indexes),
+    (3, "уникальный charge id платежа", _m3_unique_payment_charge),
+    (4, "posts.media_kind и исходное сообщение", _m4_post_media_source),
+]
+
+
+def run_migrations(conn: Connection) -> list[int]:
+    """Применить недостающие миграции по порядку. Возвращает номера применённых"""
+    _metadata.create_all(conn)
+    applied = set(conn.execute(select(schema_version.c.version)).scalars())
+    done = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        migrate(conn)
+        conn.execute(
+            schema_version.insert().values(version=version, description=description, applied_at=datetime.utcnow())
+        )
+        logger.info(f"Миграция {version} применена: {description}")
+        done.append(version)
+    return done
@@ -10,6 +10,7 @@ from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
@@ -36,6 +37,10 @@ class User(Base):
     posts = relationship("Post", back_populates="user")
     payments = relationship("Payment", back_populates="user")
 
+    __table_args__ = (
+        Index("ix_users_is_banned", "is_banned"),  # загрузка кэша банов
+    )
+
 
 class Post(Base):
     """Модель поста"""
@@ -46,16 +51,30 @@ class Post(Base):
     post_type = Column(String(20), nullable=False)  # 'free', 'ad35', 'offtopic50'
     content = Column(Text, nullable=False)
     media_file_id = Column(String(255), nullable=True)
+    media_kind = Column(String(20), nullable=True)  # 'photo', 'video', 'document'; NULL у старых постов и постов без вложения
+    # Исходное сообщение автора: пост публикуется его копией (copyMessage) с форматированием и типом вложения
+    source_chat_id = Column(BigInteger, nullable=True)
+    source_message_id = Column(BigInteger, nullable=True)
     status = Column(String(20), default="pending", server_default="pending")  # 'pending', 'approved', 'rejected'
     rejection_reason = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
     moderated_at = Column(DateTime, nullable=True)
     moderator_id = Column(BigInteger, nullable=True)
     channel_message_id = Column(BigInteger, nullable=True)
+    publish_at = Column(DateTime, nullable=True)  # Слот публикации в канал (UTC), назначается при одобрении
 
     # Связи
     user = relationship("User", back_populates="posts")
 
+    __table_args__ = (
+        # Очередь модерации: фильтр по статусу + keyset-пагинация по (created_at, post_id)
+        Index("ix_posts_status_created", "status", "created_at", "post_id"),
+        # Посты пользователя (карточка пользователя и их список)
+        Index("ix_posts_user_created", "user_id", "created_at"),
+        # Последний занятый слот публикации при старте планировщика
+        Index("ix_posts_publish_at", "publish_at"),
+    )
+
 
 class Payment(Base):
     """Модель платежа"""
@@ -68,12 +87,17 @@ class Payment(Base):
     currency = Column(String(10), nullable=False)  # 'UAH', 'XTR' (Stars)
     payment_method = Column(String(20), nullable=False)  # 'stars', 'stripe'
     status = Column(String(20), default="pending", server_default="pending")  # 'pending', 'completed', 'failed'
-    transaction_id = Column(String(255), nullable=True)
+    transaction_id = Column(String(255), nullable=True)  # telegram_payment_charge_id
     created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
 
     # Связи
     user = relationship("User", back_populates="payments")
 
+    __table_args__ = (
+        # Один платёж на charge id: повторная доставка successful_payment не создаёт дубликат
+        Index("ux_payments_transaction_id", "transaction_id", unique=True),
+    )
+
 
 class ChatJoinRequest(Base):
     """Модель заявки на вступление в канал"""
@@ -89,6 +113,12 @@ class ChatJoinRequest(Base):
     created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
     handled_at = Column(DateTime, nullable=True)
 
+    __table_args__ = (
+        Index("ix_join_requests_status_chat", "status", "chat_id"),  # заявки в ожидании по каналам
+        Index("ix_join_requests_moderator", "moderator_id", "status"),  # активность модераторов
+        Index("ix_join_requests_handled_at", "handled_at"),  # последние обработанные заявки
+    )
+
 
 class Moderator(Base):
     """Модель модератора"""
@@ -98,3 +128,33 @@ class Moderator(Base):
     username = Column(String(255), nullable=True)
     added_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
 
+
+class Outbox(Base):
+    """Очередь публикаций в канал (outbox): строка появляется в той же транзакции, что и одобрение поста"""
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    post_id = Column(Integer, ForeignKey("posts.post_id"), nullable=False)
+    chat_id = Column(String(64), nullable=False)
+    status = Column(String(20), default="pending", server_default="pending")  # 'pending', 'processing', 'done', 'failed', 'cancelled'
+    attempts = Column(Integer, default=0, server_default="0")
+    available_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())  # не раньше этого времени (backoff)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
+    published_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_status_available", "status", "available_at", "id"),  # выборка воркерами публикации
+        Index("ix_outbox_post_id", "post_id"),  # удаление поста вместе с его строками
+    )
+
+
+class FSMRecord(Base):
+    """Состояние FSM и его данные (хранилище states.storage.SQLStorage)"""
+    __tablename__ = "fsm_states"
+
+    key = Column(String(255), primary_key=True)  # bot_id:chat_id:user_id:destiny (DefaultKeyBuilder)
+    state = Column(String(255), nullable=True)
+    data = Column(Text, nullable=True)  # JSON
+    updated_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
@@ -9,16 +9,22 @@ from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message, InlineKeyboardButton, InlineKeyboardMarkup, ChatJoinRequest as TgChatJoinRequest
-from sqlalchemy import func, select, case
+from sqlalchemy import delete, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import CHANNEL_ID, MODERATOR_IDS, OWNER_IDS
-from database.db import get_db
-from database.models import Post, User, Moderator, ChatJoinRequest
-from keyboards.moderator_kb import get_moderation_keyboard, get_user_info_keyboard, get_moderator_main_keyboard
+from database.db import enqueue_publication, get_db, get_pending_post_page, get_user_posts_page, transition_from_pending
+from database.models import Post, User, Moderator, ChatJoinRequest, Outbox
+from keyboards.moderator_kb import decode_page_cursor, get_moderation_keyboard, get_user_info_keyboard, get_moderator_main_keyboard
+from services.cache import ban_cache, moderator_roster
+from services.counters import pending_counters
+from services.mass_approval import mass_approval
+from services.scheduler import scheduler
+from services.stats import stats_cache
 from states.states import ModerationStates
-from utils.helpers import format_user_info, is_moderator, is_owner, format_post_for_moderator, format_join_request
-from utils.texts import POST_APPROVED_MESSAGE, POST_REJECTED_TEMPLATE
+from utils.fanout import fan_out
+from utils.helpers import extract_media, format_user_info, is_owner, format_post_for_moderator, format_join_request, send_post_content
+from utils.texts import POST_REJECTED_TEMPLATE
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -135,18 +141,13 @@ def moderator_only(func):
         message_or_callback = args[0]
         user_id = message_or_callback.from_user.id if hasattr(message_or_callback, 'from_user') else message_or_callback.message.from_user.id
         
-        if not is_moderator(user_id):
-            # Проверим БД на наличие модератора (динамически добавляемых)
-            async for session in get_db():
-                mod = await session.get(Moderator, user_id)
-                if not mod:
-                    if isinstance(message_or_callback, CallbackQuery):
-                        await message_or_callback.answer("❌ У тебя нет прав модератора.", show_alert=True)
-                    else:
-                        await message_or_callback.answer("❌ У тебя нет прав модератора.")
-                    return
-                # если есть запись в БД — разрешаем
-                break
+        # Env-модераторы, владельцы и модераторы из БД — всё из кэша состава модерации
+        if not moderator_roster.is_moderator(user_id):
+            if isinstance(message_or_callback, CallbackQuery):
+                await message_or_callback.answer("❌ У тебя нет прав модератора.", show_alert=True)
+            else:
+                await message_or_callback.answer("❌ У тебя нет прав модератора.")
+            return
         
         return await func(*args, **kwargs)
     return wrapper
@@ -156,32 +157,28 @@ def moderator_only(func):
 @moderator_only
 async def cmd_stats(message: Message):
     """Статистика постов"""
-    async for session in get_db():
-        # Подсчитываем статистику
-        total_posts = await session.scalar(select(func.count(Post.post_id)))
-        pending_posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
-        approved_posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "approved"))
-        rejected_posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "rejected"))
-        
-        stats_text = f"""📊 Статистика постов
+    # Подсчитываем статистику (снимок из кэша, обновляется раз в STATS_CACHE_TTL)
+    stats = await stats_cache.get()
+    posts = stats.posts_by_status
+    
+    stats_text = f"""📊 Статистика постов
 
-Всего постов: {total_posts or 0}
-⏳ На модерации: {pending_posts or 0}
-✅ Одобрено: {approved_posts or 0}
-❌ Отклонено: {rejected_posts or 0}"""
-        
-        await message.answer(stats_text)
+Всего постов: {stats.total_posts}
+⏳ На модерации: {posts.get("pending", 0)}
+✅ Одобрено: {posts.get("approved", 0)}
+❌ Отклонено: {posts.get("rejected", 0)}"""
+    
+    await message.answer(stats_text)
 
 
 @router.message(Command("moderator"))
 @moderator_only
 async def cmd_moderator_panel(message: Message):
     """Панель модератора: главное меню"""
-    async for session in get_db():
-        pending_posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
-        pending_posts = pending_posts or 0
-        pending_requests = await session.scalar(select(func.count(ChatJoinRequest.id)).filter(ChatJoinRequest.status == "pending", ChatJoinRequest.chat_id == int(CHANNEL_ID)))
-        pending_requests = pending_requests or 0
+    # Счётчики поддерживаются инкрементально — без COUNT(*) по таблицам (кроме режима WORKERS > 1)
+    await pending_counters.refresh()
+    pending_posts = pending_counters.pending_posts
+    pending_requests = pending_counters.pending_requests(CHANNEL_ID)
 
     is_owner_user = message.from_user.id in OWNER_IDS
     kb = get_moderator_main_keyboard(pending_posts=pending_posts, pending_requests=pending_requests, is_owner=is_owner_user)
@@ -200,81 +197,38 @@ async def cmd_moderator_panel(message: Message):
 @router.callback_query(F.data.startswith("approve_"))
 @moderator_only
 async def approve_post(callback: CallbackQuery):
-    """Одобрение поста"""
-    bot = callback.bot
-    
+    """Одобрение поста: помечаем одобренным и ставим в очередь публикации"""
     post_id = int(callback.data.split("_")[1])
     
     async for session in get_db():
-        post = await session.get(Post, post_id)
-        if not post:
-            await callback.answer("❌ Пост не найден.", show_alert=True)
-            return
-        
-        if post.status != "pending":
-            await callback.answer("❌ Пост уже обработан.", show_alert=True)
+        # Условный UPDATE: при одновременных нажатиях пост одобрит (и опубликует) только один
+        post = await transition_from_pending(
+            session, Post, post_id, "approved",
+            moderated_at=datetime.utcnow(), moderator_id=callback.from_user.id,
+        )
+        if post is None:
+            exists = await session.get(Post, post_id)
+            await callback.answer("❌ Пост уже обработан." if exists else "❌ Пост не найден.", show_alert=True)
             return
-        
-        # Обновляем статус
-        post.status = "approved"
-        post.moderated_at = datetime.utcnow()
-        post.moderator_id = callback.from_user.id
+
+        # Слот занимаем только победителем и добавляем в outbox той же транзакцией
+        post.publish_at = scheduler.next_slot()
+        enqueue_publication(session, post, publish_at=post.publish_at)
         await session.commit()
-        
-        # Публикуем в канал
-        try:
-            if post.media_file_id:
-                # Пытаемся отправить как фото, если не получится - как документ
-                try:
-                    sent_message = await bot.send_photo(
-                        CHANNEL_ID,
-                        post.media_file_id,
-                        caption=post.content,
-                    )
-                except Exception:
-                    # Если фото не получилось, пробуем как документ
-                    sent_message = await bot.send_document(
-                        CHANNEL_ID,
-                        post.media_file_id,
-                        caption=post.content,
-                    )
-            else:
-                sent_message = await bot.send_message(
-                    CHANNEL_ID,
-                    post.content,
-                )
-            
-            post.channel_message_id = sent_message.message_id
-            await session.commit()
-            
-            # Уведомляем пользователя
-            try:
-                await bot.send_message(
-                    post.user_id,
-                    POST_APPROVED_MESSAGE,
-                )
-            except Exception as e:
-                logger.warning(f"Не удалось отправить уведомление пользователю {post.user_id}: {e}")
-            
-            await callback.answer("✅ Пост одобрен и опубликован!")
-            current_text = callback.message.text or callback.message.caption or "Пост одобрен"
-            await callback.message.edit_text(
-                current_text + "\n\n✅ ОДОБРЕНО",
-                reply_markup=None,
-            )
-        except Exception as e:
-            error_msg = str(e)
-            if "chat not found" in error_msg.lower():
-                await callback.answer(
-                    "❌ Бот не может публиковать в канал. Проверьте:\n"
-                    "1. Бот добавлен в канал как администратор\n"
-                    "2. У бота есть права на публикацию сообщений\n"
-                    "3. CHANNEL_ID указан правильно",
-                    show_alert=True,
-                )
-            else:
-                await callback.answer(f"❌ Ошибка публикации: {error_msg}", show_alert=True)
-            logger.error(f"Ошибка публикации поста {post_id}: {e}")
+        publish_at = post.publish_at
+    pending_counters.post_resolved()
+
+    # Публикацию в свой слот и уведомление автора выполнят воркеры
+    scheduler.schedule(publish_at)
+    await callback.answer(f"✅ Пост одобрен! Публикация: {scheduler.format_slot(publish_at)}")
+    current_text = callback.message.text or callback.message.caption or "Пост одобрен"
+    try:
+        await callback.message.edit_text(
+            current_text + "\n\n✅ ОДОБРЕНО",
+            reply_markup=None,
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось обновить сообщение модератора для поста {post_id}: {e}")
 
 
 @router.callback_query(F.data.startswith("reject_"))
@@ -322,18 +276,18 @@ async def receive_rejection_reason(message: Message, state: FSMContext):
     reason = message.text or "Причина не указана"
     
     async for session in get_db():
-        post = await session.get(Post, post_id)
-        if not post:
-            await message.answer("❌ Пост не найден.")
+        # Пока модератор писал причину, пост могли одобрить — отклоняем только из pending
+        post = await transition_from_pending(
+            session, Post, post_id, "rejected",
+            rejection_reason=reason, moderated_at=datetime.utcnow(), moderator_id=message.from_user.id,
+        )
+        if post is None:
+            exists = await session.get(Post, post_id)
+            await message.answer("❌ Пост уже обработан другим модератором." if exists else "❌ Пост не найден.")
             await state.clear()
             return
-        
-        # Обновляем статус
-        post.status = "rejected"
-        post.rejection_reason = reason
-        post.moderated_at = datetime.utcnow()
-        post.moderator_id = message.from_user.id
         await session.commit()
+        pending_counters.post_resolved()
         
         # Уведомляем пользователя
         try:
@@ -419,6 +373,7 @@ async def receive_new_moderator(message: Message, state: FSMContext):
             session.add(new_user)
 
         await session.commit()
+    await moderator_roster.reload()
 
     # Обновим runtime-список MODERATOR_IDS (чтобы is_moderator работал без перезапуска)
     try:
@@ -489,6 +444,7 @@ async def receive_moderator_username(message: Message, state: FSMContext):
         if user:
             user.username = new_username
         await session.commit()
+    await moderator_roster.reload()
 
     await message.answer(f"✅ Username для модератора {mod_id} обновлён: {format_username_display(new_username)}")
 
@@ -523,13 +479,7 @@ async def receive_edited_content(message: Message, state: FSMContext):
         await message.answer("❌ Контент не может быть пустым. Отправьте текст или вложение.")
         return
 
-    media_file_id = None
-    if message.photo:
-        media_file_id = message.photo[-1].file_id
-    elif message.video:
-        media_file_id = message.video.file_id
-    elif message.document:
-        media_file_id = message.document.file_id
+    media_file_id, media_kind = extract_media(message)
 
     async for session in get_db():
         post = await session.get(Post, post_id)
@@ -542,6 +492,15 @@ async def receive_edited_content(message: Message, state: FSMContext):
         post.content = content
         if media_file_id:
             post.media_file_id = media_file_id
+            post.media_kind = media_kind
+        if media_file_id or not post.media_file_id:
+            # Сообщение модератора целиком заменяет пост — в канал уйдёт его копия
+            post.source_chat_id = message.chat.id
+            post.source_message_id = message.message_id
+        else:
+            # Новый текст к старому вложению: копировать нечего, публикуем по file_id
+            post.source_chat_id = None
+            post.source_message_id = None
         await session.commit()
 
         # Удалим старое сообщение модератора и отправим обновленное
@@ -553,32 +512,17 @@ async def receive_edited_content(message: Message, state: FSMContext):
         user = await session.get(User, post.user_id)
         try:
             # Проверим, есть ли ещё посты в ожидании и передадим кнопку "Одобрить всех" при необходимости
-            pending_count = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
-            include_approve_all = (pending_count or 0) > 1
+            await pending_counters.refresh()
+            include_approve_all = pending_counters.pending_posts > 1
 
             is_owner = message.from_user.id in OWNER_IDS
-            if post.media_file_id:
-                # Если есть медиа — пробуем отправить как фото, иначе как документ
-                try:
-                    await message.bot.send_photo(
-                        chat_id,
-                        post.media_file_id,
-                        caption=format_post_for_moderator(post, user),
-                        reply_markup=get_moderation_keyboard(post.post_id, user.user_id, include_approve_all=include_approve_all, is_owner=is_owner),
-                    )
-                except Exception:
-                    await message.bot.send_document(
-                        chat_id,
-                        post.media_file_id,
-                        caption=format_post_for_moderator(post, user),
-                        reply_markup=get_moderation_keyboard(post.post_id, user.user_id, include_approve_all=include_approve_all, is_owner=is_owner),
-                    )
-            else:
-                await message.bot.send_message(
-                    chat_id,
-                    format_post_for_moderator(post, user),
-                    reply_markup=get_moderation_keyboard(post.post_id, user.user_id, include_approve_all=include_approve_all, is_owner=is_owner),
-                )
+            await send_post_content(
+                message.bot,
+                chat_id,
+                post,
+                format_post_for_moderator(post, user),
+                get_moderation_keyboard(post.post_id, user.user_id, include_approve_all=include_approve_all, is_owner=is_owner),
+            )
         except Exception as e:
             logger.warning(f"Не удалось отправить модератору обновлённый пост: {e}")
 
@@ -586,58 +530,31 @@ async def receive_edited_content(message: Message, state: FSMContext):
     await state.clear()
 
 
+async def start_mass_approval(callback: CallbackQuery) -> None:
+    """Запустить массовое одобрение в фоне; прогресс пишется в сообщение с кнопкой"""
+    await pending_counters.refresh()
+    job = mass_approval.start(callback.bot, callback.from_user.id, callback.message.chat.id, callback.message.message_id)
+    if job is None:
+        await callback.answer("⏳ Массовое одобрение уже выполняется.", show_alert=True)
+        return
+    await callback.answer("⏳ Одобряю посты…")
+
+
 @router.callback_query(F.data == "approve_all")
 @moderator_only
 async def approve_all_callback(callback: CallbackQuery):
     """Одобрить все посты, находящиеся в статусе pending (через кнопку)"""
-    bot = callback.bot
-    approved = 0
-    failed = 0
-
-    async for session in get_db():
-        pending_posts = (await session.scalars(select(Post).filter(Post.status == "pending"))).all()
-        for post in pending_posts:
-            try:
-                if post.media_file_id:
-                    try:
-                        sent_message = await bot.send_photo(
-                            CHANNEL_ID,
-                            post.media_file_id,
-                            caption=post.content,
-                        )
-                    except Exception:
-                        sent_message = await bot.send_document(
-                            CHANNEL_ID,
-                            post.media_file_id,
-                            caption=post.content,
-                        )
-                else:
-                    sent_message = await bot.send_message(
-                        CHANNEL_ID,
-                        post.content,
-                    )
-
-                post.channel_message_id = sent_message.message_id
-                post.status = "approved"
-                post.moderated_at = datetime.utcnow()
-                post.moderator_id = callback.from_user.id
-                await session.commit()
-
-                try:
-                    await bot.send_message(post.user_id, POST_APPROVED_MESSAGE)
-                except Exception:
-                    pass
+    await start_mass_approval(callback)
 
-                approved += 1
-            except Exception as e:
-                logger.error(f"Ошибка при массовом одобрении поста {post.post_id}: {e}")
-                failed += 1
 
-    await callback.answer(f"✅ Одобрено: {approved}\n❌ Ошибок: {failed}", show_alert=True)
-    try:
-        await callback.message.edit_text((callback.message.text or "") + f"\n\n✅ Массово одобрено: {approved}, ❌ Ошибок: {failed}", reply_markup=None)
-    except Exception:
-        pass
+@router.callback_query(F.data == "approve_all_cancel")
+@moderator_only
+async def approve_all_cancel(callback: CallbackQuery):
+    """Остановить массовое одобрение после текущей пачки"""
+    if mass_approval.cancel():
+        await callback.answer("⛔ Останавливаю. Уже одобренные посты останутся в очереди публикации.")
+    else:
+        await callback.answer("Массовое одобрение уже завершено.")
 
 
 @router.callback_query(F.data.startswith("ban_user_"))
@@ -654,6 +571,7 @@ async def ban_user(callback: CallbackQuery):
 
         user.is_banned = True
         await session.commit()
+    ban_cache.ban(user_id)
 
     await callback.answer("✅ Пользователь забанен.", show_alert=True)
     current_text = callback.message.text or callback.message.caption or "Пользователь"
@@ -677,6 +595,7 @@ async def unban_user(callback: CallbackQuery):
         
         user.is_banned = False
         await session.commit()
+        ban_cache.unban(user_id)
         
         await callback.answer("✅ Пользователь разбанен.", show_alert=True)
         current_text = callback.message.text or callback.message.caption or "Пользователь"
@@ -694,49 +613,58 @@ async def noop_callback(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "moderator_posts")
-@moderator_only
-async def moderator_posts(callback: CallbackQuery):
-    """Показать первый пост на модерации (быстрый доступ)"""
-    async for session in get_db():
-        pending_posts = (await session.scalars(select(Post).filter(Post.status == "pending").order_by(Post.created_at.desc()))).all()
-        total = len(pending_posts)
-        if total == 0:
-            await callback.answer("✅ Нет постов на модерации.", show_alert=True)
-            return
-        post = pending_posts[0]
-        user = await session.get(User, post.user_id)
-        include_approve_all = total > 1
-        is_owner_user = callback.from_user.id in OWNER_IDS
-        kb = get_moderation_keyboard(post.post_id, user.user_id, include_approve_all=include_approve_all, offset=0, total=total, is_owner=is_owner_user)
-        chat_id = callback.message.chat.id
+async def show_moderation_post(callback: CallbackQuery, post: Post, user: User, position: int) -> None:
+    """Показать пост очереди модерации в текущем сообщении (или заменить его новым)"""
+    await pending_counters.refresh()
+    total = pending_counters.pending_posts
+    # Номер в подписи приблизительный: очередь могла измениться, пока модератор листал
+    position = max(0, min(position, total - 1))
+    is_owner_user = callback.from_user.id in OWNER_IDS
+    kb = get_moderation_keyboard(
+        post.post_id, user.user_id, include_approve_all=total > 1, offset=position, total=total,
+        is_owner=is_owner_user, created_at=post.created_at,
+    )
+    chat_id = callback.message.chat.id
+    message_id = callback.message.message_id
 
-        try:
-            if post.media_file_id:
+    # Попытка отредактировать сообщение; при неудаче - удалить и отправить новое
+    try:
+        if post.media_file_id:
+            # Попытаемся отредактировать подпись, если это возможно
+            try:
+                await callback.message.edit_caption(format_post_for_moderator(post, user), reply_markup=kb)
+            except Exception:
                 try:
-                    await callback.message.edit_caption(format_post_for_moderator(post, user), reply_markup=kb)
+                    await callback.bot.delete_message(chat_id, message_id)
                 except Exception:
-                    try:
-                        await callback.bot.delete_message(chat_id, callback.message.message_id)
-                    except Exception:
-                        pass
-                    try:
-                        await callback.bot.send_photo(chat_id, post.media_file_id, caption=format_post_for_moderator(post, user), reply_markup=kb)
-                    except Exception:
-                        await callback.bot.send_document(chat_id, post.media_file_id, caption=format_post_for_moderator(post, user), reply_markup=kb)
-            else:
+                    pass
+                # Отправим как новое сообщение
+                await send_post_content(callback.bot, chat_id, post, format_post_for_moderator(post, user), kb)
+        else:
+            try:
+                await callback.message.edit_text(format_post_for_moderator(post, user), reply_markup=kb)
+            except Exception:
                 try:
-                    await callback.message.edit_text(format_post_for_moderator(post, user), reply_markup=kb)
+                    await callback.bot.delete_message(chat_id, message_id)
                 except Exception:
-                    try:
-                        await callback.bot.delete_message(chat_id, callback.message.message_id)
-                    except Exception:
-                        pass
-                    await callback.bot.send_message(chat_id, format_post_for_moderator(post, user), reply_markup=kb)
-        except Exception as e:
-            logger.warning(f"Не удалось показать пост: {e}")
+                    pass
+                await callback.bot.send_message(chat_id, format_post_for_moderator(post, user), reply_markup=kb)
+    except Exception as e:
+        logger.warning(f"Не удалось показать пост {post.post_id} на модерации: {e}")
 
-        await callback.answer()
+
+@router.callback_query(F.data == "moderator_posts")
+@moderator_only
+async def moderator_posts(callback: CallbackQuery):
+    """Показать первый пост на модерации (быстрый доступ)"""
+    async for session in get_db():
+        page = await get_pending_post_page(session)
+    if page is None:
+        await callback.answer("✅ Нет постов на модерации.", show_alert=True)
+        return
+    post, user = page
+    await show_moderation_post(callback, post, user, 0)
+    await callback.answer()
 
 
 @router.callback_query(F.data == "moderator_add_mods")
@@ -855,6 +783,7 @@ async def confirm_remove_mod(callback: CallbackQuery):
             await session.delete(mod_entry)
             await session.commit()
             removed = True
+    await moderator_roster.reload()
 
     try:
         if mod_id in MODERATOR_IDS:
@@ -884,18 +813,22 @@ async def confirm_remove_mod(callback: CallbackQuery):
         await callback.answer("✅ Модератор удалён.")
     else:
         await callback.answer("ℹ️ Модератор не найден в базе/списке.", show_alert=True)
+
+
+@router.chat_join_request()
+async def handle_join_request(req: TgChatJoinRequest):
+    """Новая заявка на вступление в канал: сохраняем и рассылаем модераторам"""
+    user = req.from_user
+    chat = req.chat
     async for session in get_db():
         new_req = ChatJoinRequest(user_id=user.id, chat_id=chat.id, username=user.username, full_name=(user.full_name if hasattr(user, 'full_name') else None))
         session.add(new_req)
         await session.commit()
         req_id = new_req.id
+    pending_counters.request_created(chat.id)
 
     # Нотифицируем модераторов
-    mod_ids = set(MODERATOR_IDS) | set(OWNER_IDS)
-    async for session in get_db():
-        db_mods = (await session.scalars(select(Moderator))).all()
-        for m in db_mods:
-            mod_ids.add(m.moderator_id)
+    mod_ids = moderator_roster.recipients()
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✅ Одобрить", callback_data=f"joinreq_approve_{req_id}"), InlineKeyboardButton(text="❌ Отказать", callback_data=f"joinreq_reject_{req_id}")]
@@ -904,11 +837,7 @@ async def confirm_remove_mod(callback: CallbackQuery):
     user_reference = format_user_reference(user.username, getattr(user, "full_name", None), user.id)
     text = f"📨 Заявка в канал: {user_reference}\nID заявки: {req_id}"
 
-    for mod_id in mod_ids:
-        try:
-            await req.bot.send_message(mod_id, text, reply_markup=kb)
-        except Exception:
-            pass
+    await fan_out(mod_ids, lambda mod_id: req.bot.send_message(mod_id, text, reply_markup=kb))
 
 
 @router.callback_query(F.data.startswith("joinreq_approve_"))
@@ -921,21 +850,24 @@ async def joinreq_approve(callback: CallbackQuery):
         return
 
     async for session in get_db():
-        req = await session.get(ChatJoinRequest, req_id)
-        if not req:
-            await callback.answer("❌ Заявка не найдена.", show_alert=True)
-            return
-        if req.status != "pending":
-            await callback.answer("❌ Заявка уже обработана.", show_alert=True)
+        # Сначала атомарно забираем заявку себе, затем идём в Bot API: второй модератор,
+        # нажавший одновременно, получит «уже обработана» и не вызовет API повторно
+        req = await transition_from_pending(
+            session, ChatJoinRequest, req_id, "approved",
+            moderator_id=callback.from_user.id, handled_at=datetime.utcnow(),
+        )
+        if req is None:
+            exists = await session.get(ChatJoinRequest, req_id)
+            await callback.answer("❌ Заявка уже обработана." if exists else "❌ Заявка не найдена.", show_alert=True)
             return
+        await session.commit()
 
         # Попытаемся одобрить в канале
+        resolved = False
         try:
             await callback.bot.approve_chat_join_request(int(req.chat_id), int(req.user_id))
-            req.status = "approved"
-            req.moderator_id = callback.from_user.id
-            req.handled_at = datetime.utcnow()
-            await session.commit()
+            resolved = True
+            pending_counters.request_resolved(req.chat_id)
 
             try:
                 await callback.bot.send_message(req.user_id, "✅ Ваша заявка в канал одобрена.")
@@ -957,6 +889,14 @@ async def joinreq_approve(callback: CallbackQuery):
             )
         except Exception as e:
             logger.error(f"Ошибка при одобрении заявки {req_id}: {e}")
+            if not resolved:
+                # Bot API не принял решение — возвращаем заявку в очередь
+                await session.execute(
+                    update(ChatJoinRequest)
+                    .where(ChatJoinRequest.id == req_id, ChatJoinRequest.status == "approved")
+                    .values(status="pending", moderator_id=None, handled_at=None)
+                )
+                await session.commit()
             await callback.answer(f"❌ Ошибка при одобрении: {e}", show_alert=True)
 
 
@@ -970,20 +910,23 @@ async def joinreq_reject(callback: CallbackQuery):
         return
 
     async for session in get_db():
-        req = await session.get(ChatJoinRequest, req_id)
-        if not req:
-            await callback.answer("❌ Заявка не найдена.", show_alert=True)
-            return
-        if req.status != "pending":
-            await callback.answer("❌ Заявка уже обработана.", show_alert=True)
+        # Сначала атомарно забираем заявку себе, затем идём в Bot API: второй модератор,
+        # нажавший одновременно, получит «уже обработана» и не вызовет API повторно
+        req = await transition_from_pending(
+            session, ChatJoinRequest, req_id, "rejected",
+            moderator_id=callback.from_user.id, handled_at=datetime.utcnow(),
+        )
+        if req is None:
+            exists = await session.get(ChatJoinRequest, req_id)
+            await callback.answer("❌ Заявка уже обработана." if exists else "❌ Заявка не найдена.", show_alert=True)
             return
+        await session.commit()
 
+        resolved = False
         try:
             await callback.bot.decline_chat_join_request(int(req.chat_id), int(req.user_id))
-            req.status = "rejected"
-            req.moderator_id = callback.from_user.id
-            req.handled_at = datetime.utcnow()
-            await session.commit()
+            resolved = True
+            pending_counters.request_resolved(req.chat_id)
 
             try:
                 await callback.bot.send_message(req.user_id, "❌ Ваша заявка в канал отклонена.")
@@ -1005,66 +948,38 @@ async def joinreq_reject(callback: CallbackQuery):
             )
         except Exception as e:
             logger.error(f"Ошибка при отклонении заявки {req_id}: {e}")
+            if not resolved:
+                # Bot API не принял решение — возвращаем заявку в очередь
+                await session.execute(
+                    update(ChatJoinRequest)
+                    .where(ChatJoinRequest.id == req_id, ChatJoinRequest.status == "rejected")
+                    .values(status="pending", moderator_id=None, handled_at=None)
+                )
+                await session.commit()
             await callback.answer(f"❌ Ошибка при отклонении: {e}", show_alert=True)
 
 
 @router.callback_query(F.data.startswith("moderator_page_"))
 @moderator_only
 async def moderator_page(callback: CallbackQuery):
-    """Показать пост по номеру страницы (offset)"""
+    """Показать соседний пост очереди по курсору из callback_data"""
     try:
-        offset = int(callback.data.split("_")[2])
+        position, direction, cursor = decode_page_cursor(callback.data)
     except Exception:
         await callback.answer("❌ Некорректная страница.", show_alert=True)
         return
 
     async for session in get_db():
-        pending_posts = (await session.scalars(select(Post).filter(Post.status == "pending").order_by(Post.created_at.desc()))).all()
-        total = len(pending_posts)
-        if total == 0:
+        page = await get_pending_post_page(session, cursor, direction)
+    if page is None:
+        if cursor is None:
             await callback.answer("✅ Нет постов на модерации.", show_alert=True)
-            return
-        if offset < 0 or offset >= total:
-            await callback.answer("❌ Страница вне диапазона.", show_alert=True)
-            return
-
-        post = pending_posts[offset]
-        user = await session.get(User, post.user_id)
-        include_approve_all = total > 1
-        is_owner_user = callback.from_user.id in OWNER_IDS
-
-        chat_id = callback.message.chat.id
-        message_id = callback.message.message_id
-        kb = get_moderation_keyboard(post.post_id, user.user_id, include_approve_all=include_approve_all, offset=offset, total=total, is_owner=is_owner_user)
-
-        # Попытка отредактировать сообщение; при неудаче - удалить и отправить новое
-        try:
-            if post.media_file_id:
-                # Попытаемся отредактировать подпись, если это возможно
-                try:
-                    await callback.message.edit_caption(format_post_for_moderator(post, user), reply_markup=kb)
-                except Exception:
-                    try:
-                        await callback.bot.delete_message(chat_id, message_id)
-                    except Exception:
-                        pass
-                    # Отправим как новое сообщение
-                    try:
-                        await callback.bot.send_photo(chat_id, post.media_file_id, caption=format_post_for_moderator(post, user), reply_markup=kb)
-                    except Exception:
-                        await callback.bot.send_document(chat_id, post.media_file_id, caption=format_post_for_moderator(post, user), reply_markup=kb)
-            else:
-                try:
-                    await callback.message.edit_text(format_post_for_moderator(post, user), reply_markup=kb)
-                except Exception:
-                    try:
-                        await callback.bot.delete_message(chat_id, message_id)
-                    except Exception:
-                        pass
-                    await callback.bot.send_message(chat_id, format_post_for_moderator(post, user), reply_markup=kb)
-        except Exception as e:
-            logger.warning(f"Не удалось показать страницу модерации {offset}: {e}")
+        else:
+            await callback.answer("Дальше постов нет.", show_alert=True)
+        return
 
+    post, user = page
+    await show_moderation_post(callback, post, user, position)
     await callback.answer()
 
 
@@ -1131,8 +1046,7 @@ async def show_user_posts(callback: CallbackQuery):
     offset = page * page_size
 
     async for session in get_db():
-        total_posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.user_id == user_id))
-        posts = (await session.scalars(select(Post).filter(Post.user_id == user_id).order_by(Post.created_at.desc()).offset(offset).limit(page_size))).all()
+        total_posts, posts = await get_user_posts_page(session, user_id, page, page_size)
 
     if not posts:
         await callback.answer("📄 Постов не найдено на этой странице.", show_alert=True)
@@ -1193,10 +1107,7 @@ async def view_post(callback: CallbackQuery):
                     await callback.bot.delete_message(callback.message.chat.id, callback.message.message_id)
                 except Exception:
                     pass
-                try:
-                    await callback.bot.send_photo(callback.message.chat.id, post.media_file_id, caption=text, reply_markup=kb)
-                except Exception:
-                    await callback.bot.send_document(callback.message.chat.id, post.media_file_id, caption=text, reply_markup=kb)
+                await send_post_content(callback.bot, callback.message.chat.id, post, text, kb)
         else:
             await callback.message.edit_text(text, reply_markup=kb)
     except Exception as e:
@@ -1215,13 +1126,28 @@ async def delete_post(callback: CallbackQuery):
         return
 
     async for session in get_db():
-        post = await session.get(Post, post_id)
-        if not post:
+        # Пост мог ждать публикации — убираем его из очереди вместе с ним. Строку, которую
+        # воркер уже взял в работу, не трогаем: пост вот-вот уйдёт в канал, удалять его рано
+        await session.execute(delete(Outbox).where(Outbox.post_id == post_id, Outbox.status != "processing"))
+        publishing = await session.scalar(
+            select(Outbox.id).where(Outbox.post_id == post_id, Outbox.status == "processing").limit(1)
+        )
+        if publishing is not None:
+            await session.rollback()
+            await callback.answer("⏳ Пост сейчас публикуется в канал. Попробуйте удалить его позже.", show_alert=True)
+            return
+        # Статус берём из самого DELETE: между чтением и удалением его могли изменить
+        deleted = (
+            await session.execute(delete(Post).where(Post.post_id == post_id).returning(Post.user_id, Post.status))
+        ).first()
+        if deleted is None:
+            await session.rollback()
             await callback.answer("❌ Пост не найден.", show_alert=True)
             return
-        user_id = post.user_id
-        await session.delete(post)
         await session.commit()
+    user_id, status = deleted
+    if status == "pending":
+        pending_counters.post_resolved()
 
     await callback.answer("✅ Пост удалён.", show_alert=True)
     try:
@@ -1288,6 +1214,7 @@ async def ban_yes(callback: CallbackQuery):
             return
         user.is_banned = True
         await session.commit()
+    ban_cache.ban(user_id)
 
     await callback.answer("✅ Пользователь забанен.", show_alert=True)
     try:
@@ -1307,6 +1234,7 @@ async def unban_yes(callback: CallbackQuery):
             return
         user.is_banned = False
         await session.commit()
+    ban_cache.unban(user_id)
 
     await callback.answer("✅ Пользователь разбанен.", show_alert=True)
     try:
@@ -1330,66 +1258,17 @@ async def confirm_approve_all(callback: CallbackQuery):
 @router.callback_query(F.data == "approve_all_yes")
 @moderator_only
 async def approve_all_yes(callback: CallbackQuery):
-    # Реализуем массовое одобрение (взято из существующей логики)
-    bot = callback.bot
-    approved = 0
-    failed = 0
-
-    async for session in get_db():
-        pending_posts = (await session.scalars(select(Post).filter(Post.status == "pending").order_by(Post.created_at.asc()))).all()
-        for post in pending_posts:
-            try:
-                if post.media_file_id:
-                    try:
-                        sent_message = await bot.send_photo(
-                            CHANNEL_ID,
-                            post.media_file_id,
-                            caption=post.content,
-                        )
-                    except Exception:
-                        sent_message = await bot.send_document(
-                            CHANNEL_ID,
-                            post.media_file_id,
-                            caption=post.content,
-                        )
-                else:
-                    sent_message = await bot.send_message(
-                        CHANNEL_ID,
-                        post.content,
-                    )
-
-                post.channel_message_id = sent_message.message_id
-                post.status = "approved"
-                post.moderated_at = datetime.utcnow()
-                post.moderator_id = callback.from_user.id
-                await session.commit()
-
-                try:
-                    await bot.send_message(post.user_id, POST_APPROVED_MESSAGE)
-                except Exception:
-                    pass
-
-                approved += 1
-            except Exception as e:
-                logger.error(f"Ошибка при массовом одобрении поста {post.post_id}: {e}")
-                failed += 1
-
-    await callback.answer(f"✅ Одобрено: {approved}\n❌ Ошибок: {failed}", show_alert=True)
-    try:
-        await callback.message.edit_text((callback.message.text or "") + f"\n\n✅ Массово одобрено: {approved}, ❌ Ошибок: {failed}", reply_markup=None)
-    except Exception:
-        pass
+    await start_mass_approval(callback)
 
 
 @router.callback_query(F.data == "moderator_menu")
 @moderator_only
 async def moderator_menu(callback: CallbackQuery):
     """Вернуться в главное меню модератора"""
-    async for session in get_db():
-        pending_posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
-        pending_posts = pending_posts or 0
-        pending_requests = await session.scalar(select(func.count(ChatJoinRequest.id)).filter(ChatJoinRequest.status == "pending", ChatJoinRequest.chat_id == int(CHANNEL_ID)))
-        pending_requests = pending_requests or 0
+    # Счётчики поддерживаются инкрементально — без COUNT(*) по таблицам (кроме режима WORKERS > 1)
+    await pending_counters.refresh()
+    pending_posts = pending_counters.pending_posts
+    pending_requests = pending_counters.pending_requests(CHANNEL_ID)
 
     is_owner_user = callback.from_user.id in OWNER_IDS
     kb = get_moderator_main_keyboard(pending_posts=pending_posts, pending_requests=pending_requests, is_owner=is_owner_user)
@@ -1414,11 +1293,10 @@ async def moderator_menu(callback: CallbackQuery):
 @moderator_only
 async def moderator_refresh(callback: CallbackQuery):
     """Обновить панель модератора"""
-    async for session in get_db():
-        pending_posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
-        pending_posts = pending_posts or 0
-        pending_requests = await session.scalar(select(func.count(ChatJoinRequest.id)).filter(ChatJoinRequest.status == "pending", ChatJoinRequest.chat_id == int(CHANNEL_ID)))
-        pending_requests = pending_requests or 0
+    # Счётчики поддерживаются инкрементально — без COUNT(*) по таблицам (кроме режима WORKERS > 1)
+    await pending_counters.refresh()
+    pending_posts = pending_counters.pending_posts
+    pending_requests = pending_counters.pending_requests(CHANNEL_ID)
 
     is_owner_user = callback.from_user.id in OWNER_IDS
     kb = get_moderator_main_keyboard(pending_posts=pending_posts, pending_requests=pending_requests, is_owner=is_owner_user)
@@ -1442,46 +1320,12 @@ async def moderator_refresh(callback: CallbackQuery):
 async def moderator_stats_callback(callback: CallbackQuery):
     """Показать статистику постов, пользователей и активность модераторов"""
     is_owner_user = callback.from_user.id in OWNER_IDS
-    async for session in get_db():
-        # Статистика по постам
-        total_posts = await session.scalar(select(func.count(Post.post_id)))
-        pending_posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
-        approved_posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "approved"))
-        rejected_posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "rejected"))
-
-        # Статистика по пользователям
-        total_users = await session.scalar(select(func.count(User.user_id)))
-        banned_users = await session.scalar(select(func.count(User.user_id)).filter(User.is_banned == True))
-
-        # Статистика по заявкам
-        total_requests = await session.scalar(select(func.count(ChatJoinRequest.id)))
-        pending_requests = await session.scalar(select(func.count(ChatJoinRequest.id)).filter(ChatJoinRequest.status == "pending"))
-        approved_requests = await session.scalar(select(func.count(ChatJoinRequest.id)).filter(ChatJoinRequest.status == "approved"))
-        rejected_requests = await session.scalar(select(func.count(ChatJoinRequest.id)).filter(ChatJoinRequest.status == "rejected"))
-
-        recent_requests = (
-            await session.scalars(
-                select(ChatJoinRequest)
-                .filter(ChatJoinRequest.status != "pending")
-                .order_by(ChatJoinRequest.handled_at.desc())
-                .limit(5)
-            )
-        ).all()
-
-        moderator_activity = (
-            await session.execute(
-                select(
-                    ChatJoinRequest.moderator_id,
-                    func.count().label("total"),
-                    func.sum(case((ChatJoinRequest.status == "approved", 1), else_=0)).label("approved"),
-                    func.sum(case((ChatJoinRequest.status == "rejected", 1), else_=0)).label("rejected"),
-                )
-                .filter(ChatJoinRequest.status != "pending", ChatJoinRequest.moderator_id.isnot(None))
-                .group_by(ChatJoinRequest.moderator_id)
-                .order_by(func.count().desc())
-                .limit(5)
-            )
-        ).all()
+    # Один агрегирующий запрос на таблицу; снимок переиспользуется STATS_CACHE_TTL секунд
+    stats = await stats_cache.get()
+    posts = stats.posts_by_status
+    requests = stats.requests_by_status
+    recent_requests = stats.recent_requests
+    moderator_activity = stats.moderator_activity
 
     profiles = await get_moderator_profiles()
     profiles_map = {p["id"]: p for p in profiles}
@@ -1495,10 +1339,10 @@ async def moderator_stats_callback(callback: CallbackQuery):
         mods_section += "— пока пусто\n"
 
     requests_section = f"""📝 *Заявки:*
-├ Всего: *{total_requests or 0}*
-├ ⏳ В ожидании: *{pending_requests or 0}*
-├ ✅ Одобрено: *{approved_requests or 0}*
-└ ❌ Отклонено: *{rejected_requests or 0}*"""
+├ Всего: *{stats.total_requests}*
+├ ⏳ В ожидании: *{requests.get("pending", 0)}*
+├ ✅ Одобрено: *{requests.get("approved", 0)}*
+└ ❌ Отклонено: *{requests.get("rejected", 0)}*"""
 
     owner_section = ""
     if is_owner_user:
@@ -1548,14 +1392,14 @@ async def moderator_stats_callback(callback: CallbackQuery):
     stats_text = f"""📊 *Статистика*
 
 📄 *Посты:*
-├ Всего: *{total_posts or 0}*
-├ ⏳ На модерации: *{pending_posts or 0}*
-├ ✅ Одобрено: *{approved_posts or 0}*
-└ ❌ Отклонено: *{rejected_posts or 0}*
+├ Всего: *{stats.total_posts}*
+├ ⏳ На модерации: *{posts.get("pending", 0)}*
+├ ✅ Одобрено: *{posts.get("approved", 0)}*
+└ ❌ Отклонено: *{posts.get("rejected", 0)}*
 
 👥 *Пользователи:*
-├ Всего: *{total_users or 0}*
-└ 🚫 Забанено: *{banned_users or 0}*
+├ Всего: *{stats.total_users}*
+└ 🚫 Забанено: *{stats.banned_users}*
 
 {requests_section}
 
@@ -2,6 +2,7 @@
 Обработчики платежей
 """
 import logging
+import time
 
 from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
@@ -9,8 +10,9 @@ from aiogram.types import CallbackQuery, LabeledPrice, Message, PreCheckoutQuery
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
-from database.db import create_payment, get_db, get_or_create_user
+from database.db import get_db, record_payment
 from states.states import PostStates
+from utils.payload import decode_invoice_payload, encode_invoice_payload
 from utils.texts import PAYMENT_ERROR_MESSAGE, PAYMENT_SUCCESS_MESSAGE
 
 logger = logging.getLogger(__name__)
@@ -45,9 +47,8 @@ async def process_pay_stars(callback: CallbackQuery, state: FSMContext):
     
     try:
         # Создаем invoice через sendInvoice (правильный способ для Telegram Stars)
-        # Payload должен быть уникальным для каждого платежа
-        import time
-        payload = f"post_{post_type}_{callback.from_user.id}_{int(time.time())}"
+        # Payload должен быть уникальным для каждого платежа и несёт всё для зачисления
+        payload = encode_invoice_payload(post_type, callback.from_user.id, amount, int(time.time()))
         
         # Для Telegram Stars (XTR) цена указывается напрямую в Stars
         # НЕ нужно умножать на 100, как для обычных валют
@@ -85,77 +86,58 @@ async def process_pay_stripe(callback: CallbackQuery, state: FSMContext):
 
 @router.message(lambda m: m.successful_payment is not None)
 async def process_successful_payment(message: Message, state: FSMContext):
-    """Обработка успешной оплаты"""
+    """Обработка успешной оплаты.
+
+    Telegram может доставить successful_payment повторно (например, после
+    перезапуска бота); платёж зачисляется один раз на telegram_payment_charge_id.
+    """
     payment: SuccessfulPayment = message.successful_payment
-    
-    # Получаем данные из состояния (если есть)
-    data = await state.get_data()
-    post_type = data.get("post_type")
-    amount = data.get("amount")
-    payment_method = data.get("payment_method", "stars")
-    
-    # Если нет в состоянии, пытаемся определить из payload
-    # Формат payload: "post_{post_type}_{user_id}_{timestamp}"
-    if not post_type:
-        payload = payment.invoice_payload
-        if payload and payload.startswith("post_"):
-            parts = payload.split("_")
-            if len(parts) >= 2:
-                post_type = parts[1]  # ad35 или offtopic50
-                if not amount:
-                    # Определяем amount в зависимости от валюты
-                    if payment.currency == "XTR":
-                        # Для Telegram Stars total_amount уже в Stars
-                        amount = int(payment.total_amount)
-                    else:
-                        # Для других валют (UAH и т.д.) total_amount в минимальных единицах (копейки)
-                        amount = int(payment.total_amount / 100)
-    
+
+    # Тип поста берём из payload счёта, а если он старого/чужого формата — из состояния
+    invoice = decode_invoice_payload(payment.invoice_payload)
+    if invoice is not None:
+        post_type = invoice.post_type
+    else:
+        post_type = (await state.get_data()).get("post_type")
+
     if not post_type:
         logger.error(f"Не удалось определить тип поста из платежа. Payload: {payment.invoice_payload}")
         await message.answer(
             "❌ Ошибка обработки платежа. Обратитесь к администратору."
         )
         return
-    
-    # Определяем payment_method по валюте, если не указан
-    if not payment_method or payment_method == "stars":
-        if payment.currency == "XTR":
-            payment_method = "stars"
-        else:
-            payment_method = "card"
-    
-    # Сохраняем платеж в БД
+
+    if payment.currency == "XTR":
+        # Для Telegram Stars total_amount уже в Stars
+        payment_method = "stars"
+        payment_amount = float(payment.total_amount)
+    else:
+        # Для других валют (UAH и т.д.) total_amount в минимальных единицах (копейки)
+        payment_method = "card"
+        payment_amount = payment.total_amount / 100
+
     async for session in get_db():
-        await get_or_create_user(
+        payment_id = await record_payment(
             session,
             message.from_user.id,
             message.from_user.username,
             message.from_user.first_name,
-        )
-        
-        # Определяем сумму для сохранения
-        if payment.currency == "XTR":
-            # Для Stars уже в Stars
-            payment_amount = float(amount or payment.total_amount)
-        else:
-            # Для других валют делим на 100 (из копеек в основную валюту)
-            payment_amount = float(amount or payment.total_amount / 100)
-        
-        await create_payment(
-            session,
-            message.from_user.id,
             post_type,
             payment_amount,
             payment.currency,
             payment_method,
             payment.telegram_payment_charge_id,
         )
-        
-        logger.info(
-            f"Платеж успешно обработан: user_id={message.from_user.id}, "
-            f"post_type={post_type}, amount={amount}, charge_id={payment.telegram_payment_charge_id}"
-        )
+
+    if payment_id is None:
+        # Состояние и ответ уже выданы при первой доставке; повторно не даём лишний пост
+        logger.info(f"Повторная доставка платежа, пропускаем: charge_id={payment.telegram_payment_charge_id}")
+        return
+
+    logger.info(
+        f"Платеж успешно обработан: user_id={message.from_user.id}, "
+        f"post_type={post_type}, amount={payment_amount}, charge_id={payment.telegram_payment_charge_id}"
+    )
     
     # Устанавливаем состояние для получения поста
     if post_type == "ad35":
@@ -175,7 +157,7 @@ async def process_pre_checkout(pre_checkout_query: PreCheckoutQuery):
     payload = pre_checkout_query.invoice_payload
     
     # Проверяем, что это наш платеж
-    if payload and payload.startswith("post_"):
+    if decode_invoice_payload(payload) is not None:
         # Подтверждаем платеж
         await pre_checkout_query.answer(ok=True)
         logger.info(f"Pre-checkout подтвержден для payload: {payload}")
@@ -8,19 +8,22 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, select
 
-from config import CHANNEL_ID, MODERATOR_IDS, OWNER_IDS
-from database.db import get_db, get_or_create_user, create_post
-from database.models import User, Post, Moderator
+from config import CHANNEL_ID, OWNER_IDS
+from database.db import get_db, get_or_create_user, create_submission
+from database.models import User, Post
 from keyboards.moderator_kb import get_moderation_keyboard
 from keyboards.user_kb import (
     get_main_menu,
     get_main_reply_keyboard,
     get_payment_menu,
 )
+from services.cache import ban_cache, moderator_roster
+from services.counters import pending_counters
 from states.states import PostStates
-from utils.helpers import format_post_for_moderator, is_moderator
+from utils.background import spawn
+from utils.fanout import fan_out
+from utils.helpers import extract_media, format_post_for_moderator, is_moderator, send_post_content
 from utils.texts import (
     ACTION_CANCELLED_MESSAGE,
     HELP_MESSAGE,
@@ -75,12 +78,10 @@ async def cmd_cancel(message: Message, state: FSMContext):
 @router.message(Command("send"))
 async def cmd_send(message: Message, state: FSMContext):
     """Обработчик команды /send (бесплатный пост)"""
-    async for session in get_db():
-        user = await session.get(User, message.from_user.id)
-        if user and user.is_banned:
-            await message.answer(USER_BANNED_MESSAGE)
-            return
-    
+    if ban_cache.is_banned(message.from_user.id):
+        await message.answer(USER_BANNED_MESSAGE)
+        return
+
     await message.answer(REQUEST_POST_MESSAGE, reply_markup=None)
     await state.set_state(PostStates.waiting_free_post)
 
@@ -88,12 +89,10 @@ async def cmd_send(message: Message, state: FSMContext):
 @router.message(lambda m: m.text == "📝 Отправить бесплатный пост")
 async def process_send_free_button(message: Message, state: FSMContext):
     """Обработчик кнопки 'Отправить бесплатный пост'"""
-    async for session in get_db():
-        user = await session.get(User, message.from_user.id)
-        if user and user.is_banned:
-            await message.answer(USER_BANNED_MESSAGE)
-            return
-    
+    if ban_cache.is_banned(message.from_user.id):
+        await message.answer(USER_BANNED_MESSAGE)
+        return
+
     await message.answer(REQUEST_POST_MESSAGE, reply_markup=None)
     await state.set_state(PostStates.waiting_free_post)
 
@@ -101,12 +100,10 @@ async def process_send_free_button(message: Message, state: FSMContext):
 @router.message(Command("send35"))
 async def cmd_send35(message: Message, state: FSMContext):
     """Обработчик команды /send35 (пост про подики/жидкости - временно бесплатно)"""
-    async for session in get_db():
-        user = await session.get(User, message.from_user.id)
-        if user and user.is_banned:
-            await message.answer(USER_BANNED_MESSAGE)
-            return
-    
+    if ban_cache.is_banned(message.from_user.id):
+        await message.answer(USER_BANNED_MESSAGE)
+        return
+
     await message.answer(REQUEST_POST_MESSAGE, reply_markup=None)
     await state.set_state(PostStates.waiting_ad_post)
 
@@ -114,12 +111,10 @@ async def cmd_send35(message: Message, state: FSMContext):
 @router.message(lambda m: m.text == "💰 Отправить пост про подики, жидкости")
 async def process_send_35_button(message: Message, state: FSMContext):
     """Обработчик кнопки 'Отправить пост про подики, жидкости' (временно бесплатно)"""
-    async for session in get_db():
-        user = await session.get(User, message.from_user.id)
-        if user and user.is_banned:
-            await message.answer(USER_BANNED_MESSAGE)
-            return
-    
+    if ban_cache.is_banned(message.from_user.id):
+        await message.answer(USER_BANNED_MESSAGE)
+        return
+
     await message.answer(REQUEST_POST_MESSAGE, reply_markup=None)
     await state.set_state(PostStates.waiting_ad_post)
 
@@ -127,12 +122,10 @@ async def process_send_35_button(message: Message, state: FSMContext):
 @router.message(Command("send50"))
 async def cmd_send50(message: Message, state: FSMContext):
     """Обработчик команды /send50 (пост не по тематике)"""
-    async for session in get_db():
-        user = await session.get(User, message.from_user.id)
-        if user and user.is_banned:
-            await message.answer(USER_BANNED_MESSAGE)
-            return
-    
+    if ban_cache.is_banned(message.from_user.id):
+        await message.answer(USER_BANNED_MESSAGE)
+        return
+
     await message.answer(
         "💰 Пост не по тематике\n\nСтоимость: 50 грн или 50 ⭐ Telegram Stars\n\nВыбери способ оплаты:",
         reply_markup=get_payment_menu(50),
@@ -143,12 +136,10 @@ async def cmd_send50(message: Message, state: FSMContext):
 @router.message(lambda m: m.text == "🎯 Отправить пост не по тематике")
 async def process_send_50_button(message: Message, state: FSMContext):
     """Обработчик кнопки 'Отправить пост не по тематике'"""
-    async for session in get_db():
-        user = await session.get(User, message.from_user.id)
-        if user and user.is_banned:
-            await message.answer(USER_BANNED_MESSAGE)
-            return
-    
+    if ban_cache.is_banned(message.from_user.id):
+        await message.answer(USER_BANNED_MESSAGE)
+        return
+
     await message.answer(
         "💰 Пост не по тематике\n\nСтоимость: 50 грн или 50 ⭐ Telegram Stars\n\nВыбери способ оплаты:",
         reply_markup=get_payment_menu(50),
@@ -159,12 +150,10 @@ async def process_send_50_button(message: Message, state: FSMContext):
 @router.callback_query(F.data == "send_free")
 async def process_send_free(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки 'Отправить бесплатный пост'"""
-    async for session in get_db():
-        user = await session.get(User, callback.from_user.id)
-        if user and user.is_banned:
-            await callback.answer(USER_BANNED_MESSAGE, show_alert=True)
-            return
-    
+    if ban_cache.is_banned(callback.from_user.id):
+        await callback.answer(USER_BANNED_MESSAGE, show_alert=True)
+        return
+
     await callback.message.edit_text(REQUEST_POST_MESSAGE)
     await state.set_state(PostStates.waiting_free_post)
     await callback.answer()
@@ -173,12 +162,10 @@ async def process_send_free(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "send_35")
 async def process_send_35(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки 'Пост про подики/жидкости' (временно бесплатно)"""
-    async for session in get_db():
-        user = await session.get(User, callback.from_user.id)
-        if user and user.is_banned:
-            await callback.answer(USER_BANNED_MESSAGE, show_alert=True)
-            return
-    
+    if ban_cache.is_banned(callback.from_user.id):
+        await callback.answer(USER_BANNED_MESSAGE, show_alert=True)
+        return
+
     await callback.message.edit_text(REQUEST_POST_MESSAGE)
     await state.set_state(PostStates.waiting_ad_post)
     await callback.answer()
@@ -187,12 +174,10 @@ async def process_send_35(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "send_50")
 async def process_send_50(callback: CallbackQuery, state: FSMContext):
     """Обработчик кнопки 'Пост не по тематике (50 грн)'"""
-    async for session in get_db():
-        user = await session.get(User, callback.from_user.id)
-        if user and user.is_banned:
-            await callback.answer(USER_BANNED_MESSAGE, show_alert=True)
-            return
-    
+    if ban_cache.is_banned(callback.from_user.id):
+        await callback.answer(USER_BANNED_MESSAGE, show_alert=True)
+        return
+
     await callback.message.edit_text(
         "💰 Пост не по тематике\n\nСтоимость: 50 грн или 50 ⭐ Telegram Stars\n\nВыбери способ оплаты:",
         reply_markup=get_payment_menu(50),
@@ -233,317 +218,99 @@ async def process_cancel_action(callback: CallbackQuery, state: FSMContext):
 
 
 # Обработка постов
-@router.message(PostStates.waiting_free_post)
-async def receive_free_post(message: Message, state: FSMContext):
-    """Обработка бесплатного поста"""
-    bot = message.bot
-    
+async def deliver_post_to_moderators(
+    bot,
+    post: Post,
+    user: User,
+    recipient_ids: set[int],
+    include_approve_all: bool,
+):
+    """Разослать пост всем модераторам параллельно; если не дошло никому — уведомить владельцев"""
+    text = format_post_for_moderator(post, user)
+    kb = get_moderation_keyboard(post.post_id, user.user_id, include_approve_all=include_approve_all)
+
+    result = await fan_out(recipient_ids, lambda chat_id: send_post_content(bot, chat_id, post, text, kb))
+    if result.any_delivered:
+        return result
+
+    logger.error("Не удалось отправить пост ни одному модератору/владельцу!")
+    # Уведомим владельцев вручную, чтобы они могли принять меры
+    await fan_out(
+        OWNER_IDS,
+        lambda owner_id: bot.send_message(
+            owner_id,
+            f"⚠️ Не удалось доставить пост модераторам, посмотри вручную:\n\n{text}",
+            reply_markup=kb,
+        ),
+    )
+    return result
+
+
+async def submit_post(message: Message, state: FSMContext, post_type: str):
+    """Единый конвейер приёма поста: проверка, медиа, одна транзакция в БД, передача на доставку"""
+    if ban_cache.is_banned(message.from_user.id):
+        await message.answer(USER_BANNED_MESSAGE)
+        await state.clear()
+        return
+
     content = message.text or message.caption or ""
     if not content.strip():
         await message.answer("❌ Пост не может быть пустым. Отправь текст.")
         return
-    
-    media_file_id = None
-    if message.photo:
-        media_file_id = message.photo[-1].file_id
-    elif message.video:
-        media_file_id = message.video.file_id
-    elif message.document:
-        media_file_id = message.document.file_id
-    
-    # Сохраняем в БД
+
+    media_file_id, media_kind = extract_media(message)
+
     async for session in get_db():
-        user = await get_or_create_user(
+        user, post = await create_submission(
             session,
             message.from_user.id,
             message.from_user.username,
             message.from_user.first_name,
+            post_type,
+            content,
+            media_file_id,
+            media_kind,
+            source_chat_id=message.chat.id,
+            source_message_id=message.message_id,
         )
-        
-        if user.is_banned:
+        if post is None:
             await message.answer(USER_BANNED_MESSAGE)
             await state.clear()
             return
-        
-        post = await create_post(
-            session,
-            message.from_user.id,
-            "free",
-            content,
-            media_file_id,
-        )
-        
-        # Проверим, сколько постов в ожидании модерации, и добавим кнопку 'Одобрить всех' при необходимости
-        pending_count = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
-        include_approve_all = (pending_count or 0) > 1
-
-        # Собираем всех получателей: env-модераторы + модераторы из БД + владельцы
-        db_mod_ids = (await session.scalars(select(Moderator.moderator_id))).all()
-        recipient_ids = set(MODERATOR_IDS) | set(db_mod_ids) | set(OWNER_IDS)
-        if not recipient_ids:
-            logger.warning("Ни одна роль модератора не настроена: ни env, ни в БД. Уведомляю владельцев (OWNER_IDS).")
-            recipient_ids = set(OWNER_IDS)
-        sent_to_moderators = False
-        for moderator_id in recipient_ids:
-            try:
-                if media_file_id:
-                    if message.photo:
-                        await bot.send_photo(
-                            moderator_id,
-                            media_file_id,
-                            caption=format_post_for_moderator(post, user),
-                            reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                        )
-                        sent_to_moderators = True
-                    elif message.video:
-                        await bot.send_video(
-                            moderator_id,
-                            media_file_id,
-                            caption=format_post_for_moderator(post, user),
-                            reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                        )
-                        sent_to_moderators = True
-                    else:
-                        await bot.send_document(
-                            moderator_id,
-                            media_file_id,
-                            caption=format_post_for_moderator(post, user),
-                            reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                        )
-                        sent_to_moderators = True
-                else:
-                    await bot.send_message(
-                        moderator_id,
-                        format_post_for_moderator(post, user),
-                        reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                    )
-                    sent_to_moderators = True
-            except Exception as e:
-                logger.warning(f"Не удалось отправить пост модератору {moderator_id}: {e}")
-        
-        if not sent_to_moderators:
-            logger.error("Не удалось отправить пост ни одному модератору/владельцу!")
-            # Уведомим владельцев вручную, чтобы они могли принять меры
-            for owner_id in OWNER_IDS:
-                try:
-                    await bot.send_message(
-                        owner_id,
-                        f"⚠️ Не удалось доставить пост модераторам, посмотри вручную:\n\n{format_post_for_moderator(post, user)}",
-                        reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                    )
-                except Exception as e:
-                    logger.warning(f"Не удалось отправить уведомление владельцу {owner_id}: {e}")
-    
+
+    # Проверим, сколько постов в ожидании модерации, и добавим кнопку 'Одобрить всех' при необходимости
+    pending_counters.post_created()
+    await pending_counters.refresh()
+    include_approve_all = pending_counters.pending_posts > 1
+
+    # Получатели: env-модераторы + модераторы из БД + владельцы (из кэша, без запроса к БД)
+    recipient_ids = moderator_roster.recipients()
+    if not recipient_ids:
+        logger.warning("Ни одна роль модератора не настроена: ни env, ни в БД, ни владельцы. Пост никому не отправлен.")
+
+    # Рассылаем только после commit и в фоне: ответ пользователю не ждёт самого медленного модератора
+    spawn(
+        deliver_post_to_moderators(message.bot, post, user, recipient_ids, include_approve_all),
+        name=f"deliver_post_{post.post_id}",
+    )
+
     await message.answer(POST_SENT_MESSAGE)
     await state.clear()
 
 
+@router.message(PostStates.waiting_free_post)
+async def receive_free_post(message: Message, state: FSMContext):
+    """Обработка бесплатного поста"""
+    await submit_post(message, state, "free")
+
+
 @router.message(PostStates.waiting_ad_post)
 async def receive_ad_post(message: Message, state: FSMContext):
     """Обработка рекламного поста после оплаты"""
-    bot = message.bot
-    
-    content = message.text or message.caption or ""
-    if not content.strip():
-        await message.answer("❌ Пост не может быть пустым. Отправь текст.")
-        return
-    
-    media_file_id = None
-    if message.photo:
-        media_file_id = message.photo[-1].file_id
-    elif message.video:
-        media_file_id = message.video.file_id
-    elif message.document:
-        media_file_id = message.document.file_id
-    
-    # Сохраняем в БД
-    async for session in get_db():
-        user = await get_or_create_user(
-            session,
-            message.from_user.id,
-            message.from_user.username,
-            message.from_user.first_name,
-        )
-        
-        if user.is_banned:
-            await message.answer(USER_BANNED_MESSAGE)
-            await state.clear()
-            return
-        
-        post = await create_post(
-            session,
-            message.from_user.id,
-            "ad35",
-            content,
-            media_file_id,
-        )
-        
-        # Проверим, сколько постов в ожидании модерации, и добавим кнопку 'Одобрить всех' при необходимости
-        pending_count = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
-        include_approve_all = (pending_count or 0) > 1
-
-        # Собираем всех получателей: env-модераторы + модераторы из БД + владельцы
-        db_mod_ids = (await session.scalars(select(Moderator.moderator_id))).all()
-        recipient_ids = set(MODERATOR_IDS) | set(db_mod_ids) | set(OWNER_IDS)
-        if not recipient_ids:
-            logger.warning("Ни одна роль модератора не настроена: ни env, ни в БД. Уведомляю владельцев (OWNER_IDS).")
-            recipient_ids = set(OWNER_IDS)
-        sent_to_moderators = False
-        for moderator_id in recipient_ids:
-            try:
-                if media_file_id:
-                    if message.photo:
-                        await bot.send_photo(
-                            moderator_id,
-                            media_file_id,
-                            caption=format_post_for_moderator(post, user),
-                            reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                        )
-                        sent_to_moderators = True
-                    elif message.video:
-                        await bot.send_video(
-                            moderator_id,
-                            media_file_id,
-                            caption=format_post_for_moderator(post, user),
-                            reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                        )
-                        sent_to_moderators = True
-                    else:
-                        await bot.send_document(
-                            moderator_id,
-                            media_file_id,
-                            caption=format_post_for_moderator(post, user),
-                            reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                        )
-                        sent_to_moderators = True
-                else:
-                    await bot.send_message(
-                        moderator_id,
-                        format_post_for_moderator(post, user),
-                        reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                    )
-                    sent_to_moderators = True
-            except Exception as e:
-                logger.warning(f"Не удалось отправить пост модератору {moderator_id}: {e}")
-        
-        if not sent_to_moderators:
-            logger.error("Не удалось отправить пост ни одному модератору/владельцу!")
-            # Уведомим владельцев вручную, чтобы они могли принять меры
-            for owner_id in OWNER_IDS:
-                try:
-                    await bot.send_message(
-                        owner_id,
-                        f"⚠️ Не удалось доставить пост модераторам, посмотри вручную:\n\n{format_post_for_moderator(post, user)}",
-                        reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                    )
-                except Exception as e:
-                    logger.warning(f"Не удалось отправить уведомление владельцу {owner_id}: {e}")
-    
-    await message.answer(POST_SENT_MESSAGE)
-    await state.clear()
+    await submit_post(message, state, "ad35")
 
 
 @router.message(PostStates.waiting_offtopic_post)
 async def receive_offtopic_post(message: Message, state: FSMContext):
     """Обработка поста не по тематике после оплаты"""
-    bot = message.bot
-    
-    content = message.text or message.caption or ""
-    if not content.strip():
-        await message.answer("❌ Пост не может быть пустым. Отправь текст.")
-        return
-    
-    media_file_id = None
-    if message.photo:
-        media_file_id = message.photo[-1].file_id
-    elif message.video:
-        media_file_id = message.video.file_id
-    elif message.document:
-        media_file_id = message.document.file_id
-    
-    # Сохраняем в БД
-    async for session in get_db():
-        user = await get_or_create_user(
-            session,
-            message.from_user.id,
-            message.from_user.username,
-            message.from_user.first_name,
-        )
-        
-        if user.is_banned:
-            await message.answer(USER_BANNED_MESSAGE)
-            await state.clear()
-            return
-        
-        post = await create_post(
-            session,
-            message.from_user.id,
-            "offtopic50",
-            content,
-            media_file_id,
-        )
-        
-        # Проверим, сколько постов в ожидании модерации, и добавим кнопку 'Одобрить всех' при необходимости
-        pending_count = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
-        include_approve_all = (pending_count or 0) > 1
-
-        # Собираем всех получателей: env-модераторы + модераторы из БД + владельцы
-        db_mod_ids = (await session.scalars(select(Moderator.moderator_id))).all()
-        recipient_ids = set(MODERATOR_IDS) | set(db_mod_ids) | set(OWNER_IDS)
-        if not recipient_ids:
-            logger.warning("Ни одна роль модератора не настроена: ни env, ни в БД. Уведомляю владельцев (OWNER_IDS).")
-            recipient_ids = set(OWNER_IDS)
-        sent_to_moderators = False
-        for moderator_id in recipient_ids:
-            try:
-                if media_file_id:
-                    if message.photo:
-                        await bot.send_photo(
-                            moderator_id,
-                            media_file_id,
-                            caption=format_post_for_moderator(post, user),
-                            reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                        )
-                        sent_to_moderators = True
-                    elif message.video:
-                        await bot.send_video(
-                            moderator_id,
-                            media_file_id,
-                            caption=format_post_for_moderator(post, user),
-                            reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                        )
-                        sent_to_moderators = True
-                    else:
-                        await bot.send_document(
-                            moderator_id,
-                            media_file_id,
-                            caption=format_post_for_moderator(post, user),
-                            reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                        )
-                        sent_to_moderators = True
-                else:
-                    await bot.send_message(
-                        moderator_id,
-                        format_post_for_moderator(post, user),
-                        reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                    )
-                    sent_to_moderators = True
-            except Exception as e:
-                logger.warning(f"Не удалось отправить пост модератору {moderator_id}: {e}")
-        
-        if not sent_to_moderators:
-            logger.error("Не удалось отправить пост ни одному модератору/владельцу!")
-            # Уведомим владельцев вручную, чтобы они могли принять меры
-            for owner_id in OWNER_IDS:
-                try:
-                    await bot.send_message(
-                        owner_id,
-                        f"⚠️ Не удалось доставить пост модераторам, посмотри вручную:\n\n{format_post_for_moderator(post, user)}",
-                        reply_markup=get_moderation_keyboard(post.post_id, message.from_user.id, include_approve_all=include_approve_all),
-                    )
-                except Exception as e:
-                    logger.warning(f"Не удалось отправить уведомление владельцу {owner_id}: {e}")
-    
-    await message.answer(POST_SENT_MESSAGE)
-    await state.clear()
-
+    await submit_post(message, state, "offtopic50")
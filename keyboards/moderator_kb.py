@@ -1,11 +1,40 @@
 """
 Клавиатуры для модераторов
 """
+from datetime import datetime, timedelta
+from typing import Optional
+
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
+_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_page_cursor(position: int, direction: str, created_at: Optional[datetime], post_id: int) -> str:
+    """callback_data для перехода к соседнему посту очереди.
+
+    Формат: moderator_page_{номер}_{n|p}_{created_at в мкс}_{post_id}. Номер нужен
+    только для подписи «📄 N/M», сам переход делается по курсору (created_at, post_id).
+    """
+    micros = (created_at - _EPOCH) // timedelta(microseconds=1) if created_at else 0
+    return f"moderator_page_{position}_{direction[0]}_{micros}_{post_id}"
+
+
+def decode_page_cursor(data: str) -> tuple[int, str, Optional[tuple[datetime, int]]]:
+    """Разобрать callback_data страницы: (номер, "next"/"prev", курсор или None).
 
-def get_moderation_keyboard(post_id: int, user_id: int, include_approve_all: bool = False, offset: int = 0, total: int = 0, is_owner: bool = False) -> InlineKeyboardMarkup:
-    """Клавиатура для модерации поста с пагинацией"""
+    Короткая форма moderator_page_0 (кнопки «Назад к модерации») — начало очереди.
+    """
+    parts = data.split("_")[2:]
+    position = int(parts[0])
+    if len(parts) == 1:
+        return 0, "next", None
+    direction = "prev" if parts[1] == "p" else "next"
+    cursor = (_EPOCH + timedelta(microseconds=int(parts[2])), int(parts[3]))
+    return position, direction, cursor
+
+
+def get_moderation_keyboard(post_id: int, user_id: int, include_approve_all: bool = False, offset: int = 0, total: int = 0, is_owner: bool = False, created_at: Optional[datetime] = None) -> InlineKeyboardMarkup:
+    """Клавиатура для модерации поста с пагинацией (offset — номер поста для подписи)"""
     keyboard = [
         [
             InlineKeyboardButton(text="✅ Одобрить", callback_data=f"approve_{post_id}"),
@@ -24,14 +53,14 @@ def get_moderation_keyboard(post_id: int, user_id: int, include_approve_all: boo
     if total and total > 1:
         nav_row = []
         if offset > 0:
-            nav_row.append(InlineKeyboardButton(text="◀️", callback_data=f"moderator_page_{offset - 1}"))
+            nav_row.append(InlineKeyboardButton(text="◀️", callback_data=encode_page_cursor(offset - 1, "prev", created_at, post_id)))
         else:
             nav_row.append(InlineKeyboardButton(text="·", callback_data="noop"))
 
         nav_row.append(InlineKeyboardButton(text=f"📄 {offset + 1}/{total}", callback_data="noop"))
 
         if offset < total - 1:
-            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=f"moderator_page_{offset + 1}"))
+            nav_row.append(InlineKeyboardButton(text="▶️", callback_data=encode_page_cursor(offset + 1, "next", created_at, post_id)))
         else:
             nav_row.append(InlineKeyboardButton(text="·", callback_data="noop"))
 
@@ -50,6 +79,13 @@ def get_moderation_keyboard(post_id: int, user_id: int, include_approve_all: boo
     return InlineKeyboardMarkup(inline_keyboard=keyboard)  
 
 
+def get_mass_approval_keyboard() -> InlineKeyboardMarkup:
+    """Кнопка остановки массового одобрения под сообщением с прогрессом"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⛔ Остановить", callback_data="approve_all_cancel")],
+    ])
+
+
 def get_user_info_keyboard(user_id: int, is_banned: bool = False) -> InlineKeyboardMarkup:
     """Клавиатура с действиями для пользователя"""
     keyboard = []
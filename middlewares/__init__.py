@@ -1,2 +1,17 @@
 # Middleware для будущих расширений
+from .metrics import ApiMetrics, MetricsMiddleware, MetricsRegistry, api_metrics, metrics, metrics_middleware
+from .ratelimit import RateLimiter, rate_limiter
+from .throttling import ThrottlingMiddleware, throttling_middleware
 
+__all__ = [
+    "ApiMetrics",
+    "MetricsMiddleware",
+    "MetricsRegistry",
+    "RateLimiter",
+    "ThrottlingMiddleware",
+    "api_metrics",
+    "metrics",
+    "metrics_middleware",
+    "rate_limiter",
+    "throttling_middleware",
+]
@@ -0,0 +1,259 @@
+"""
+Метрики обработки апдейтов и запросов к Bot API в формате Prometheus
+
+MetricsMiddleware — внешний middleware апдейтов: считает апдейты по типам, время
+обработки по обработчикам (гистограмма) и ошибки. Имя обработчика узнаёт
+внутренний middleware, который aiogram вызывает уже после выбора обработчика, и
+записывает его в контекст апдейта (current_update).
+
+ApiMetrics — middleware сессии бота: время и статус каждого запроса по методам
+API (sendMessage, sendPhoto, approveChatJoinRequest, ...). Подключается после
+лимитера, поэтому меряет сам запрос, а не ожидание в очереди лимитера.
+
+Запросы к БД, выполненные во время апдейта, database.db засчитывает в
+current_queries: по обработчикам копятся число запросов и время в БД, а апдейты
+дольше SLOW_UPDATE_MS попадают в лог сводкой "N запросов, X мс БД".
+
+Всё хранится в памяти процесса и отдаётся текстом на GET /metrics (utils.webhook).
+"""
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject, Update
+
+from config import settings
+from database.db import QueryStats, current_queries
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма Prometheus: счётчики по корзинам, сумма и количество наблюдений"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        total = 0
+        result = []
+        for bound, n in zip((*self.buckets, "+Inf"), self.counts):
+            total += n
+            result.append((str(bound), total))
+        return result
+
+
+class UpdateContext:
+    """Данные обрабатываемого апдейта, доступные всему коду, вызванному из обработчика"""
+
+    __slots__ = ("update_type", "handler")
+
+    def __init__(self):
+        self.update_type: Optional[str] = None
+        self.handler: Optional[str] = None
+
+
+current_update: ContextVar[Optional[UpdateContext]] = ContextVar("current_update", default=None)
+
+
+def _summary(elapsed: float, db: QueryStats) -> str:
+    return f"{elapsed * 1000:.1f} мс, {db.queries} запросов, {db.seconds * 1000:.1f} мс БД"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Счётчики и гистограммы процесса"""
+
+    def __init__(self):
+        self.updates: Dict[str, int] = {}
+        self.handler_latency: Dict[str, Histogram] = {}
+        self.handler_errors: Dict[tuple[str, str], int] = {}
+        self.handler_db_queries: Dict[str, int] = {}
+        self.handler_db_seconds: Dict[str, float] = {}
+        self.api_latency: Dict[str, Histogram] = {}
+        self.api_requests: Dict[tuple[str, str], int] = {}
+        self._snapshots: Dict[str, Callable[[], dict]] = {}
+
+    def register_snapshot(self, name: str, snapshot: Callable[[], dict]) -> None:
+        """Отдавать числовые поля snapshot() как gauge bot_{name}_{поле}"""
+        self._snapshots[name] = snapshot
+
+    def observe_update(
+        self,
+        update_type: str,
+        handler: str,
+        seconds: float,
+        error: Optional[str],
+        db: Optional[QueryStats] = None,
+    ) -> None:
+        self.updates[update_type] = self.updates.get(update_type, 0) + 1
+        histogram = self.handler_latency.get(handler)
+        if histogram is None:
+            histogram = self.handler_latency[handler] = Histogram()
+        histogram.observe(seconds)
+        if db is not None and db.queries:
+            self.handler_db_queries[handler] = self.handler_db_queries.get(handler, 0) + db.queries
+            self.handler_db_seconds[handler] = self.handler_db_seconds.get(handler, 0.0) + db.seconds
+        if error is not None:
+            key = (handler, error)
+            self.handler_errors[key] = self.handler_errors.get(key, 0) + 1
+
+    def observe_api(self, method: str, status: str, seconds: float) -> None:
+        histogram = self.api_latency.get(method)
+        if histogram is None:
+            histogram = self.api_latency[method] = Histogram()
+        histogram.observe(seconds)
+        key = (method, status)
+        self.api_requests[key] = self.api_requests.get(key, 0) + 1
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (text/plain; version=0.0.4)"""
+        lines: list[str] = []
+
+        def counter(name: str, help_text: str, values: dict, labels: tuple[str, ...]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(values.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                label_text = ",".join(f'{label}="{_escape(v)}"' for label, v in zip(labels, key))
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        def histogram(name: str, help_text: str, values: Dict[str, Histogram], label: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, h in sorted(values.items()):
+                label_text = f'{label}="{_escape(key)}"'
+                for bound, total in h.cumulative():
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {total}')
+                lines.append(f"{name}_sum{{{label_text}}} {h.sum}")
+                lines.append(f"{name}_count{{{label_text}}} {h.count}")
+
+        counter("bot_updates_total", "Апдейты по типам", self.updates, ("type",))
+        histogram("bot_handler_duration_seconds", "Время обработки апдейта по обработчикам", self.handler_latency, "handler")
+        counter("bot_handler_errors_total", "Необработанные ошибки обработчиков", self.handler_errors, ("handler", "error"))
+        counter("bot_handler_db_queries_total", "Запросы к БД по обработчикам", self.handler_db_queries, ("handler",))
+        counter("bot_handler_db_seconds_total", "Время запросов к БД по обработчикам", self.handler_db_seconds, ("handler",))
+        histogram("bot_api_request_duration_seconds", "Время запросов к Bot API по методам", self.api_latency, "method")
+        counter("bot_api_requests_total", "Запросы к Bot API по методам и статусам", self.api_requests, ("method", "status"))
+
+        for prefix, snapshot in self._snapshots.items():
+            for field, value in snapshot().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE bot_{prefix}_{field} gauge")
+                    lines.append(f"bot_{prefix}_{field} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: тип, обработчик, время и ошибка каждого апдейта"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    def setup(self, dp: Dispatcher) -> None:
+        dp.update.outer_middleware(self)
+        for name, observer in dp.observers.items():
+            if name not in ("update", "error"):
+                # Внутренние middleware диспетчера срабатывают и для обработчиков вложенных роутеров
+                observer.middleware(self._capture_handler(name))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        context = UpdateContext()
+        db = QueryStats()
+        token = current_update.set(context)
+        db_token = current_queries.set(db)
+        started = time.perf_counter()
+        error = None
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            current_queries.reset(db_token)
+            current_update.reset(token)
+            handler_name = context.handler or "unhandled"
+            self.registry.observe_update(
+                # Тип берём у наблюдателя, который выбрал обработчик: Update.event_type заметно дороже
+                context.update_type or event.event_type,
+                handler_name,
+                elapsed,
+                error,
+                db,
+            )
+            if elapsed * 1000 >= settings.SLOW_UPDATE_MS:
+                logger.warning(f"Медленный апдейт {event.update_id} ({handler_name}): {_summary(elapsed, db)}")
+            elif logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Апдейт {event.update_id} ({handler_name}): {_summary(elapsed, db)}")
+
+    @staticmethod
+    def _capture_handler(update_type: str):
+        async def capture_handler(
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+        ) -> Any:
+            context = current_update.get()
+            if context is not None:
+                context.update_type = update_type
+                context.handler = data["handler"].callback.__name__
+            return await handler(event, data)
+
+        return capture_handler
+
+
+class ApiMetrics(BaseRequestMiddleware):
+    """Middleware сессии бота: время и статус запросов по методам Bot API"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            self.registry.observe_api(method.__api_method__, status, time.perf_counter() - started)
+
+
+# Общий реестр процесса: подключается к диспетчеру и сессии бота в bot.py
+metrics = MetricsRegistry()
+metrics_middleware = MetricsMiddleware(metrics)
+api_metrics = ApiMetrics(metrics)
@@ -0,0 +1,218 @@
+"""
+Ограничение частоты исходящих запросов к Bot API (token bucket)
+
+Telegram ограничивает бота примерно 30 сообщениями в секунду суммарно, одним
+сообщением в секунду в личный чат и ~20 сообщениями в минуту в группу/канал.
+Лимитер ставит каждое новое сообщение (send*/copy*/forward*) в очередь общего
+ведра и ведра конкретного чата. Прочие запросы к чату (правка, удаление, решение
+по заявке) проходят только через общее ведро и не расходуют лимит сообщений
+чата. При 429 лимитер выжидает retry_after и повторяет запрос.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ведро токенов с резервированием: очередь ожидающих обслуживается по порядку"""
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Занять токен и вернуть, сколько секунд нужно подождать до его появления"""
+        self._refill(time.monotonic())
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self) -> None:
+        """Вернуть токен, если ожидание было отменено"""
+        self._tokens = min(self.capacity, self._tokens + 1)
+
+    def pause(self, seconds: float) -> None:
+        """Заблокировать ведро на `seconds` (после ответа 429)"""
+        self._refill(time.monotonic())
+        # Следующий токен появится ровно через `seconds`
+        self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+    def is_idle(self, now: float) -> bool:
+        """Ведро успело наполниться — его можно удалить без потери состояния"""
+        return self._tokens + (now - self._updated) * self.rate >= self.capacity
+
+
+@dataclass
+class RateLimiterStats:
+    """Счётчики лимитера"""
+    requests: int = 0
+    throttled: int = 0
+    wait_seconds: float = 0.0
+    retries: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+
+
+# Методы, которые создают новое сообщение в чате: на них действуют лимиты чата
+_MESSAGE_PREFIXES = ("send", "copy", "forward")
+_NOT_MESSAGES = {"sendChatAction"}
+
+
+def produces_message(method: TelegramMethod) -> bool:
+    """Создаёт ли запрос новое сообщение в чате (sendMessage, copyMessage, ...)"""
+    name = method.__api_method__
+    return name.startswith(_MESSAGE_PREFIXES) and name not in _NOT_MESSAGES
+
+
+def _chat_key(chat_id) -> tuple[int | str, bool]:
+    """Нормализовать chat_id и определить, групповой ли это чат (группа/канал)"""
+    if isinstance(chat_id, str):
+        if chat_id.lstrip("-").isdigit():
+            chat_id = int(chat_id)
+        else:
+            return chat_id, True  # @username — это всегда канал или группа
+    return chat_id, chat_id < 0
+
+
+class RateLimiter(BaseRequestMiddleware):
+    """Middleware сессии бота: общий лимит + лимит на каждый чат + учёт retry_after.
+
+    Лимиты Telegram действуют на бота целиком, а лимитер у каждого процесса свой,
+    поэтому при WORKERS > 1 общий лимит и лимит личного чата (туда пишут все
+    процессы — например, рассылка постов модераторам) делятся на число процессов.
+    Лимит канала не делится: в канал публикует только процесс 0.
+    """
+
+    def __init__(
+        self,
+        global_rate: float | None = None,
+        private_rate: float | None = None,
+        group_rate_per_minute: float | None = None,
+        max_retries: int | None = None,
+        workers: int | None = None,
+    ):
+        workers = max(1, settings.WORKERS if workers is None else workers)
+        global_rate = (global_rate or settings.RATE_LIMIT_GLOBAL) / workers
+        self.global_bucket = TokenBucket(global_rate, max(global_rate, 1))
+        self.private_rate = (private_rate or settings.RATE_LIMIT_PRIVATE) / workers
+        self.group_rate = (group_rate_per_minute or settings.RATE_LIMIT_GROUP_PER_MINUTE) / 60
+        self.max_retries = settings.RATE_LIMIT_MAX_RETRIES if max_retries is None else max_retries
+        self.chat_buckets: dict[int | str, TokenBucket] = {}
+        self.stats = RateLimiterStats()
+        self._last_prune = time.monotonic()
+
+    def _bucket_for(self, chat_id) -> TokenBucket:
+        key, is_group = _chat_key(chat_id)
+        bucket = self.chat_buckets.get(key)
+        if bucket is None:
+            if is_group:
+                # Для каналов разрешаем небольшой всплеск, дальше — 20 в минуту
+                bucket = TokenBucket(self.group_rate, 3)
+            else:
+                bucket = TokenBucket(self.private_rate, 1)
+            self.chat_buckets[key] = bucket
+        return bucket
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for key in [k for k, b in self.chat_buckets.items() if b.is_idle(now)]:
+            del self.chat_buckets[key]
+
+    async def acquire(self, chat_id=None) -> float:
+        """Дождаться права отправить запрос; возвращает время ожидания.
+
+        С chat_id — новое сообщение в чат (ведро чата + общее), без него — только общее ведро.
+        """
+        self._prune()
+        # Сначала ждём свою очередь в чате, затем общий слот — так медленный
+        # канал не занимает общие токены, пока сам стоит в очереди
+        buckets = (self.global_bucket,) if chat_id is None else (self._bucket_for(chat_id), self.global_bucket)
+        waited = 0.0
+        self.stats.queue_depth += 1
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.stats.queue_depth)
+        try:
+            for bucket in buckets:
+                delay = bucket.reserve()
+                if delay > 0:
+                    try:
+                        await asyncio.sleep(delay)
+                    except asyncio.CancelledError:
+                        bucket.refund()
+                        raise
+                    waited += delay
+        finally:
+            self.stats.queue_depth -= 1
+        self.stats.requests += 1
+        if waited:
+            self.stats.throttled += 1
+            self.stats.wait_seconds += waited
+        return waited
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        target = getattr(method, "chat_id", None)
+        if target is None:
+            # Ответы на callback, getMe, getUpdates и т.п. не адресованы чату и не лимитируются
+            return await make_request(bot, method)
+        # Лимит чата тратят только новые сообщения; правки, удаления и заявки — лишь общий
+        chat_id = target if produces_message(method) else None
+
+        attempt = 0
+        while True:
+            await self.acquire(chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.stats.retries += 1
+                # 429 означает, что бот упёрся в лимит: притормаживаем все запросы, а не только этот чат
+                self.global_bucket.pause(e.retry_after)
+                if chat_id is not None:
+                    self._bucket_for(chat_id).pause(e.retry_after)
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(
+                    f"Flood control для {type(method).__name__} в чате {target}: "
+                    f"ждём {e.retry_after} сек (попытка {attempt}/{self.max_retries})"
+                )
+
+    def snapshot(self) -> dict:
+        """Текущие значения счётчиков (для логов и метрик)"""
+        return {
+            "requests": self.stats.requests,
+            "throttled": self.stats.throttled,
+            "wait_seconds": round(self.stats.wait_seconds, 3),
+            "retries": self.stats.retries,
+            "queue_depth": self.stats.queue_depth,
+            "max_queue_depth": self.stats.max_queue_depth,
+            "chat_buckets": len(self.chat_buckets),
+        }
+
+
+# Общий лимитер процесса: подключается к сессии бота в bot.py
+rate_limiter = RateLimiter()
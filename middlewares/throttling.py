@@ -0,0 +1,194 @@
+"""
+Защита от флуда входящими апдейтами (скользящее окно на пользователя)
+
+Каждое нажатие /start, /send или кнопки открывает сессию БД, а иногда и пишет в
+неё. Один клиент, который шлёт такие апдейты без остановки, может занять
+единственного писателя SQLite. ThrottlingMiddleware до фильтров и обработчиков
+считает события каждого пользователя по классам (команды, кнопки reply-клавиатуры,
+inline-кнопки, прочие сообщения) и молча отбрасывает превышающие лимит, один раз
+за эпизод флуда предупредив пользователя.
+
+Окно — скользящий счётчик: текущее фиксированное окно плюс доля предыдущего.
+На пару (пользователь, класс) это два числа вместо списка отметок времени.
+Модераторы и владельцы не ограничиваются, оплаты (successful_payment) — тоже.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from config import settings
+from keyboards.user_kb import get_main_reply_keyboard
+from services.cache import moderator_roster
+from utils.texts import THROTTLE_WARNING_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+# Тексты кнопок reply-клавиатуры: приходят обычными сообщениями
+REPLY_BUTTONS = frozenset(button.text for row in get_main_reply_keyboard().keyboard for button in row)
+
+
+def parse_limit(value: str) -> Optional[tuple[int, float]]:
+    """Разобрать лимит вида '5/10' (не больше 5 событий за 10 секунд); пусто — без лимита"""
+    if not value or not value.strip():
+        return None
+    try:
+        count, _, period = value.partition("/")
+        limit = int(count), float(period)
+    except ValueError:
+        logger.error(f"Некорректный лимит антифлуда: {value!r}, ограничение отключено")
+        return None
+    if limit[0] <= 0 or limit[1] <= 0:
+        return None
+    return limit
+
+
+class SlidingWindow:
+    """Скользящий счётчик событий одного пользователя одного класса"""
+
+    __slots__ = ("window_start", "current", "previous", "warned")
+
+    def __init__(self, now: float):
+        self.window_start = now
+        self.current = 0
+        self.previous = 0
+        self.warned = False
+
+    def hit(self, now: float, limit: int, period: float) -> bool:
+        """Засчитать событие; False — лимит исчерпан (отброшенные события не засчитываются)"""
+        elapsed = now - self.window_start
+        if elapsed >= period:
+            # Окна выровнены по первому событию: сдвигаемся на целое число окон
+            self.previous = self.current if elapsed < 2 * period else 0
+            self.current = 0
+            self.window_start += period * (elapsed // period)
+            elapsed = now - self.window_start
+        estimate = self.previous * (1 - elapsed / period) + self.current
+        if estimate + 1 > limit:
+            return False
+        self.current += 1
+        self.warned = False
+        return True
+
+    def is_idle(self, now: float, period: float) -> bool:
+        """За два окна событий не было — счётчик равен новому, его можно удалить"""
+        return now - self.window_start >= 2 * period
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Внешний middleware сообщений и callback-запросов: лимиты на пользователя по классам событий"""
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, str]] = None,
+        warn: Optional[bool] = None,
+        max_keys: Optional[int] = None,
+        exempt: Optional[Callable[[int], bool]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if limits is None:
+            limits = {
+                "command": settings.THROTTLE_COMMANDS,
+                "button": settings.THROTTLE_BUTTONS,
+                "callback": settings.THROTTLE_CALLBACKS,
+                "message": settings.THROTTLE_MESSAGES,
+            }
+        self.limits = {name: limit for name, value in limits.items() if (limit := parse_limit(value))}
+        self.warn = settings.THROTTLE_WARN if warn is None else warn
+        self.max_keys = max_keys or settings.THROTTLE_MAX_KEYS
+        self.exempt = exempt or moderator_roster.is_moderator
+        self.clock = clock
+        # Порядок — давность последнего события: в начале самые давние
+        self._windows: OrderedDict[tuple[int, str], SlidingWindow] = OrderedDict()
+        self._last_prune = clock()
+        self.dropped = 0
+        self.warned = 0
+        self.evicted = 0
+
+    def setup(self, dp: Dispatcher) -> None:
+        # Внешний middleware наблюдателя срабатывает до фильтров и FSM — отброшенное событие не трогает БД
+        dp.message.outer_middleware(self)
+        dp.callback_query.outer_middleware(self)
+
+    @staticmethod
+    def classify(event: TelegramObject) -> Optional[str]:
+        """Класс события для лимита; None — событие не ограничивается"""
+        if isinstance(event, CallbackQuery):
+            return "callback"
+        if isinstance(event, Message):
+            if event.successful_payment is not None:
+                return None
+            text = event.text
+            if text:
+                if text.startswith("/"):
+                    return "command"
+                if text in REPLY_BUTTONS:
+                    return "button"
+            return "message"
+        return None
+
+    def allow(self, user_id: int, kind: str) -> Optional[bool]:
+        """True — пропустить, False — отбросить молча, None — отбросить и предупредить"""
+        limit = self.limits.get(kind)
+        if limit is None:
+            return True
+        now = self.clock()
+        self._prune(now)
+        key = (user_id, kind)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = SlidingWindow(now)
+            if len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._windows.move_to_end(key)
+        if window.hit(now, *limit):
+            return True
+        self.dropped += 1
+        if self.warn and not window.warned:
+            window.warned = True
+            self.warned += 1
+            return None
+        return False
+
+    def _prune(self, now: float) -> None:
+        """Удалить счётчики пользователей, которые давно ничего не присылали"""
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        longest = max((period for _, period in self.limits.values()), default=0.0)
+        # Ключи упорядочены по последнему событию: проверяем с начала до первого активного
+        while self._windows:
+            key, window = next(iter(self._windows.items()))
+            if not window.is_idle(now, longest):
+                break
+            del self._windows[key]
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = event.from_user
+        kind = self.classify(event)
+        if user is None or kind is None or self.exempt(user.id):
+            return await handler(event, data)
+        verdict = self.allow(user.id, kind)
+        if verdict:
+            return await handler(event, data)
+        if verdict is None:
+            logger.info(f"Флуд от пользователя {user.id} ({kind}): события отбрасываются")
+            # Для inline-кнопки это всплывающее уведомление, для сообщения — ответ в чат
+            await event.answer(THROTTLE_WARNING_MESSAGE)
+        return None
+
+    def snapshot(self) -> dict:
+        return {"keys": len(self._windows), "dropped": self.dropped, "warned": self.warned, "evicted": self.evicted}
+
+
+throttling_middleware = ThrottlingMiddleware()
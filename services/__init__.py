@@ -0,0 +1,25 @@
+from .cache import BanCache, ModeratorRoster, ban_cache, moderator_roster
+from .counters import PendingCounters, pending_counters
+from .mass_approval import MassApproval, mass_approval
+from .publisher import PublisherPool, publish_post, publisher
+from .scheduler import PublishScheduler, scheduler
+from .stats import StatsCache, StatsSnapshot, stats_cache
+
+__all__ = [
+    "BanCache",
+    "ban_cache",
+    "ModeratorRoster",
+    "moderator_roster",
+    "PendingCounters",
+    "pending_counters",
+    "MassApproval",
+    "mass_approval",
+    "PublisherPool",
+    "publish_post",
+    "publisher",
+    "PublishScheduler",
+    "scheduler",
+    "StatsCache",
+    "StatsSnapshot",
+    "stats_cache",
+]
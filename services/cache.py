@@ -0,0 +1,115 @@
+"""
+Кэши в памяти процесса для горячих проверок, которым не нужна БД
+"""
+import logging
+
+from sqlalchemy import select
+
+from config import MODERATOR_IDS, OWNER_IDS
+from database.db import get_db
+from database.models import Moderator, User
+
+logger = logging.getLogger(__name__)
+
+
+class BanCache:
+    """Множество id забаненных пользователей.
+
+    Загружается один раз при старте (bot.main) и обновляется сквозной записью
+    из обработчиков бана/разбана, поэтому проверка «может ли пользователь
+    отправить пост» не открывает соединение с БД.
+    """
+
+    def __init__(self):
+        self._banned: set[int] = set()
+        self.loaded = False
+        self.hits = 0  # пользователь найден в множестве (забанен)
+        self.misses = 0  # пользователя нет в множестве
+
+    async def load(self) -> None:
+        async for session in get_db():
+            banned = (await session.scalars(select(User.user_id).filter(User.is_banned == True))).all()
+        self._banned = set(banned)
+        self.loaded = True
+        logger.info(f"Кэш банов загружен: {len(self._banned)} пользователей")
+
+    def is_banned(self, user_id: int) -> bool:
+        if user_id in self._banned:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def ban(self, user_id: int) -> None:
+        """Вызывать после успешного commit бана"""
+        self._banned.add(user_id)
+
+    def unban(self, user_id: int) -> None:
+        """Вызывать после успешного commit разбана"""
+        self._banned.discard(user_id)
+
+    async def verify(self, repair: bool = True) -> tuple[set[int], set[int]]:
+        """Сверить кэш с таблицей users.
+
+        Возвращает (забанены в БД, но нет в кэше; есть в кэше, но не забанены в БД).
+        При repair=True кэш приводится к состоянию БД.
+        """
+        async for session in get_db():
+            banned = set((await session.scalars(select(User.user_id).filter(User.is_banned == True))).all())
+        missing = banned - self._banned
+        stale = self._banned - banned
+        if missing or stale:
+            logger.warning(f"Кэш банов расходится с БД: не хватает {len(missing)}, лишних {len(stale)}")
+            if repair:
+                self._banned = banned
+        return missing, stale
+
+    def __len__(self) -> int:
+        return len(self._banned)
+
+    def snapshot(self) -> dict:
+        return {"banned": len(self._banned), "hits": self.hits, "misses": self.misses}
+
+
+class ModeratorRoster:
+    """Состав модерации: MODERATOR_IDS + OWNER_IDS + модераторы из таблицы moderators.
+
+    Обслуживает проверку прав в `moderator_only` и списки получателей рассылок без
+    обращения к БД. После изменений в таблице moderators вызывайте `reload()`.
+    """
+
+    def __init__(self):
+        self._db_ids: frozenset[int] = frozenset()
+        self.loaded = False
+        self.hits = 0  # пользователь оказался модератором
+        self.misses = 0  # не модератор
+
+    async def load(self) -> None:
+        async for session in get_db():
+            db_ids = (await session.scalars(select(Moderator.moderator_id))).all()
+        self._db_ids = frozenset(db_ids)
+        self.loaded = True
+
+    async def reload(self) -> None:
+        """Перечитать модераторов из БД (после добавления/удаления)"""
+        await self.load()
+        logger.info(f"Состав модерации обновлён: {len(self.recipients())} получателей")
+
+    def is_moderator(self, user_id: int) -> bool:
+        # Списки из env читаем «вживую»: их меняют обработчики добавления/удаления модераторов
+        if user_id in self._db_ids or user_id in MODERATOR_IDS or user_id in OWNER_IDS:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def recipients(self) -> set[int]:
+        """Кому рассылать посты и заявки: все модераторы и владельцы"""
+        return set(MODERATOR_IDS) | set(OWNER_IDS) | self._db_ids
+
+    def snapshot(self) -> dict:
+        return {"db_moderators": len(self._db_ids), "hits": self.hits, "misses": self.misses}
+
+
+ban_cache = BanCache()
+moderator_roster = ModeratorRoster()
@@ -0,0 +1,121 @@
+"""
+Счётчики «на модерации», поддерживаемые инкрементально
+
+Вместо COUNT(*) по posts и chat_join_requests на каждом экране счётчики один раз
+читаются при старте и меняются обработчиками на каждом переходе статуса
+(создание, одобрение, отклонение, удаление). Периодическая сверка с БД
+исправляет возможный дрейф (гонки, ручные правки в базе).
+
+В многопроцессном режиме (WORKERS > 1) посты и заявки создаются в других
+процессах, поэтому там счётчики перечитываются из БД перед каждым показом
+(refresh) — два COUNT по индексам вместо устаревших локальных значений.
+"""
+import logging
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from config import settings
+from database.db import get_db
+from database.models import ChatJoinRequest, Post
+
+logger = logging.getLogger(__name__)
+
+
+class PendingCounters:
+    """Количество постов и заявок на вступление в статусе pending"""
+
+    def __init__(self, shared: Optional[bool] = None):
+        # shared — счётчики меняют несколько процессов, источник правды только БД
+        self.shared = settings.WORKERS > 1 if shared is None else shared
+        self._posts = 0
+        self._requests: defaultdict[int, int] = defaultdict(int)
+        # Номер изменения: сверка отбрасывает снимок БД, если счётчики менялись, пока он читался
+        self._generation = 0
+        self.loaded = False
+
+    async def _read_from_db(self) -> tuple[int, dict[int, int]]:
+        async for session in get_db():
+            posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
+            rows = (
+                await session.execute(
+                    select(ChatJoinRequest.chat_id, func.count(ChatJoinRequest.id))
+                    .filter(ChatJoinRequest.status == "pending")
+                    .group_by(ChatJoinRequest.chat_id)
+                )
+            ).all()
+        return posts or 0, {int(chat_id): count for chat_id, count in rows}
+
+    async def load(self) -> None:
+        posts, requests = await self._read_from_db()
+        self._posts = posts
+        self._requests = defaultdict(int, requests)
+        self.loaded = True
+        logger.info(f"Счётчики загружены: постов на модерации {posts}, заявок {sum(requests.values())}")
+
+    async def refresh(self) -> None:
+        """Перечитать счётчики из БД перед показом, если их меняют и другие процессы"""
+        if not self.shared:
+            return
+        generation = self._generation
+        posts, requests = await self._read_from_db()
+        if generation == self._generation:
+            self._posts = posts
+            self._requests = defaultdict(int, requests)
+
+    async def reconcile(self) -> bool:
+        """Сверить с БД и исправить расхождения. Возвращает True, если всё сходилось.
+
+        Если во время чтения обработчики изменили счётчики, снимок уже устарел:
+        неизвестно, попали ли эти изменения в него. Тогда сверка пропускается до
+        следующего раза, чтобы не потерять изменения и не сообщить о ложном дрейфе.
+        """
+        generation = self._generation
+        posts, requests = await self._read_from_db()
+        if generation != self._generation:
+            logger.debug("Сверка счётчиков пропущена: они изменились во время чтения из БД")
+            return True
+        current_requests = {chat_id: n for chat_id, n in self._requests.items() if n}
+        in_sync = posts == self._posts and requests == current_requests
+        if not in_sync:
+            logger.warning(
+                f"Счётчики разошлись с БД: постов {self._posts} -> {posts}, "
+                f"заявок {current_requests} -> {requests}"
+            )
+        self._posts = posts
+        self._requests = defaultdict(int, requests)
+        return in_sync
+
+    # --- Посты ---
+    @property
+    def pending_posts(self) -> int:
+        return self._posts
+
+    def post_created(self, n: int = 1) -> None:
+        self._generation += 1
+        self._posts += n
+
+    def post_resolved(self, n: int = 1) -> None:
+        """Пост ушёл из pending: одобрен, отклонён или удалён"""
+        self._generation += 1
+        self._posts = max(0, self._posts - n)
+
+    # --- Заявки на вступление ---
+    def pending_requests(self, chat_id: int | str) -> int:
+        return self._requests.get(int(chat_id), 0)
+
+    def request_created(self, chat_id: int | str) -> None:
+        self._generation += 1
+        self._requests[int(chat_id)] += 1
+
+    def request_resolved(self, chat_id: int | str) -> None:
+        self._generation += 1
+        chat_id = int(chat_id)
+        self._requests[chat_id] = max(0, self._requests[chat_id] - 1)
+
+    def snapshot(self) -> dict:
+        return {"pending_posts": self._posts, "pending_requests": sum(self._requests.values())}
+
+
+pending_counters = PendingCounters()
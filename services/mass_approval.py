@@ -0,0 +1,172 @@
+"""
+Массовое одобрение постов фоновой задачей
+
+Обработчик кнопки «Одобрить всё» только запускает задачу и сразу отвечает на
+callback. Задача забирает pending-посты пачками (по пачке на транзакцию),
+расставляет их по слотам публикации в порядке поступления и периодически
+обновляет сообщение с прогрессом и кнопкой «Остановить». Саму публикацию с
+учётом лимитов канала и уведомление авторов выполняют воркеры outbox
+(services.publisher).
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from aiogram import Bot
+from sqlalchemy import select, update
+
+from config import settings
+from database.db import enqueue_publication, get_db
+from database.models import Post
+from keyboards.moderator_kb import get_mass_approval_keyboard
+from services.counters import pending_counters
+from services.scheduler import scheduler
+from utils.background import spawn
+
+logger = logging.getLogger(__name__)
+
+
+async def approve_pending_batch(moderator_id: int, limit: int) -> list[datetime]:
+    """Одобрить до `limit` самых старых pending-постов одной транзакцией.
+
+    Возвращает назначенные слоты публикации (пустой список — одобрять больше нечего).
+    Пост, который параллельно одобрили или отклонили по одному, условие
+    status = 'pending' в UPDATE пропустит.
+    """
+    now = datetime.utcnow()
+    oldest = (
+        select(Post.post_id)
+        .where(Post.status == "pending")
+        .order_by(Post.created_at, Post.post_id)
+        .limit(limit)
+        .scalar_subquery()
+    )
+    slots = []
+    async for session in get_db():
+        claimed = (
+            await session.scalars(
+                update(Post)
+                .where(Post.post_id.in_(oldest), Post.status == "pending")
+                .values(status="approved", moderated_at=now, moderator_id=moderator_id)
+                .returning(Post)
+                .execution_options(synchronize_session=False)
+            )
+        ).all()
+        for post in sorted(claimed, key=lambda p: (p.created_at or now, p.post_id)):
+            # Каждый пост получает свой слот по каденции канала, а не публикуется сразу
+            post.publish_at = scheduler.next_slot(now)
+            enqueue_publication(session, post, publish_at=post.publish_at)
+            slots.append(post.publish_at)
+        await session.commit()
+    pending_counters.post_resolved(len(slots))
+    for slot in slots:
+        scheduler.schedule(slot)
+    return slots
+
+
+@dataclass
+class MassApprovalJob:
+    """Состояние запущенного массового одобрения"""
+    moderator_id: int
+    chat_id: int
+    message_id: int
+    total: int  # Сколько постов было на модерации при запуске (оценка для прогресса)
+    approved: int = 0
+    first_slot: Optional[datetime] = None
+    last_slot: Optional[datetime] = None
+    cancelled: bool = False
+    finished: bool = False
+    started_at: float = field(default_factory=time.monotonic)
+    task: Optional[asyncio.Task] = None
+
+
+class MassApproval:
+    """Одна задача массового одобрения на процесс"""
+
+    def __init__(self, batch_size: Optional[int] = None, progress_interval: Optional[float] = None):
+        self.batch_size = batch_size or settings.MASS_APPROVAL_BATCH
+        self.progress_interval = (
+            settings.MASS_APPROVAL_PROGRESS_INTERVAL if progress_interval is None else progress_interval
+        )
+        self.job: Optional[MassApprovalJob] = None
+
+    @property
+    def running(self) -> bool:
+        return self.job is not None and not self.job.finished
+
+    def start(self, bot: Bot, moderator_id: int, chat_id: int, message_id: int) -> Optional[MassApprovalJob]:
+        """Запустить задачу; None, если другая ещё выполняется"""
+        if self.running:
+            return None
+        job = MassApprovalJob(
+            moderator_id=moderator_id,
+            chat_id=chat_id,
+            message_id=message_id,
+            total=pending_counters.pending_posts,
+        )
+        self.job = job
+        job.task = spawn(self._run(bot, job), name="mass_approval")
+        return job
+
+    def cancel(self) -> bool:
+        """Остановить после текущей пачки. Уже одобренные посты остаются в очереди публикации"""
+        if not self.running:
+            return False
+        self.job.cancelled = True
+        return True
+
+    async def _run(self, bot: Bot, job: MassApprovalJob) -> None:
+        last_report = time.monotonic()
+        try:
+            await self._report(bot, job)
+            while not job.cancelled:
+                slots = await approve_pending_batch(job.moderator_id, self.batch_size)
+                if not slots:
+                    break
+                job.approved += len(slots)
+                job.first_slot = job.first_slot or slots[0]
+                job.last_slot = slots[-1]
+                if time.monotonic() - last_report >= self.progress_interval:
+                    await self._report(bot, job)
+                    last_report = time.monotonic()
+                # Отдаём цикл событий обработчикам апдейтов между пачками
+                await asyncio.sleep(0)
+        finally:
+            job.finished = True
+            await self._report(bot, job)
+            logger.info(
+                f"Массовое одобрение ({job.moderator_id}): {job.approved} постов за "
+                f"{time.monotonic() - job.started_at:.1f} с{' (остановлено)' if job.cancelled else ''}"
+            )
+
+    @staticmethod
+    def progress_text(job: MassApprovalJob) -> str:
+        total = max(job.total, job.approved)
+        if not job.finished:
+            return f"⏳ Массовое одобрение: {job.approved} из ~{total}…"
+        status = "⛔ Остановлено" if job.cancelled else "✅ Готово"
+        text = f"{status}: одобрено {job.approved} постов."
+        if job.first_slot and job.last_slot:
+            text += (
+                f"\nПубликация: {scheduler.format_slot(job.first_slot)} — "
+                f"{scheduler.format_slot(job.last_slot)}"
+            )
+        return text
+
+    async def _report(self, bot: Bot, job: MassApprovalJob) -> None:
+        try:
+            await bot.edit_message_text(
+                self.progress_text(job),
+                chat_id=job.chat_id,
+                message_id=job.message_id,
+                reply_markup=None if job.finished else get_mass_approval_keyboard(),
+            )
+        except Exception as e:
+            # «message is not modified» и удалённое сообщение не должны останавливать задачу
+            logger.debug(f"Не удалось обновить прогресс массового одобрения: {e}")
+
+
+mass_approval = MassApproval()
@@ -0,0 +1,230 @@
+"""
+Публикация одобренных постов в канал через outbox
+
+Модератор только помечает пост одобренным и добавляет строку в `outbox` (одной
+транзакцией). Пул фоновых воркеров забирает строки, публикует пост, записывает
+channel_message_id и при ошибке повторяет попытку с экспоненциальной задержкой.
+Если процесс упадёт посреди публикации, строка вернётся в очередь при старте.
+Отправки в канал идут по одной, в порядке слотов; параллельны только запись
+результата и уведомления авторов.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+from sqlalchemy import select, update
+
+from config import OWNER_IDS, settings
+from database.db import get_db
+from database.models import Outbox, Post
+from services.scheduler import scheduler
+from utils.fanout import fan_out
+from utils.helpers import send_post_content
+from utils.texts import POST_APPROVED_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+# Исходное сообщение недоступно (удалено, бот заблокирован, чат исчез): копия невозможна,
+# но сохранённые текст и file_id ещё можно опубликовать. Сетевые ошибки и 429 сюда не входят
+SOURCE_UNAVAILABLE_ERRORS = (TelegramBadRequest, TelegramForbiddenError, TelegramNotFound)
+
+
+async def publish_post(bot: Bot, chat_id: str | int, post: Post):
+    """Опубликовать пост в канал и вернуть отправленное сообщение (или MessageId копии).
+
+    Пост с сохранённым исходным сообщением публикуется одной копией (copyMessage):
+    сохраняются форматирование автора и тип вложения. Остальные — одним запросом
+    нужного типа по media_kind.
+    """
+    if post.source_message_id is not None:
+        try:
+            return await bot.copy_message(chat_id, post.source_chat_id, post.source_message_id)
+        except SOURCE_UNAVAILABLE_ERRORS as e:
+            # Исходное сообщение недоступно — публикуем сохранённые текст и file_id
+            logger.warning(f"Не удалось скопировать исходное сообщение поста {post.post_id}: {e}")
+    return await send_post_content(bot, chat_id, post, post.content)
+
+
+def retry_delay(attempts: int) -> float:
+    """Задержка перед следующей попыткой: base * 2^(n-1), не больше 10 минут"""
+    return min(settings.PUBLISHER_RETRY_BASE * 2 ** max(attempts - 1, 0), 600.0)
+
+
+class PublisherPool:
+    """Пул воркеров, публикующих посты из outbox"""
+
+    def __init__(self, workers: Optional[int] = None, poll_interval: float = 300.0):
+        self.workers = workers or settings.PUBLISHER_WORKERS
+        self.poll_interval = poll_interval
+        self.bot: Optional[Bot] = None
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        # Забор строки и отправка в канал идут по одной: посты выходят в порядке слотов,
+        # даже когда у нескольких строк один и тот же слот (PUBLISH_INTERVAL_MINUTES=0)
+        self._in_order = asyncio.Lock()
+
+    def notify(self) -> None:
+        """Разбудить воркеров: в outbox появились строки, готовые к публикации.
+
+        Обычно вызывается планировщиком в момент слота; poll_interval — лишь страховка.
+        """
+        self._wakeup.set()
+
+    async def start(self, bot: Bot) -> None:
+        self.bot = bot
+        # Строки, которые обрабатывались в момент остановки, возвращаем в очередь
+        async for session in get_db():
+            result = await session.execute(
+                update(Outbox).where(Outbox.status == "processing").values(status="pending", locked_at=None)
+            )
+            if result.rowcount:
+                logger.warning(f"Возвращено в очередь публикаций после перезапуска: {result.rowcount}")
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"publisher_{n}") for n in range(self.workers)
+        ]
+        logger.info(f"Воркеры публикации запущены: {self.workers}")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                async with self._in_order:
+                    outbox_id = await self.claim()
+                    outcome = await self._publish(outbox_id) if outbox_id is not None else None
+                if outbox_id is not None:
+                    # Запись результата и уведомление автора уже не держат очередь
+                    if outcome is not None:
+                        await self._record(outbox_id, *outcome)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера публикации: {e!r}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def claim(self) -> Optional[int]:
+        """Забрать одну строку outbox в работу (условный UPDATE — безопасно для нескольких воркеров)"""
+        now = datetime.utcnow()
+        async for session in get_db():
+            candidates = (
+                await session.scalars(
+                    select(Outbox.id)
+                    .where(Outbox.status == "pending", Outbox.available_at <= now)
+                    .order_by(Outbox.available_at, Outbox.id)
+                    .limit(self.workers)
+                )
+            ).all()
+            for outbox_id in candidates:
+                result = await session.execute(
+                    update(Outbox)
+                    .where(Outbox.id == outbox_id, Outbox.status == "pending")
+                    .values(status="processing", locked_at=now, attempts=Outbox.attempts + 1)
+                )
+                if result.rowcount == 1:
+                    await session.commit()
+                    return outbox_id
+        return None
+
+    async def process(self, outbox_id: int) -> None:
+        """Опубликовать пост из строки outbox и записать результат.
+
+        Запрос к Bot API идёт вне сессии БД: строка уже занята (processing), а
+        соединение не должно простаивать, пока Telegram отвечает или лимитер ждёт.
+        """
+        outcome = await self._publish(outbox_id)
+        if outcome is not None:
+            await self._record(outbox_id, *outcome)
+
+    async def _publish(self, outbox_id: int) -> Optional[tuple[Post, object, Optional[Exception]]]:
+        """Отправить пост занятой строки в канал. None — публиковать нечего (строка отменена)"""
+        post = None
+        async for session in get_db():
+            item = await session.get(Outbox, outbox_id)
+            if item is None:
+                # Строку удалили вместе с постом, пока она ждала воркера
+                logger.warning(f"Строка outbox #{outbox_id} удалена до публикации")
+                return
+            post = await session.get(Post, item.post_id)
+            if post is None or post.status != "approved":
+                # Пост удалили или отозвали, пока он ждал очереди
+                item.status = "cancelled"
+                post = None
+            chat_id = item.chat_id
+            await session.commit()
+        if post is None:
+            return
+
+        sent_message = error = None
+        try:
+            sent_message = await publish_post(self.bot, chat_id, post)
+        except Exception as e:
+            error = e
+        return post, sent_message, error
+
+    async def _record(self, outbox_id: int, post: Post, sent_message, error: Optional[Exception]) -> None:
+        """Записать результат публикации, уведомить автора или владельцев"""
+        bot = self.bot
+        notify_user_id = None
+        failure = None
+        async for session in get_db():
+            item = await session.get(Outbox, outbox_id)
+            if item is None:
+                logger.error(f"Строка outbox #{outbox_id} удалена во время публикации поста {post.post_id}")
+                return
+            if error is not None:
+                item.last_error = str(error)[:1000]
+                item.locked_at = None
+                if item.attempts >= settings.PUBLISHER_MAX_ATTEMPTS:
+                    item.status = "failed"
+                    failure = str(error)
+                    logger.error(f"Пост {post.post_id} не опубликован после {item.attempts} попыток: {error}")
+                else:
+                    item.status = "pending"
+                    item.available_at = datetime.utcnow() + timedelta(seconds=retry_delay(item.attempts))
+                    scheduler.schedule(item.available_at)
+                    logger.warning(f"Ошибка публикации поста {post.post_id} (попытка {item.attempts}): {error}")
+            else:
+                await session.execute(
+                    update(Post).where(Post.post_id == post.post_id).values(channel_message_id=sent_message.message_id)
+                )
+                item.status = "done"
+                item.published_at = datetime.utcnow()
+                item.last_error = None
+                notify_user_id = post.user_id
+            await session.commit()
+
+        if notify_user_id is not None:
+            # Уведомляем пользователя
+            try:
+                await bot.send_message(notify_user_id, POST_APPROVED_MESSAGE)
+            except Exception as e:
+                logger.warning(f"Не удалось отправить уведомление пользователю {notify_user_id}: {e}")
+        elif failure is not None:
+            hint = ""
+            if "chat not found" in failure.lower():
+                hint = (
+                    "\n\nПроверьте:\n1. Бот добавлен в канал как администратор\n"
+                    "2. У бота есть права на публикацию сообщений\n3. CHANNEL_ID указан правильно"
+                )
+            await fan_out(
+                OWNER_IDS,
+                lambda owner_id: bot.send_message(
+                    owner_id, f"❌ Не удалось опубликовать пост (outbox #{outbox_id}): {failure}{hint}"
+                ),
+            )
+
+
+# Общий пул публикаций процесса: запускается в bot.py
+publisher = PublisherPool()
@@ -0,0 +1,159 @@
+"""
+Расписание публикаций: слоты по каденции канала и тихие часы
+
+Каждому одобренному посту назначается `publish_at` — не раньше, чем через
+PUBLISH_INTERVAL_MINUTES после предыдущего слота, и не в тихие часы. Один
+таймер на куче (heapq) спит до ближайшего слота и будит воркеров публикации;
+БД не опрашивается, отдельных задач на каждый пост нет.
+"""
+import asyncio
+import heapq
+import logging
+from datetime import datetime, time, timedelta, timezone
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import func, select
+
+from config import settings
+from database.db import get_db
+from database.models import Outbox, Post
+
+logger = logging.getLogger(__name__)
+
+
+def parse_quiet_hours(value: str) -> Optional[tuple[int, int]]:
+    """Разобрать строку вида '23:00-08:00' в минуты от начала суток (начало, конец)"""
+    if not value or not value.strip():
+        return None
+
+    def to_minutes(hhmm: str) -> int:
+        hours, _, minutes = hhmm.strip().partition(":")
+        return int(hours) * 60 + int(minutes or 0)
+
+    try:
+        start, end = value.split("-")
+        start_min, end_min = to_minutes(start), to_minutes(end)
+    except ValueError:
+        logger.error(f"Некорректный QUIET_HOURS: {value!r}, тихие часы отключены")
+        return None
+    if start_min == end_min:
+        return None
+    return start_min, end_min
+
+
+def load_timezone(name: str):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Часовой пояс {name!r} не найден, расписание считается в UTC")
+        return timezone.utc
+
+
+class PublishScheduler:
+    """Назначает слоты публикации и будит воркеров, когда подходит ближайший"""
+
+    def __init__(
+        self,
+        interval_minutes: Optional[float] = None,
+        quiet_hours: Optional[str] = None,
+        tz_name: Optional[str] = None,
+    ):
+        self.interval = timedelta(
+            minutes=settings.PUBLISH_INTERVAL_MINUTES if interval_minutes is None else interval_minutes
+        )
+        self.quiet_hours = parse_quiet_hours(settings.QUIET_HOURS if quiet_hours is None else quiet_hours)
+        self.tz = load_timezone(tz_name or settings.PUBLISH_TIMEZONE)
+        self._last_slot: Optional[datetime] = None
+        self._heap: list[datetime] = []
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._on_due: Optional[Callable[[], None]] = None
+
+    # --- Слоты ---
+    def _skip_quiet_hours(self, moment: datetime) -> datetime:
+        """Если момент (naive UTC) попадает в тихие часы — сдвинуть на их окончание"""
+        if not self.quiet_hours:
+            return moment
+        start_min, end_min = self.quiet_hours
+        local = moment.replace(tzinfo=timezone.utc).astimezone(self.tz)
+        minute = local.hour * 60 + local.minute
+        if start_min < end_min:
+            inside = start_min <= minute < end_min
+        else:  # интервал через полночь, например 23:00-08:00
+            inside = minute >= start_min or minute < end_min
+        if not inside:
+            return moment
+        # Конец тихих часов собираем на нужную дату заново, чтобы смещение пояса
+        # определилось для неё (тихие часы могут захватить переход на летнее время)
+        end_time = time(end_min // 60, end_min % 60)
+        end_date = local.date() if minute < end_min else local.date() + timedelta(days=1)
+        end_local = datetime.combine(end_date, end_time, tzinfo=self.tz)
+        return end_local.astimezone(timezone.utc).replace(tzinfo=None)
+
+    def next_slot(self, now: Optional[datetime] = None) -> datetime:
+        """Занять следующий свободный слот (naive UTC, как и остальные даты в БД)"""
+        now = now or datetime.utcnow()
+        candidate = now if self._last_slot is None else max(now, self._last_slot + self.interval)
+        candidate = self._skip_quiet_hours(candidate)
+        self._last_slot = candidate
+        return candidate
+
+    def format_slot(self, slot: datetime) -> str:
+        """Время слота для сообщения модератору (в часовом поясе канала)"""
+        return slot.replace(tzinfo=timezone.utc).astimezone(self.tz).strftime("%d.%m %H:%M")
+
+    # --- Таймер ---
+    def schedule(self, when: datetime) -> None:
+        """Разбудить воркеров публикации в момент `when` (naive UTC)"""
+        is_earliest = not self._heap or when < self._heap[0]
+        heapq.heappush(self._heap, when)
+        if is_earliest:
+            self._changed.set()
+
+    @property
+    def pending_wakeups(self) -> int:
+        return len(self._heap)
+
+    async def start(self, on_due: Callable[[], None]) -> None:
+        """Восстановить расписание из БД и запустить таймер"""
+        self._on_due = on_due
+        async for session in get_db():
+            self._last_slot = await session.scalar(
+                select(func.max(Post.publish_at)).filter(Post.status == "approved")
+            )
+            pending_slots = (
+                await session.scalars(select(Outbox.available_at).filter(Outbox.status == "pending").distinct())
+            ).all()
+        self._heap = [slot for slot in pending_slots if slot is not None]
+        heapq.heapify(self._heap)
+        self._task = asyncio.create_task(self._run(), name="publish_scheduler")
+        logger.info(f"Планировщик публикаций запущен, слотов в очереди: {len(self._heap)}")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            self._changed.clear()
+            if not self._heap:
+                await self._changed.wait()
+                continue
+            delay = (self._heap[0] - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), delay)
+                    continue  # появился более ранний слот
+                except asyncio.TimeoutError:
+                    pass
+            now = datetime.utcnow()
+            while self._heap and self._heap[0] <= now:
+                heapq.heappop(self._heap)
+            self._on_due()
+
+
+# Общий планировщик процесса: запускается в bot.py
+scheduler = PublishScheduler()
@@ -0,0 +1,315 @@
+"""
+Хранилища FSM
+
+SQLStorage хранит состояние и данные в таблице fsm_states базы бота, поэтому они
+переживают перезапуск (например, waiting_ad_post сразу после оплаты Stars).
+Чтение идёт из кэша процесса, а записи копятся в памяти и сбрасываются в БД
+одной транзакцией раз в FSM_FLUSH_INTERVAL секунд: десять изменений одного
+ключа за интервал — одна строка в UPSERT.
+
+Кэш процесса считается источником истины для «своих» ключей: несколько процессов
+могут делить одну базу, если апдейты одного пользователя всегда обрабатывает
+один и тот же процесс.
+
+BoundedMemoryStorage — хранилище в памяти с ограниченным размером: ключ, к
+которому не обращались FSM_TTL секунд (пользователь начал /send и ушёл),
+удаляется, а сверх FSM_MAX_KEYS вытесняются давно не использованные.
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete
+
+from config import settings
+from database.db import dialect_insert, get_db
+from database.models import FSMRecord
+
+logger = logging.getLogger(__name__)
+
+
+class SQLStorage(BaseStorage):
+    """FSM-хранилище в БД бота с кэшем чтения и отложенной (write-behind) записью"""
+
+    def __init__(self, flush_interval: Optional[float] = None, cache_size: Optional[int] = None):
+        self.flush_interval = settings.FSM_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.cache_size = cache_size or settings.FSM_CACHE_SIZE
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        # StorageKey -> (state, data); порядок — давность использования (для вытеснения).
+        # Строковый ключ БД собирается только при чтении из БД и при сбросе
+        self._cache: OrderedDict[StorageKey, tuple[Optional[str], Dict[str, Any]]] = OrderedDict()
+        self._dirty: set[StorageKey] = set()
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.loads = 0  # чтений из БД (промахи кэша)
+        self.flushes = 0  # транзакций записи
+        self.rows_written = 0
+
+    # --- Кэш ---
+    async def _record(self, key: StorageKey) -> tuple[Optional[str], Dict[str, Any]]:
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+            return record
+        self.loads += 1
+        async for session in get_db():
+            row = await session.get(FSMRecord, self.key_builder.build(key))
+        record = (row.state, json.loads(row.data)) if row and row.data else (row.state if row else None, {})
+        # Пока читали из БД, ключ могли записать — запись в кэше новее
+        record = self._cache.setdefault(key, record)
+        self._evict()
+        return record
+
+    def _put(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]) -> None:
+        self._cache[key] = (state, data)
+        self._cache.move_to_end(key)
+        self._dirty.add(key)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later(), name="fsm_flush")
+
+    def _evict(self) -> None:
+        """Вытеснить давно не использованные записи; несохранённые не трогаем"""
+        excess = len(self._cache) - self.cache_size
+        if excess <= 0:
+            return
+        for key in list(self._cache):
+            if excess <= 0:
+                break
+            if key not in self._dirty:
+                del self._cache[key]
+                excess -= 1
+
+    # --- Запись в БД ---
+    async def _flush_later(self) -> None:
+        # Цикл, а не один сброс: ключи, изменённые во время записи, уйдут следующей пачкой
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Не удалось сохранить состояния FSM ({len(self._dirty)} ключей): {e!r}")
+            if not self._dirty:
+                return
+
+    async def flush(self) -> int:
+        """Записать накопленные изменения одной транзакцией. Возвращает число ключей"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            now = datetime.utcnow()
+            upserts, deletes = [], []
+            for key in dirty:
+                state, data = self._cache.get(key, (None, {}))
+                db_key = self.key_builder.build(key)
+                if state is None and not data:
+                    deletes.append(db_key)
+                else:
+                    upserts.append(
+                        {"key": db_key, "state": state, "data": json.dumps(data, ensure_ascii=False), "updated_at": now}
+                    )
+            try:
+                async for session in get_db():
+                    if deletes:
+                        await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(deletes)))
+                    if upserts:
+                        stmt = dialect_insert(session, FSMRecord).values(upserts)
+                        await session.execute(
+                            stmt.on_conflict_do_update(
+                                index_elements=[FSMRecord.key],
+                                set_={
+                                    "state": stmt.excluded.state,
+                                    "data": stmt.excluded.data,
+                                    "updated_at": stmt.excluded.updated_at,
+                                },
+                            )
+                        )
+            except BaseException:
+                # В том числе отмена задачи посреди записи: ключи уйдут следующим сбросом
+                self._dirty |= dirty
+                raise
+            self.flushes += 1
+            self.rows_written += len(dirty)
+            self._evict()
+            return len(dirty)
+
+    # --- BaseStorage ---
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = await self._record(key)
+        self._put(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._record(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        state, _ = await self._record(key)
+        self._put(key, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._record(key)
+        return data.copy()
+
+    async def close(self) -> None:
+        """Сбросить несохранённые изменения (вызывается при остановке бота)"""
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        await self.flush()
+
+    def snapshot(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "loads": self.loads,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+
+class _Slot:
+    """Запись ограниченного хранилища; __slots__ вместо словаря атрибутов"""
+    __slots__ = ("state", "data", "expires_at", "size")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], expires_at: float):
+        self.state = state
+        self.data = data
+        self.expires_at = expires_at
+        self.size = _approx_size(self)
+
+
+# Ключ словаря: StorageKey со своим __dict__ и строки внутри
+_KEY_OVERHEAD = sys.getsizeof(StorageKey(bot_id=1, chat_id=1, user_id=1)) + sys.getsizeof(
+    StorageKey(bot_id=1, chat_id=1, user_id=1).__dict__
+)
+
+
+def _approx_size(slot: _Slot) -> int:
+    """Приблизительный размер записи в байтах (без общих объектов вроде строк состояний)"""
+    size = _KEY_OVERHEAD + sys.getsizeof(slot) + sys.getsizeof(slot.data)
+    for name, value in slot.data.items():
+        size += sys.getsizeof(name) + sys.getsizeof(value)
+    return size
+
+
+class BoundedMemoryStorage(BaseStorage):
+    """FSM-хранилище в памяти с TTL на ключ и LRU-ограничением числа ключей.
+
+    Любое обращение к ключу продлевает его TTL и переносит в конец OrderedDict,
+    поэтому порядок словаря совпадает с порядком истечения: фоновая очистка и
+    вытеснение смотрят только в его начало.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        max_keys: Optional[int] = None,
+        sweep_interval: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl or settings.FSM_TTL
+        self.max_keys = max_keys or settings.FSM_MAX_KEYS
+        self.sweep_interval = sweep_interval or settings.FSM_SWEEP_INTERVAL
+        self.clock = clock
+        self._slots: OrderedDict[StorageKey, _Slot] = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+        self.bytes = 0  # приблизительный объём живых записей
+        self.expired = 0  # удалено по TTL
+        self.evicted = 0  # вытеснено по FSM_MAX_KEYS
+
+    def _get(self, key: StorageKey) -> Optional[_Slot]:
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        now = self.clock()
+        if slot.expires_at <= now:
+            # Очистка ещё не дошла до ключа, но он уже истёк
+            self._remove(key)
+            self.expired += 1
+            return None
+        slot.expires_at = now + self.ttl
+        self._slots.move_to_end(key)
+        return slot
+
+    def _put(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]) -> None:
+        if key in self._slots:
+            self._remove(key)
+        if state is None and not data:
+            # state.clear(): пустую запись не храним
+            return
+        slot = _Slot(state, data, self.clock() + self.ttl)
+        self._slots[key] = slot
+        self.bytes += slot.size
+        while len(self._slots) > self.max_keys:
+            self._remove(next(iter(self._slots)))
+            self.evicted += 1
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_forever(), name="fsm_sweep")
+
+    def _remove(self, key: StorageKey) -> None:
+        self.bytes -= self._slots.pop(key).size
+
+    def sweep(self) -> int:
+        """Удалить истёкшие ключи. Возвращает их число"""
+        now = self.clock()
+        removed = 0
+        while self._slots:
+            key, slot = next(iter(self._slots.items()))
+            if slot.expires_at > now:
+                break
+            self._remove(key)
+            removed += 1
+        self.expired += removed
+        return removed
+
+    async def _sweep_forever(self) -> None:
+        while self._slots:
+            await asyncio.sleep(self.sweep_interval)
+            removed = self.sweep()
+            if removed:
+                logger.debug(f"FSM: удалено {removed} истёкших ключей, осталось {len(self._slots)}")
+
+    # --- BaseStorage ---
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        slot = self._get(key)
+        self._put(key, state.state if isinstance(state, State) else state, slot.data if slot else {})
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        slot = self._get(key)
+        return slot.state if slot else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        slot = self._get(key)
+        self._put(key, slot.state if slot else None, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        slot = self._get(key)
+        return slot.data.copy() if slot else {}
+
+    async def close(self) -> None:
+        if self._sweeper is not None and not self._sweeper.done():
+            self._sweeper.cancel()
+
+    def snapshot(self) -> dict:
+        return {
+            "live_keys": len(self._slots),
+            "approx_bytes": self.bytes,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+def create_storage() -> BaseStorage:
+    """Хранилище FSM по настройке FSM_STORAGE"""
+    if settings.FSM_STORAGE == "memory":
+        return MemoryStorage()
+    if settings.FSM_STORAGE == "bounded":
+        return BoundedMemoryStorage()
+    return SQLStorage()
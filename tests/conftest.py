@@ -0,0 +1,79 @@
+"""
+Общие настройки тестов: фиктивное окружение, чтобы модули бота импортировались без .env
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-token")
+os.environ.setdefault("CHANNEL_ID", "-1001234567890")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+
+@pytest.fixture
+def file_db(tmp_path, monkeypatch):
+    """Файловая БД с пулом: каждая сессия — своё соединение и своя транзакция.
+
+    In-memory БД тестов живёт в одном общем соединении, и параллельные сессии там
+    не изолированы друг от друга, поэтому гонки проверяем на файле, как в продакшене.
+    """
+    import database.db
+    from database.db import create_db_engine
+    from database.models import Base
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+    db_engine = create_db_engine(f"sqlite+aiosqlite:///{tmp_path / 'cas.db'}")
+    session_maker = async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(database.db, "async_session_maker", session_maker)
+
+    async def prepare():
+        async with db_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        # Соединения aiosqlite привязаны к циклу событий, а каждый тест запускает свой
+        await db_engine.dispose()
+
+    asyncio.run(prepare())
+    yield session_maker
+    asyncio.run(db_engine.dispose())
+
+
+
+@pytest.fixture
+def message_update():
+    """Построитель сырого апдейта с сообщением (по умолчанию команда /send) от пользователя"""
+
+    def build(update_id: int, user_id: int, text: str = "/send") -> dict:
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 1717000000,
+                "chat": {"id": user_id, "type": "private", "first_name": "Тест"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Тест"},
+                "text": text,
+            },
+        }
+
+    return build
+
+
+@pytest.fixture
+def callback_update():
+    """Построитель сырого апдейта с нажатием inline-кнопки пользователем"""
+
+    def build(update_id: int, user_id: int) -> dict:
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": {"id": user_id, "is_bot": False, "first_name": "Тест"},
+                "chat_instance": "1",
+                "data": "approve_1",
+            },
+        }
+
+    return build
@@ -0,0 +1,51 @@
+import asyncio
+
+from config import MODERATOR_IDS, OWNER_IDS
+from database.db import get_db, init_db
+from database.models import Moderator, User
+from services.cache import BanCache, ModeratorRoster
+
+
+def test_ban_cache_write_through_and_verify():
+    async def scenario():
+        await init_db()
+        async for session in get_db():
+            session.add_all([
+                User(user_id=901, is_banned=True),
+                User(user_id=902, is_banned=False),
+            ])
+
+        cache = BanCache()
+        await cache.load()
+        assert cache.is_banned(901)
+        assert not cache.is_banned(902)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        cache.ban(902)
+        cache.unban(901)
+        assert cache.is_banned(902) and not cache.is_banned(901)
+
+        # В БД изменений не было — сверка находит оба расхождения и чинит кэш
+        missing, stale = await cache.verify()
+        assert 901 in missing and 902 in stale
+        assert cache.is_banned(901) and not cache.is_banned(902)
+
+    asyncio.run(scenario())
+
+
+def test_moderator_roster_combines_env_owners_and_db():
+    async def scenario():
+        await init_db()
+        roster = ModeratorRoster()
+        await roster.load()
+        assert not roster.is_moderator(903)
+
+        async for session in get_db():
+            session.add(Moderator(moderator_id=903, username="mod"))
+        await roster.reload()
+
+        assert roster.is_moderator(903)
+        assert all(roster.is_moderator(owner_id) for owner_id in OWNER_IDS)
+        assert roster.recipients() >= {903, *OWNER_IDS, *MODERATOR_IDS}
+
+    asyncio.run(scenario())
@@ -0,0 +1,78 @@
+import asyncio
+
+from database.db import get_db, init_db
+from database.models import ChatJoinRequest, Post, User
+from services.counters import PendingCounters
+
+
+def test_pending_counters_track_transitions_and_reconcile():
+    async def scenario():
+        await init_db()
+        counters = PendingCounters()
+        await counters.load()
+        base_posts = counters.pending_posts
+        base_requests = counters.pending_requests(-100900)
+
+        async for session in get_db():
+            session.add(User(user_id=1001))
+            session.add_all([Post(user_id=1001, post_type="free", content=str(i), status="pending") for i in range(3)])
+            session.add(ChatJoinRequest(user_id=1001, chat_id=-100900, status="pending"))
+        counters.post_created(3)
+        counters.request_created(-100900)
+        counters.post_resolved()
+
+        assert counters.pending_posts == base_posts + 2
+        assert counters.pending_requests("-100900") == base_requests + 1
+
+        # Пост на самом деле не одобрялся — сверка возвращает правильное значение
+        assert not await counters.reconcile()
+        assert counters.pending_posts == base_posts + 3
+        assert await counters.reconcile()
+
+    asyncio.run(scenario())
+
+
+def test_reconcile_keeps_changes_made_during_read():
+    async def scenario():
+        await init_db()
+        counters = PendingCounters()
+        await counters.load()
+        read_from_db = counters._read_from_db
+
+        async def slow_read():
+            snapshot = await read_from_db()
+            # Обработчик успел создать пост, пока сверка ждала БД
+            counters.post_created()
+            return snapshot
+
+        counters._read_from_db = slow_read
+        before = counters.pending_posts
+        assert await counters.reconcile()
+        assert counters.pending_posts == before + 1
+
+    asyncio.run(scenario())
+
+
+def test_shared_counters_see_changes_from_other_processes():
+    async def scenario():
+        await init_db()
+        # Два процесса многопроцессного режима: пост приходит в один, модератор смотрит в другой
+        worker, moderator_worker = PendingCounters(shared=True), PendingCounters(shared=True)
+        await moderator_worker.load()
+        before = moderator_worker.pending_posts
+
+        async for session in get_db():
+            session.add(User(user_id=1004))
+            session.add(Post(user_id=1004, post_type="free", content="x", status="pending"))
+        worker.post_created()
+
+        assert moderator_worker.pending_posts == before
+        await moderator_worker.refresh()
+        assert moderator_worker.pending_posts == before + 1
+
+        # В обычном режиме refresh ничего не читает
+        local = PendingCounters(shared=False)
+        await local.refresh()
+        assert local.pending_posts == 0
+
+    asyncio.run(scenario())
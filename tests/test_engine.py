@@ -0,0 +1,27 @@
+import asyncio
+
+from sqlalchemy import text
+
+from database.db import create_db_engine, engine_options
+
+
+def test_sqlite_profile_applied_on_connect(tmp_path):
+    async def scenario():
+        db_engine = create_db_engine(f"sqlite+aiosqlite:///{tmp_path / 'wal.db'}")
+        try:
+            async with db_engine.connect() as conn:
+                assert (await conn.scalar(text("PRAGMA journal_mode"))) == "wal"
+                assert (await conn.scalar(text("PRAGMA synchronous"))) == 1  # NORMAL
+                assert (await conn.scalar(text("PRAGMA busy_timeout"))) > 0
+        finally:
+            await db_engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_engine_options_per_backend():
+    assert engine_options("sqlite+aiosqlite:///:memory:") == {}
+    assert engine_options("sqlite+aiosqlite:////data/bot.db")["max_overflow"] == 0
+    postgres = engine_options("postgresql+asyncpg://bot@db/bot")
+    assert postgres["pool_pre_ping"] is True
+    assert postgres["pool_size"] >= 1
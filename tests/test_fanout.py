@@ -0,0 +1,47 @@
+import asyncio
+
+from utils.fanout import fan_out
+
+
+def test_fan_out_runs_concurrently_and_collects_failures():
+    in_flight = 0
+    peak = 0
+
+    async def send(chat_id):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            # Отдаём управление: остальные отправки успевают стартовать до завершения этой
+            await asyncio.sleep(0)
+            if chat_id == 3:
+                raise RuntimeError("chat not found")
+        finally:
+            in_flight -= 1
+
+    result = asyncio.run(fan_out([1, 2, 3, 4], send, concurrency=4, timeout=1))
+
+    assert sorted(result.delivered) == [1, 2, 4]
+    assert set(result.failed) == {3}
+    assert peak == 4
+
+
+def test_fan_out_respects_concurrency_and_timeout():
+    in_flight = 0
+    peak = 0
+
+    async def send(chat_id):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await asyncio.sleep(1 if chat_id == 0 else 0.01)
+        finally:
+            in_flight -= 1
+
+    result = asyncio.run(fan_out(range(10), send, concurrency=2, timeout=0.1))
+
+    assert peak <= 2
+    assert 0 in result.failed
+    assert isinstance(result.failed[0], asyncio.TimeoutError)
+    assert len(result.delivered) == 9
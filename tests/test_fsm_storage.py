@@ -0,0 +1,137 @@
+import asyncio
+import tracemalloc
+
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import select
+
+from database.db import get_db, init_db
+from database.models import FSMRecord
+from states.states import PostStates
+from states.storage import BoundedMemoryStorage, SQLStorage
+
+
+def key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def test_sql_storage_survives_restart_and_coalesces_writes():
+    async def scenario():
+        await init_db()
+        storage = SQLStorage(flush_interval=60)
+        await storage.set_state(key(1601), PostStates.waiting_ad_post)
+        for n in range(50):
+            await storage.update_data(key(1601), {"step": n, "post_type": "ad35"})
+        assert await storage.get_state(key(1601)) == PostStates.waiting_ad_post.state
+
+        # Пятьдесят изменений одного ключа — одна строка в одном UPSERT
+        assert await storage.flush() == 1
+        assert storage.flushes == 1 and storage.rows_written == 1
+
+        # «Перезапуск»: новое хранилище читает состояние из БД
+        restarted = SQLStorage(flush_interval=60)
+        assert await restarted.get_state(key(1601)) == PostStates.waiting_ad_post.state
+        assert await restarted.get_data(key(1601)) == {"step": 49, "post_type": "ad35"}
+        assert restarted.loads == 1
+        await restarted.get_data(key(1601))
+        assert restarted.loads == 1  # второй раз — из кэша
+
+        # state.clear() удаляет строку
+        await restarted.set_state(key(1601), None)
+        await restarted.set_data(key(1601), {})
+        await restarted.close()
+        async for session in get_db():
+            assert await session.scalar(select(FSMRecord).filter(FSMRecord.key.like("%1601%"))) is None
+
+    asyncio.run(scenario())
+
+
+def test_sql_storage_flushes_in_background():
+    async def scenario():
+        await init_db()
+        storage = SQLStorage(flush_interval=0.01)
+        await storage.set_state(key(1602), PostStates.waiting_free_post)
+        await asyncio.sleep(0.2)
+        assert storage.snapshot()["dirty"] == 0
+        async for session in get_db():
+            row = await session.get(FSMRecord, storage.key_builder.build(key(1602)))
+        assert row.state == PostStates.waiting_free_post.state
+
+    asyncio.run(scenario())
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_bounded_storage_ttl_and_lru():
+    async def scenario():
+        clock = FakeClock()
+        storage = BoundedMemoryStorage(ttl=100, max_keys=3, sweep_interval=60, clock=clock)
+        for user_id in (1701, 1702, 1703):
+            await storage.set_state(key(user_id), PostStates.waiting_ad_post)
+        await storage.update_data(key(1701), {"post_type": "ad35"})
+
+        # 1701 использовали последним, поэтому при переполнении вытесняется 1702
+        await storage.set_state(key(1704), PostStates.waiting_free_post)
+        assert await storage.get_state(key(1702)) is None
+        assert await storage.get_data(key(1701)) == {"post_type": "ad35"}
+        assert storage.snapshot()["evicted"] == 1
+
+        # Обращение продлевает TTL: 1701 переживает очистку, остальные истекают
+        clock.now = 90
+        await storage.get_state(key(1701))
+        clock.now = 150
+        assert storage.sweep() == 2
+        assert storage.snapshot()["live_keys"] == 1
+        assert await storage.get_state(key(1701)) == PostStates.waiting_ad_post.state
+
+        # Истёкший ключ не возвращается, даже если очистка до него не дошла
+        clock.now = 300
+        assert await storage.get_data(key(1701)) == {}
+
+        # state.clear() освобождает запись сразу
+        await storage.set_state(key(1705), PostStates.waiting_ad_post)
+        await storage.set_state(key(1705), None)
+        assert storage.snapshot()["live_keys"] == 0
+        assert storage.snapshot()["approx_bytes"] == 0
+        await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_bounded_storage_memory_is_flat_under_abandoned_sessions():
+    async def scenario():
+        clock = FakeClock()
+        storage = BoundedMemoryStorage(ttl=60, max_keys=2000, sweep_interval=60, clock=clock)
+
+        async def abandon(start: int, count: int):
+            # Пользователь выбрал тип поста и ушёл, не прислав текст
+            for user_id in range(start, start + count):
+                await storage.set_state(key(user_id), PostStates.waiting_ad_post)
+                await storage.update_data(key(user_id), {"post_type": "ad35"})
+                clock.now += 0.001
+            storage.sweep()
+
+        # Прогрев под tracemalloc: хранилище заполнено, все записи уже отслеживаются
+        tracemalloc.start()
+        await abandon(0, 10000)
+        baseline = tracemalloc.get_traced_memory()[0]
+        bytes_after_warmup = storage.snapshot()["approx_bytes"]
+        for chunk in range(1, 5):
+            await abandon(chunk * 10000, 10000)
+        grown = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+
+        snapshot = storage.snapshot()
+        assert snapshot["live_keys"] <= 2000
+        assert snapshot["approx_bytes"] == bytes_after_warmup
+        assert snapshot["expired"] + snapshot["evicted"] + snapshot["live_keys"] == 50000
+        # 40 тысяч новых сессий после прогрева — и никакого прироста памяти
+        assert grown < 64 * 1024
+        await storage.close()
+
+    asyncio.run(scenario())
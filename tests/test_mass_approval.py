@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from database.db import get_db
+from database.models import Outbox, Post, User
+from services.mass_approval import MassApproval
+
+
+class FakeBot:
+    def __init__(self, on_edit=None):
+        self.edits = []
+        self.on_edit = on_edit
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        self.edits.append((text, reply_markup))
+        if self.on_edit:
+            self.on_edit()
+
+
+async def seed_pending(user_id: int, n: int) -> list[int]:
+    base = datetime(2024, 1, 1)
+    async for session in get_db():
+        session.add(User(user_id=user_id))
+        # Посты добавляются в обратном порядке, чтобы порядок по created_at не совпадал с post_id
+        posts = [
+            Post(user_id=user_id, post_type="free", content=str(i), status="pending", created_at=base + timedelta(seconds=i))
+            for i in reversed(range(n))
+        ]
+        session.add_all(posts)
+        await session.commit()
+        return [p.post_id for p in sorted(posts, key=lambda p: p.created_at)]
+
+
+def test_mass_approval_runs_in_batches_and_keeps_order(file_db):
+    async def scenario():
+        ordered_ids = await seed_pending(1401, 250)
+        runner = MassApproval(batch_size=40, progress_interval=0)
+        bot = FakeBot()
+        job = runner.start(bot, moderator_id=1, chat_id=1, message_id=1)
+        assert runner.start(bot, 1, 1, 1) is None  # вторая задача не запускается
+        await job.task
+
+        assert job.approved == 250 and not job.cancelled
+        async for session in get_db():
+            rows = (await session.execute(select(Post.post_id, Post.publish_at).filter(Post.user_id == 1401))).all()
+            outbox = await session.scalar(select(func.count(Outbox.id)))
+        slots = dict(rows)
+        assert [slots[post_id] for post_id in ordered_ids] == sorted(slots.values())
+        assert outbox == 250
+        # Прогресс после каждой пачки и итог без клавиатуры
+        assert len(bot.edits) >= 250 // 40
+        assert bot.edits[-1][0].startswith("✅ Готово: одобрено 250")
+        assert bot.edits[-1][1] is None
+
+    asyncio.run(scenario())
+
+
+def test_mass_approval_can_be_cancelled(file_db):
+    async def scenario():
+        await seed_pending(1402, 100)
+        runner = MassApproval(batch_size=10, progress_interval=0)
+        # Модератор жмёт «Остановить», когда видит прогресс после первой пачки
+        bot = FakeBot(on_edit=lambda: len(bot.edits) >= 2 and runner.cancel())
+        job = runner.start(bot, moderator_id=1, chat_id=1, message_id=1)
+        await job.task
+
+        assert job.cancelled and job.approved == 10
+        async for session in get_db():
+            pending = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == "pending"))
+        assert pending == 100 - job.approved
+        assert bot.edits[-1][0].startswith("⛔ Остановлено")
+
+    asyncio.run(scenario())
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendMessage
+from aiogram.types import CallbackQuery, Message
+from aiohttp.test_utils import TestClient, TestServer
+from sqlalchemy import func, select
+
+from config import settings
+from database.db import current_queries, get_db, init_db, parameter_shape
+from database.models import Post, User
+from middlewares.metrics import ApiMetrics, MetricsMiddleware, MetricsRegistry, current_update
+from utils.webhook import build_webhook_app
+
+
+def test_update_metrics_by_handler_and_type(message_update, callback_update):
+    async def scenario():
+        registry = MetricsRegistry()
+        seen_contexts = []
+        router = Router()
+
+        @router.message()
+        async def echo(message: Message):
+            seen_contexts.append(current_update.get().handler)
+
+        @router.callback_query()
+        async def broken_button(callback: CallbackQuery):
+            raise ValueError("сломалась кнопка")
+
+        dp = Dispatcher()
+        dp.include_router(router)
+        MetricsMiddleware(registry).setup(dp)
+        bot = Bot(token="123456:TEST-token")
+
+        for n in range(3):
+            await dp.feed_raw_update(bot, message_update(n, 1801))
+        with pytest.raises(ValueError):
+            await dp.feed_raw_update(bot, callback_update(10, 1801))
+        # Апдейт, для которого нет обработчика
+        await dp.feed_raw_update(bot, {"update_id": 11, "channel_post": {"message_id": 1, "date": 1717000000, "chat": {"id": -100, "type": "channel"}}})
+        await bot.session.close()
+
+        assert seen_contexts == ["echo"] * 3
+        assert current_update.get() is None
+        assert registry.updates == {"message": 3, "callback_query": 1, "channel_post": 1}
+        assert registry.handler_latency["echo"].count == 3
+        assert registry.handler_latency["unhandled"].count == 1
+        assert registry.handler_errors == {("broken_button", "ValueError"): 1}
+
+        text = registry.render()
+        assert 'bot_updates_total{type="message"} 3' in text
+        assert 'bot_handler_duration_seconds_bucket{handler="echo",le="+Inf"} 3' in text
+        assert 'bot_handler_errors_total{handler="broken_button",error="ValueError"} 1' in text
+
+    asyncio.run(scenario())
+
+
+def test_api_metrics_by_method_and_status():
+    async def scenario():
+        registry = MetricsRegistry()
+        middleware = ApiMetrics(registry)
+        bot = Bot(token="123456:TEST-token")
+        method = SendMessage(chat_id=1801, text="привет")
+
+        async def ok(bot, method):
+            return True
+
+        async def bad_request(bot, method):
+            raise TelegramBadRequest(method=method, message="Bad Request: chat not found")
+
+        await middleware(ok, bot, method)
+        await middleware(ok, bot, method)
+        try:
+            await middleware(bad_request, bot, method)
+        except TelegramBadRequest:
+            pass
+        await bot.session.close()
+
+        assert registry.api_requests == {("sendMessage", "ok"): 2, ("sendMessage", "TelegramBadRequest"): 1}
+        assert registry.api_latency["sendMessage"].count == 3
+        registry.register_snapshot("ratelimit", lambda: {"requests": 3, "chat_buckets": 1, "label": "x"})
+        text = registry.render()
+        assert 'bot_api_requests_total{method="sendMessage",status="TelegramBadRequest"} 1' in text
+        assert "bot_ratelimit_requests 3.0" in text and "bot_ratelimit_label" not in text
+
+    asyncio.run(scenario())
+
+
+def test_db_queries_attributed_to_handler(monkeypatch, caplog, message_update):
+    async def scenario():
+        await init_db()
+        registry = MetricsRegistry()
+        router = Router()
+
+        @router.message()
+        async def count_posts(message: Message):
+            async for session in get_db():
+                await session.scalar(select(func.count(Post.post_id)))
+                await session.scalar(select(func.count(Post.post_id)).filter(Post.user_id == message.from_user.id))
+                await session.get(User, message.from_user.id)
+
+        dp = Dispatcher()
+        dp.include_router(router)
+        MetricsMiddleware(registry).setup(dp)
+        bot = Bot(token="123456:TEST-token")
+        for n in range(2):
+            await dp.feed_raw_update(bot, message_update(n, 1901))
+        await bot.session.close()
+
+        assert current_queries.get() is None
+        assert registry.handler_db_queries == {"count_posts": 6}
+        assert registry.handler_db_seconds["count_posts"] > 0
+        assert 'bot_handler_db_queries_total{handler="count_posts"} 6' in registry.render()
+
+    # Любой запрос и любой апдейт считаются медленными: проверяем, что пишется в лог
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 0.0)
+    monkeypatch.setattr(settings, "SLOW_UPDATE_MS", 0.0)
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(scenario())
+    slow_queries = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Медленный запрос")]
+    assert any("WHERE posts.user_id = ?" in m and "параметры: (int)" in m for m in slow_queries)
+    assert not any("1901" in m for m in slow_queries)
+    assert any(r.getMessage().startswith("Медленный апдейт 1 (count_posts)") and "3 запросов" in r.getMessage() for r in caplog.records)
+
+
+def test_parameter_shape_hides_values():
+    assert parameter_shape((1901, "секретный текст", None)) == "(int, str[15], None)"
+    assert parameter_shape({"user_id": 1901, "text": b"abc"}) == "{user_id: int, text: bytes[3]}"
+    assert parameter_shape([(1, "a"), (2, "b")], executemany=True) == "2 × (int, str[1])"
+
+
+def test_metrics_endpoint_on_webhook_app():
+    async def scenario():
+        bot = Bot(token="123456:TEST-token")
+        app = build_webhook_app(Dispatcher(), bot, path="/webhook")
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get("/metrics")
+            assert response.status == 200
+            assert response.content_type == "text/plain"
+            assert "# TYPE bot_updates_total counter" in await response.text()
+        await bot.session.close()
+
+    asyncio.run(scenario())
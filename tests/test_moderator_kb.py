@@ -1,34 +1,47 @@
-from keyboards.moderator_kb import get_moderation_keyboard, get_user_info_keyboard
+from keyboards.moderator_kb import get_moderation_keyboard, get_moderator_main_keyboard, get_user_info_keyboard
+
+
+def texts_of(kb) -> list[str]:
+    return [btn.text for row in kb.inline_keyboard for btn in row]
 
 
 def test_moderation_keyboard_pagination_and_approve_all():
     kb = get_moderation_keyboard(post_id=1, user_id=2, include_approve_all=True, offset=0, total=5)
-    # keyboard should contain navigation row and approve_all confirmation
-    texts = [btn.text for row in kb.inline_keyboard for btn in row]
-    assert "⚠️ Подтвердить массовое одобрение" in texts
-    assert "◀️" in texts or "◀️ Предыдущий" in texts
-    assert "Следующий ▶️" in texts or "▶️" in texts
+    texts = texts_of(kb)
+    assert "⚡ Одобрить все посты" in texts
+    # Первый пост: назад листать некуда, вперёд — можно
+    assert "◀️" not in texts
+    assert "▶️" in texts
+    assert "📄 1/5" in texts
+
+    last = texts_of(get_moderation_keyboard(post_id=5, user_id=2, offset=4, total=5))
+    assert "◀️" in last and "▶️" not in last
+    assert "⚡ Одобрить все посты" not in last
 
 
 def test_user_info_keyboard_actions():
-    kb = get_user_info_keyboard(user_id=123)
-    texts = [btn.text for row in kb.inline_keyboard for btn in row]
+    texts = texts_of(get_user_info_keyboard(user_id=123))
     assert "🚫 Забанить" in texts
-    assert "✅ Разбанить" in texts
-    assert "📄 Просмотреть посты" in texts
+    assert "✅ Разбанить" not in texts
+    assert "📄 Посты пользователя" in texts
     assert "⚠️ Предупредить" in texts
     assert "↩️ Назад к модерации" in texts
 
+    banned = texts_of(get_user_info_keyboard(user_id=123, is_banned=True))
+    assert "✅ Разбанить" in banned and "🚫 Забанить" not in banned
+
 
-def test_moderation_keyboard_owner_button():
-    kb = get_moderation_keyboard(post_id=1, user_id=2, include_approve_all=False, offset=0, total=1, is_owner=True)
-    texts = [btn.text for row in kb.inline_keyboard for btn in row]
-    assert "➕ Добавить модератора" in texts
+def test_moderation_keyboard_single_post():
+    texts = texts_of(get_moderation_keyboard(post_id=1, user_id=2, include_approve_all=False, offset=0, total=1))
+    assert texts == ["✅ Одобрить", "❌ Отклонить", "✏️ Редактировать", "👤 Инфо", "🚫 Бан", "↩️ Главное меню"]
 
 
 def test_moderator_main_keyboard():
-    kb = get_moderator_main_keyboard(pending_posts=3, pending_requests=2, is_owner=True)
-    texts = [btn.text for row in kb.inline_keyboard for btn in row]
-    assert "📥 Посты (3)" in texts
-    assert "➕ Добавление модераторов" in texts
-    assert "📝 Одобрение заявок (2)" in texts
+    texts = texts_of(get_moderator_main_keyboard(pending_posts=3, pending_requests=2, is_owner=True))
+    assert "📥 Посты на модерации (3)" in texts
+    assert "📝 Заявки на вступление (2)" in texts
+    assert "👑 Управление модераторами" in texts
+
+    moderator = texts_of(get_moderator_main_keyboard(is_owner=False))
+    assert "📥 Посты (нет)" in moderator and "📝 Заявки (нет)" in moderator
+    assert "👑 Управление модераторами" not in moderator
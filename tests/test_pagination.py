@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime
+
+from database.db import get_db, get_pending_post_page, init_db
+from database.models import Post, User
+from keyboards.moderator_kb import decode_page_cursor, encode_page_cursor
+
+
+def test_page_cursor_roundtrip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    data = encode_page_cursor(7, "next", created_at, 4242)
+    assert len(data.encode()) <= 64
+    assert decode_page_cursor(data) == (7, "next", (created_at, 4242))
+    assert decode_page_cursor("moderator_page_0") == (0, "next", None)
+
+
+def test_keyset_pages_walk_queue_in_order():
+    async def scenario():
+        await init_db()
+        # Даты в будущем, чтобы эти посты были в начале очереди; три поста с одинаковым created_at
+        dates = [datetime(2100, 1, 3), datetime(2100, 1, 2), datetime(2100, 1, 2), datetime(2100, 1, 2), datetime(2100, 1, 1)]
+        async for session in get_db():
+            session.add(User(user_id=1201, username="pager"))
+            posts = [Post(user_id=1201, post_type="free", content=str(i), status="pending", created_at=d) for i, d in enumerate(dates)]
+            session.add_all(posts)
+            session.add(Post(user_id=1201, post_type="free", content="done", status="approved", created_at=datetime(2100, 1, 4)))
+            await session.flush()
+            expected = [p.post_id for p in sorted(posts, key=lambda p: (p.created_at, p.post_id), reverse=True)]
+
+        seen = []
+        async for session in get_db():
+            post, user = await get_pending_post_page(session)
+            assert user.username == "pager"
+            seen.append(post.post_id)
+            for _ in range(len(expected) - 1):
+                post, _ = await get_pending_post_page(session, (post.created_at, post.post_id), "next")
+                seen.append(post.post_id)
+            assert seen == expected
+
+            back = []
+            for _ in range(len(expected) - 1):
+                post, _ = await get_pending_post_page(session, (post.created_at, post.post_id), "prev")
+                back.append(post.post_id)
+            assert back == expected[-2::-1]
+            assert await get_pending_post_page(session, (post.created_at, post.post_id), "prev") is None
+
+    asyncio.run(scenario())
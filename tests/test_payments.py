@@ -0,0 +1,92 @@
+import asyncio
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Message
+from sqlalchemy import event, func, select
+
+from database.db import get_db
+from database.models import Payment, User
+from handlers.payments import process_successful_payment
+from states.states import PostStates
+from utils.payload import decode_invoice_payload, encode_invoice_payload
+from utils.texts import PAYMENT_SUCCESS_MESSAGE
+
+
+def payment_message(user_id: int, payload: str, charge_id: str) -> dict:
+    # Сообщение successful_payment в том виде, в каком его присылает Telegram
+    return {
+        "message_id": 77,
+        "date": 1717000000,
+        "chat": {"id": user_id, "type": "private", "first_name": "Плательщик"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Плательщик", "username": "payer"},
+        "successful_payment": {
+            "currency": "XTR",
+            "total_amount": 35,
+            "invoice_payload": payload,
+            "telegram_payment_charge_id": charge_id,
+            "provider_payment_charge_id": "",
+        },
+    }
+
+
+class FakeMessage:
+    def __init__(self, raw: dict):
+        parsed = Message.model_validate(raw)
+        self.successful_payment = parsed.successful_payment
+        self.from_user = parsed.from_user
+        self.answers = []
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+
+def test_invoice_payload_codec():
+    payload = encode_invoice_payload("ad35", 1701, 35, 1717000000)
+    assert len(payload.encode()) <= 128
+    decoded = decode_invoice_payload(payload)
+    assert (decoded.post_type, decoded.user_id, decoded.amount, decoded.issued_at) == ("ad35", 1701, 35, 1717000000)
+
+    # Счета, выставленные до смены формата
+    legacy = decode_invoice_payload("post_offtopic50_1701_1717000000")
+    assert (legacy.post_type, legacy.user_id, legacy.amount) == ("offtopic50", 1701, None)
+
+    for broken in (None, "", "donate_1", "post:1:ad35:x:35:1", "post:2:ad35:1:35:1", "post:1:free:1:0:1", "post_ad35_1"):
+        assert decode_invoice_payload(broken) is None
+
+
+def test_replayed_payment_is_recorded_once(file_db):
+    async def scenario():
+        raw = payment_message(1701, encode_invoice_payload("ad35", 1701, 35, 1717000000), "charge-1701")
+        storage = MemoryStorage()
+        state = FSMContext(storage, StorageKey(bot_id=1, chat_id=1701, user_id=1701))
+
+        commits = 0
+
+        def on_commit(conn):
+            nonlocal commits
+            commits += 1
+
+        sync_engine = file_db.kw["bind"].sync_engine
+        event.listen(sync_engine, "commit", on_commit)
+        try:
+            messages = [FakeMessage(raw) for _ in range(1000)]
+            await asyncio.gather(*(process_successful_payment(m, state) for m in messages))
+        finally:
+            event.remove(sync_engine, "commit", on_commit)
+
+        async for session in get_db():
+            rows = (await session.scalars(select(Payment).filter(Payment.transaction_id == "charge-1701"))).all()
+            users = await session.scalar(select(func.count(User.user_id)).filter(User.user_id == 1701))
+        assert len(rows) == 1 and users == 1
+        assert (rows[0].post_type, float(rows[0].amount), rows[0].status) == ("ad35", 35.0, "completed")
+
+        # Пост оплачен один раз — и разрешение прислать пост выдано один раз
+        answered = [m for m in messages if m.answers]
+        assert len(answered) == 1 and answered[0].answers == [PAYMENT_SUCCESS_MESSAGE]
+        assert await state.get_state() == PostStates.waiting_ad_post.state
+        # Одна транзакция на доставку: пользователь и платёж пишутся одним commit
+        assert commits == 1000
+
+    asyncio.run(scenario())
@@ -0,0 +1,234 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import MessageId
+
+from config import OWNER_IDS
+from database.db import enqueue_publication, get_db, init_db
+from database.models import Outbox, Post, User
+from handlers.moderator import delete_post
+from services.publisher import PublisherPool, publish_post
+
+
+class FakeBot:
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id == "-100777" and self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("Bad Gateway")
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=len(self.sent))
+
+
+async def approved_post_in_outbox(user_id: int) -> int:
+    async for session in get_db():
+        session.add(User(user_id=user_id, username="author"))
+        post = Post(user_id=user_id, post_type="free", content="пост", status="approved")
+        session.add(post)
+        await session.flush()
+        enqueue_publication(session, post, "-100777")
+        post_id = post.post_id
+    return post_id
+
+
+def test_publisher_publishes_and_records_message_id():
+    async def scenario():
+        await init_db()
+        post_id = await approved_post_in_outbox(801)
+        pool = PublisherPool(workers=1)
+        pool.bot = FakeBot()
+        outbox_id = await pool.claim()
+        assert outbox_id is not None
+        assert await pool.claim() is None  # строка уже занята
+        await pool.process(outbox_id)
+
+        async for session in get_db():
+            post = await session.get(Post, post_id)
+            item = await session.get(Outbox, outbox_id)
+            assert post.channel_message_id == 1
+            assert item.status == "done"
+        assert pool.bot.sent[-1][0] == 801  # автор уведомлён
+
+    asyncio.run(scenario())
+
+
+def test_publisher_releases_db_connection_during_api_call(file_db):
+    pool_of = file_db.kw["bind"].sync_engine.pool
+    checked_out = []
+
+    class CheckingBot(FakeBot):
+        async def send_message(self, chat_id, text, **kwargs):
+            checked_out.append(pool_of.checkedout())
+            return await super().send_message(chat_id, text, **kwargs)
+
+    async def scenario():
+        await approved_post_in_outbox(804)
+        pool = PublisherPool(workers=1)
+        pool.bot = CheckingBot()
+        await pool.process(await pool.claim())
+
+    asyncio.run(scenario())
+    # Ни публикация, ни уведомление автора не держат соединение с БД
+    assert checked_out == [0, 0]
+
+
+class DeleteCallback:
+    def __init__(self, post_id: int):
+        self.data = f"delete_post_{post_id}"
+        self.from_user = SimpleNamespace(id=OWNER_IDS[0], username=None, full_name="Owner")
+        self.answers = []
+
+        async def edit_text(*args, **kwargs):
+            return None
+
+        self.message = SimpleNamespace(text="пост", edit_text=edit_text)
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+
+def test_delete_waits_for_post_being_published():
+    async def scenario():
+        await init_db()
+        post_id = await approved_post_in_outbox(805)
+        pool = PublisherPool(workers=1)
+        pool.bot = FakeBot()
+        outbox_id = await pool.claim()
+
+        # Модератор удаляет пост, пока воркер его публикует: удаление откладывается
+        refused = DeleteCallback(post_id)
+        await delete_post(refused)
+        assert refused.answers[0].startswith("⏳")
+        await pool.process(outbox_id)
+
+        async for session in get_db():
+            assert (await session.get(Outbox, outbox_id)).status == "done"
+            assert (await session.get(Post, post_id)).channel_message_id is not None
+
+        deleted = DeleteCallback(post_id)
+        await delete_post(deleted)
+        assert deleted.answers[0].startswith("✅")
+
+    asyncio.run(scenario())
+
+
+def test_process_skips_outbox_row_deleted_after_claim():
+    async def scenario():
+        await init_db()
+        await approved_post_in_outbox(806)
+        pool = PublisherPool(workers=1)
+        pool.bot = FakeBot()
+        outbox_id = await pool.claim()
+        async for session in get_db():
+            await session.delete(await session.get(Outbox, outbox_id))
+
+        await pool.process(outbox_id)
+        assert pool.bot.sent == []
+
+    asyncio.run(scenario())
+
+
+def test_workers_publish_same_slot_in_arrival_order(file_db):
+    published = []
+
+    class SlowFirstBot(FakeBot):
+        async def send_message(self, chat_id, text, **kwargs):
+            if chat_id == "-100777":
+                # Первые посты отправляются дольше: без очереди их обогнали бы следующие
+                await asyncio.sleep(0.02 * (5 - int(text.split()[-1])))
+                published.append(text)
+            return await super().send_message(chat_id, text, **kwargs)
+
+    async def scenario():
+        async for session in get_db():
+            session.add(User(user_id=807))
+            posts = [Post(user_id=807, post_type="free", content=f"пост {n}", status="approved") for n in range(5)]
+            session.add_all(posts)
+            await session.flush()
+            for post in posts:
+                enqueue_publication(session, post, "-100777")
+        pool = PublisherPool(workers=3)
+        await pool.start(SlowFirstBot())
+        for _ in range(100):
+            if len(published) == 5:
+                break
+            await asyncio.sleep(0.02)
+        await pool.stop()
+
+    asyncio.run(scenario())
+    assert published == [f"пост {n}" for n in range(5)]
+
+
+def test_publisher_retries_with_backoff():
+    async def scenario():
+        await init_db()
+        await approved_post_in_outbox(802)
+        pool = PublisherPool(workers=1)
+        pool.bot = FakeBot(fail_times=1)
+        outbox_id = await pool.claim()
+        await pool.process(outbox_id)
+
+        async for session in get_db():
+            item = await session.get(Outbox, outbox_id)
+            assert item.status == "pending"
+            assert item.attempts == 1
+            assert "Bad Gateway" in item.last_error
+        # Следующая попытка отложена, поэтому сейчас брать нечего
+        assert await pool.claim() is None
+
+    asyncio.run(scenario())
+
+
+class RecordingBot:
+    """Бот, записывающий вызовы методов; copy_message падает, если исходник «удалён»"""
+
+    def __init__(self, source_error=None):
+        self.source_error = source_error
+        self.calls = []
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self.calls.append(("copy_message", from_chat_id, message_id))
+        if self.source_error is not None:
+            raise self.source_error
+        return MessageId(message_id=100)
+
+    def __getattr__(self, name):
+        async def send(chat_id, *args, **kwargs):
+            self.calls.append((name, *args))
+            return SimpleNamespace(message_id=len(self.calls))
+
+        return send
+
+
+def test_publish_post_copies_original_submission_in_one_call():
+    async def scenario():
+        post = Post(post_id=1, content="видео", media_file_id="vid-1", media_kind="video", source_chat_id=803, source_message_id=42)
+        bot = RecordingBot()
+        sent = await publish_post(bot, "-100777", post)
+        assert sent.message_id == 100
+        assert bot.calls == [("copy_message", 803, 42)]
+
+        # Исходник удалён или недоступен — один запрос правильного типа, без попытки отправить видео как фото
+        for error in (
+            TelegramBadRequest(method=None, message="message to copy not found"),
+            TelegramForbiddenError(method=None, message="bot was blocked by the user"),
+        ):
+            bot = RecordingBot(source_error=error)
+            await publish_post(bot, "-100777", post)
+            assert [call[0] for call in bot.calls] == ["copy_message", "send_video"]
+
+    asyncio.run(scenario())
+
+
+def test_publish_post_typed_send_without_source():
+    async def scenario():
+        bot = RecordingBot()
+        await publish_post(bot, "-100777", Post(post_id=2, content="файл", media_file_id="doc-1", media_kind="document"))
+        await publish_post(bot, "-100777", Post(post_id=3, content="текст"))
+        assert bot.calls == [("send_document", "doc-1"), ("send_message", "текст")]
+
+    asyncio.run(scenario())
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pytest
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, ApproveChatJoinRequest, DeleteMessage, EditMessageText, SendMessage
+
+from middlewares.ratelimit import RateLimiter, TokenBucket
+
+
+def test_token_bucket_spaces_out_reservations():
+    bucket = TokenBucket(rate=10, capacity=2)
+    delays = [bucket.reserve() for _ in range(4)]
+    assert delays[0] == 0 and delays[1] == 0
+    assert 0.09 < delays[2] < 0.11
+    assert 0.19 < delays[3] < 0.21
+
+
+def test_rate_limiter_per_chat_and_counters():
+    limiter = RateLimiter(global_rate=1000, private_rate=20, group_rate_per_minute=60 * 20)
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append((method.chat_id, time.monotonic()))
+        return "ok"
+
+    async def scenario():
+        started = time.monotonic()
+        await asyncio.gather(*(limiter(make_request, None, SendMessage(chat_id=1, text="x")) for _ in range(5)))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(scenario())
+    assert len(calls) == 5
+    # Первый запрос сразу, остальные четыре — по одному раз в 1/20 секунды
+    assert elapsed >= 0.19
+    stats = limiter.snapshot()
+    assert stats["requests"] == 5
+    assert stats["throttled"] == 4
+    assert stats["max_queue_depth"] >= 4
+    assert stats["queue_depth"] == 0
+
+
+def test_rate_limiter_honours_retry_after():
+    limiter = RateLimiter(global_rate=1000, private_rate=1000, max_retries=2)
+    attempts = 0
+
+    async def make_request(bot, method):
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            # retry_after в Telegram целый, но для теста хватит доли секунды
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0.05)
+        return "ok"
+
+    async def scenario():
+        started = time.monotonic()
+        result = await limiter(make_request, None, SendMessage(chat_id=-100500, text="x"))
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert result == "ok"
+    assert attempts == 2
+    assert elapsed >= 0.05
+    assert limiter.stats.retries == 1
+
+
+def test_rate_limiter_skips_methods_without_chat():
+    limiter = RateLimiter()
+
+    async def make_request(bot, method):
+        return "ok"
+
+    assert asyncio.run(limiter(make_request, None, AnswerCallbackQuery(callback_query_id="1"))) == "ok"
+    assert limiter.stats.requests == 0
+
+
+def test_rate_limiter_charges_chat_budget_only_for_new_messages():
+    limiter = RateLimiter(global_rate=1000, private_rate=1000)
+
+    async def make_request(bot, method):
+        return "ok"
+
+    async def scenario():
+        await limiter(make_request, None, ApproveChatJoinRequest(chat_id=-100777, user_id=5))
+        await limiter(make_request, None, DeleteMessage(chat_id=1, message_id=2))
+        await limiter(make_request, None, EditMessageText(chat_id=1, message_id=2, text="x"))
+
+    asyncio.run(scenario())
+    # Общий лимит учтён, но бюджет канала и личного чата не тронут
+    assert limiter.stats.requests == 3
+    assert limiter.chat_buckets == {}
+
+
+def test_rate_limiter_retry_after_pauses_global_bucket():
+    limiter = RateLimiter(global_rate=1000, private_rate=1000, max_retries=0)
+
+    async def make_request(bot, method):
+        raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=5)
+
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(limiter(make_request, None, SendMessage(chat_id=1, text="x")))
+    # Запрос в любой другой чат тоже ждёт окончания паузы
+    assert limiter.global_bucket.reserve() > 4
+    assert limiter.chat_buckets[1].reserve() > 4
+
+
+def test_rate_limiter_splits_bot_budget_between_workers():
+    limiter = RateLimiter(global_rate=24, private_rate=1, group_rate_per_minute=20, workers=4)
+    assert limiter.global_bucket.rate == 6
+    assert limiter.private_rate == 0.25
+    # В канал публикует только процесс 0 — его лимит не делится
+    assert limiter.group_rate == 20 / 60
@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from services.scheduler import PublishScheduler, parse_quiet_hours
+
+
+def test_slots_follow_cadence():
+    scheduler = PublishScheduler(interval_minutes=10, quiet_hours="", tz_name="UTC")
+    now = datetime(2026, 5, 1, 12, 0)
+    slots = [scheduler.next_slot(now) for _ in range(3)]
+    assert slots == [now, now + timedelta(minutes=10), now + timedelta(minutes=20)]
+    # После паузы следующий пост уходит сразу
+    later = now + timedelta(hours=2)
+    assert scheduler.next_slot(later) == later
+
+
+def test_slots_skip_quiet_hours_across_midnight():
+    assert parse_quiet_hours("23:00-08:00") == (23 * 60, 8 * 60)
+    scheduler = PublishScheduler(interval_minutes=30, quiet_hours="23:00-08:00", tz_name="UTC")
+    first = scheduler.next_slot(datetime(2026, 5, 1, 22, 45))
+    second = scheduler.next_slot(datetime(2026, 5, 1, 22, 45))
+    assert first == datetime(2026, 5, 1, 22, 45)
+    assert second == datetime(2026, 5, 2, 8, 0)
+
+
+def test_timer_wakes_for_earliest_slot_only():
+    async def scenario():
+        wakeups = []
+        scheduler = PublishScheduler(interval_minutes=0, quiet_hours="", tz_name="UTC")
+        scheduler._on_due = lambda: wakeups.append(datetime.utcnow())
+        task = asyncio.create_task(scheduler._run())
+        now = datetime.utcnow()
+        scheduler.schedule(now + timedelta(hours=1))
+        scheduler.schedule(now + timedelta(milliseconds=50))
+        for _ in range(300):
+            scheduler.schedule(now + timedelta(hours=2))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        return wakeups, scheduler.pending_wakeups
+
+    wakeups, pending = asyncio.run(scenario())
+    assert len(wakeups) == 1
+    assert pending == 301
+
+
+def test_quiet_hours_end_across_dst_change():
+    scheduler = PublishScheduler(interval_minutes=0, quiet_hours="23:00-08:00", tz_name="Europe/Kyiv")
+    # Ночь перехода на летнее время (UTC+2 -> UTC+3): 08:00 по Киеву — это 05:00 UTC
+    assert scheduler.next_slot(datetime(2026, 3, 28, 21, 30)) == datetime(2026, 3, 29, 5, 0)
+    assert scheduler.next_slot(datetime(2026, 3, 28, 22, 30)) == datetime(2026, 3, 29, 5, 0)
+    # Ночь перехода на зимнее (UTC+3 -> UTC+2): 08:00 по Киеву — это 06:00 UTC
+    assert scheduler.next_slot(datetime(2026, 10, 24, 20, 30)) == datetime(2026, 10, 25, 6, 0)
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, func, inspect, select, text
+
+from database.db import engine, get_db, get_pending_post_page, init_db
+from database.migrations import MIGRATIONS, run_migrations
+from database.models import ChatJoinRequest, Post
+from services.cache import BanCache
+from services.counters import PendingCounters
+from services.publisher import PublisherPool
+from services.stats import StatsCache
+
+
+def test_migrations_upgrade_old_schema(tmp_path):
+    sync_engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with sync_engine.begin() as conn:
+        # Схема до появления слотов публикации и индексов
+        conn.execute(text("CREATE TABLE users (user_id BIGINT PRIMARY KEY, username VARCHAR(255), first_name VARCHAR(255), registration_date DATETIME, is_banned BOOLEAN)"))
+        conn.execute(text("CREATE TABLE posts (post_id INTEGER PRIMARY KEY, user_id BIGINT NOT NULL, post_type VARCHAR(20) NOT NULL, content TEXT NOT NULL, media_file_id VARCHAR(255), status VARCHAR(20), rejection_reason TEXT, created_at DATETIME, moderated_at DATETIME, moderator_id BIGINT, channel_message_id BIGINT)"))
+        conn.execute(text("CREATE TABLE chat_join_requests (id INTEGER PRIMARY KEY, user_id BIGINT NOT NULL, chat_id BIGINT NOT NULL, username VARCHAR(255), full_name VARCHAR(255), status VARCHAR(20), moderator_id BIGINT, created_at DATETIME, handled_at DATETIME)"))
+        conn.execute(text("CREATE TABLE outbox (id INTEGER PRIMARY KEY, post_id INTEGER NOT NULL, chat_id VARCHAR(64) NOT NULL, status VARCHAR(20), attempts INTEGER, available_at DATETIME, locked_at DATETIME, last_error TEXT, created_at DATETIME, published_at DATETIME)"))
+        conn.execute(text("CREATE TABLE payments (payment_id INTEGER PRIMARY KEY, user_id BIGINT NOT NULL, post_type VARCHAR(20) NOT NULL, amount NUMERIC(10, 2) NOT NULL, currency VARCHAR(10) NOT NULL, payment_method VARCHAR(20) NOT NULL, status VARCHAR(20), transaction_id VARCHAR(255), created_at DATETIME)"))
+        # Повторная доставка successful_payment до уникального индекса записала платёж дважды
+        for payment_id, charge_id in ((1, "c1"), (2, "c1"), (3, "c2"), (4, None), (5, None)):
+            conn.execute(
+                text("INSERT INTO payments (payment_id, user_id, post_type, amount, currency, payment_method, transaction_id) VALUES (:id, 1, 'ad35', 35, 'XTR', 'stars', :charge)"),
+                {"id": payment_id, "charge": charge_id},
+            )
+
+    with sync_engine.begin() as conn:
+        assert run_migrations(conn) == [version for version, _, _ in MIGRATIONS]
+    with sync_engine.begin() as conn:
+        assert run_migrations(conn) == []
+        inspector = inspect(conn)
+        assert "publish_at" in {col["name"] for col in inspector.get_columns("posts")}
+        assert "ix_posts_status_created" in {ix["name"] for ix in inspector.get_indexes("posts")}
+        assert "ix_join_requests_status_chat" in {ix["name"] for ix in inspector.get_indexes("chat_join_requests")}
+        assert "ux_payments_transaction_id" in {ix["name"] for ix in inspector.get_indexes("payments")}
+        assert conn.execute(text("SELECT payment_id FROM payments ORDER BY payment_id")).scalars().all() == [1, 3, 4, 5]
+    sync_engine.dispose()
+
+
+def test_hot_queries_use_indexes():
+    async def scenario():
+        await init_db()
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                statements.append((statement, parameters))
+
+        event.listen(engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            # Очередь модерации и keyset-пагинация
+            async for session in get_db():
+                cursor = (datetime(2024, 1, 1), 1)
+                await get_pending_post_page(session)
+                await get_pending_post_page(session, cursor, "next")
+                await get_pending_post_page(session, cursor, "prev")
+                # Посты пользователя и их количество
+                await session.scalar(select(func.count(Post.post_id)).filter(Post.user_id == 1))
+                (await session.scalars(select(Post).filter(Post.user_id == 1).order_by(Post.created_at.desc()).limit(5))).all()
+                # Активность модераторов и последние заявки
+                (await session.scalars(
+                    select(ChatJoinRequest).filter(ChatJoinRequest.status != "pending").order_by(ChatJoinRequest.handled_at.desc()).limit(5)
+                )).all()
+                await session.execute(
+                    select(ChatJoinRequest.moderator_id, func.count())
+                    .filter(ChatJoinRequest.status != "pending", ChatJoinRequest.moderator_id.isnot(None))
+                    .group_by(ChatJoinRequest.moderator_id)
+                )
+                await session.scalar(select(func.max(Post.publish_at)).filter(Post.status == "approved"))
+            # Счётчики, кэш банов, воркеры публикации
+            await PendingCounters().load()
+            await BanCache().load()
+            await PublisherPool(workers=1).claim()
+            await StatsCache(ttl=0).get()
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+        assert len(statements) >= 17
+        async with engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)).all()
+                details = [row[-1] for row in plan]
+                for detail in details:
+                    # Запрещены полный проход таблицы без индекса и сортировка строк таблицы во временном
+                    # дереве; сортировать уже сгруппированный результат (несколько строк) допустимо
+                    if detail.startswith("SCAN ") and " USING " not in detail:
+                        raise AssertionError(f"Полный проход таблицы: {detail}\n{statement}")
+                    ordering_groups = detail.endswith("FOR ORDER BY") and "GROUP BY" in statement
+                    if "TEMP B-TREE" in detail and not ordering_groups:
+                        raise AssertionError(f"Сортировка без индекса: {detail}\n{statement}")
+
+    asyncio.run(scenario())
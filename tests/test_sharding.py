@@ -0,0 +1,89 @@
+import asyncio
+import queue
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from utils.sharding import KeyedSequencer, ShardRouter, build_front_webhook_app, consume, update_owner
+
+
+def test_router_keeps_user_on_one_shard_and_pins_moderators(message_update, callback_update):
+    router = ShardRouter(4, pinned=lambda user_id: user_id == 1703)
+    assert update_owner(message_update(1, 1701)) == 1701
+    assert update_owner(callback_update(2, 1701)) == 1701
+    assert update_owner({"update_id": 3}) is None
+
+    # Сообщение и нажатие кнопки одного пользователя — в один процесс
+    assert router.route(message_update(1, 1701)) == router.route(callback_update(2, 1701)) == 1701 % 4
+    assert router.route(message_update(3, 1703)) == 0
+
+    queues = [queue.Queue() for _ in range(4)]
+    updates = [message_update(n, 1700 + n % 8) for n in range(100)]
+    router.dispatch(updates, queues)
+    for index, q in enumerate(queues):
+        batch = q.get_nowait()
+        # Внутри очереди порядок апдейтов сохраняется
+        assert [u["update_id"] for u in batch] == sorted(u["update_id"] for u in batch)
+        assert all(router.route(u) == index for u in batch)
+
+
+def test_sequencer_orders_per_user_and_overlaps_users():
+    async def scenario():
+        log = []
+        in_flight = 0
+        max_in_flight = 0
+
+        async def handle(user_id: int, n: int):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            # Первый апдейт пользователя обрабатывается дольше второго
+            await asyncio.sleep(0.02 if n == 0 else 0)
+            log.append((user_id, n))
+            in_flight -= 1
+
+        sequencer = KeyedSequencer(limit=10)
+        for n in range(2):
+            for user_id in (1701, 1702, 1703):
+                await sequencer.submit(user_id, handle(user_id, n))
+        await sequencer.drain()
+
+        for user_id in (1701, 1702, 1703):
+            assert [n for u, n in log if u == user_id] == [0, 1]
+        assert max_in_flight == 3
+
+    asyncio.run(scenario())
+
+
+def test_consume_feeds_batches_until_stop(message_update):
+    async def scenario():
+        fed = []
+
+        async def feed(update: dict):
+            if update["update_id"] == 2:
+                raise RuntimeError("ошибка обработчика")
+            fed.append(update["update_id"])
+
+        q = queue.Queue()
+        q.put([message_update(1, 1701), message_update(2, 1701)])
+        q.put([message_update(3, 1701)])
+        q.put(None)
+        await consume(q, feed)
+        # Ошибка одного апдейта не останавливает обработку следующих
+        assert fed == [1, 3]
+
+    asyncio.run(scenario())
+
+
+def test_front_webhook_routes_without_parsing(message_update):
+    async def scenario():
+        queues = [queue.Queue() for _ in range(2)]
+        app = build_front_webhook_app(ShardRouter(2), queues, "/webhook", "s3cret")
+        async with TestClient(TestServer(app)) as client:
+            denied = await client.post("/webhook", json=message_update(1, 1701), headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+            assert denied.status == 401
+            accepted = await client.post("/webhook", json=message_update(2, 1701), headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+            assert accepted.status == 200
+        assert queues[1701 % 2].get_nowait() == [message_update(2, 1701)]
+        assert queues[0 if 1701 % 2 else 1].empty()
+
+    asyncio.run(scenario())
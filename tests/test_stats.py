@@ -0,0 +1,42 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from database.db import get_db, init_db
+from database.models import ChatJoinRequest, Post, User
+from services.stats import StatsCache
+
+
+def test_stats_snapshot_matches_counts_and_is_cached():
+    async def scenario():
+        await init_db()
+        async for session in get_db():
+            session.add_all([User(user_id=1101), User(user_id=1102, is_banned=True)])
+            session.add_all(
+                [Post(user_id=1101, post_type="free", content="s", status=s) for s in ("pending", "approved", "approved")]
+            )
+            session.add(ChatJoinRequest(user_id=1101, chat_id=-100911, status="rejected", moderator_id=7))
+
+        cache = StatsCache(ttl=60)
+        first, second = await asyncio.gather(cache.get(), cache.get())
+        assert first is second
+        assert cache.misses == 1 and cache.hits == 1
+
+        async for session in get_db():
+            for status in ("pending", "approved", "rejected"):
+                expected = await session.scalar(select(func.count(Post.post_id)).filter(Post.status == status))
+                assert first.posts_by_status[status] == expected
+            assert first.total_posts == await session.scalar(select(func.count(Post.post_id)))
+            assert first.banned_users == await session.scalar(
+                select(func.count(User.user_id)).filter(User.is_banned == True)
+            )
+            assert first.total_requests == await session.scalar(select(func.count(ChatJoinRequest.id)))
+
+        # Новые данные видны только после истечения TTL (или сброса)
+        async for session in get_db():
+            session.add(Post(user_id=1101, post_type="free", content="s", status="pending"))
+        assert (await cache.get()).total_posts == first.total_posts
+        cache.invalidate()
+        assert (await cache.get()).total_posts == first.total_posts + 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,28 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from database.db import create_submission, get_db, init_db
+from database.models import Post, User
+
+
+def test_create_submission_single_transaction():
+    async def scenario():
+        await init_db()
+        async for session in get_db():
+            user, post = await create_submission(session, 501, "author", "Author", "free", "hello", "file-1")
+            assert post.post_id is not None
+            assert post.created_at is not None
+            assert user.user_id == 501
+
+        async for session in get_db():
+            user = await session.get(User, 501)
+            user.is_banned = True
+
+        async for session in get_db():
+            _, post = await create_submission(session, 501, "author", "Author", "free", "second")
+            assert post is None
+            posts = await session.scalar(select(func.count(Post.post_id)).filter(Post.user_id == 501))
+            assert posts == 1
+
+    asyncio.run(scenario())
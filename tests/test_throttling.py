@@ -0,0 +1,99 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery, Message
+
+from middlewares.throttling import SlidingWindow, ThrottlingMiddleware
+from utils.texts import THROTTLE_WARNING_MESSAGE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_sliding_window_counts_part_of_previous_window():
+    window = SlidingWindow(0.0)
+    assert all(window.hit(1.0, 5, 10.0) for _ in range(5))
+    assert not window.hit(2.0, 5, 10.0)
+    # Середина следующего окна: из прошлых пяти событий учитывается половина
+    assert window.hit(15.0, 5, 10.0) and window.hit(15.0, 5, 10.0)
+    assert not window.hit(15.0, 5, 10.0)
+    # Через два окна прошлое забыто
+    assert all(window.hit(30.0, 5, 10.0) for _ in range(5))
+
+
+def test_flood_is_dropped_with_one_warning_and_moderators_exempt(message_update, callback_update):
+    async def scenario():
+        clock = FakeClock()
+        throttling = ThrottlingMiddleware(
+            limits={"command": "3/10", "callback": "2/10", "button": "", "message": ""},
+            warn=True,
+            max_keys=100,
+            exempt=lambda user_id: user_id == 1903,
+            clock=clock,
+        )
+        handled = []
+        router = Router()
+
+        @router.message(Command("send"))
+        async def send(message: Message):
+            handled.append(("send", message.from_user.id))
+
+        @router.callback_query()
+        async def button(callback: CallbackQuery):
+            handled.append(("button", callback.from_user.id))
+
+        dp = Dispatcher()
+        dp.include_router(router)
+        throttling.setup(dp)
+        bot = Bot(token="123456:TEST-token")
+        sent = []
+
+        async def record(make_request, bot, method):
+            sent.append((method.__api_method__, getattr(method, "text", None)))
+            return True
+
+        bot.session.middleware(record)
+
+        for n in range(10):
+            await dp.feed_raw_update(bot, message_update(n, 1901))
+            await dp.feed_raw_update(bot, message_update(100 + n, 1903))
+        for n in range(4):
+            await dp.feed_raw_update(bot, callback_update(200 + n, 1902))
+
+        assert handled.count(("send", 1901)) == 3
+        assert handled.count(("send", 1903)) == 10
+        assert handled.count(("button", 1902)) == 2
+        # Одно предупреждение на эпизод флуда: сообщением и всплывающим уведомлением
+        assert sent == [("sendMessage", THROTTLE_WARNING_MESSAGE), ("answerCallbackQuery", THROTTLE_WARNING_MESSAGE)]
+
+        # Окно прошло — команды снова обрабатываются, а новый флуд снова предупреждается
+        clock.now += 25
+        for n in range(5):
+            await dp.feed_raw_update(bot, message_update(300 + n, 1901))
+        assert handled.count(("send", 1901)) == 6
+        assert len(sent) == 3
+        assert throttling.snapshot()["dropped"] == 7 + 2 + 2
+        await bot.session.close()
+
+    asyncio.run(scenario())
+
+
+def test_idle_counters_are_pruned_and_capped():
+    clock = FakeClock()
+    throttling = ThrottlingMiddleware(limits={"command": "5/10"}, max_keys=1000, exempt=lambda user_id: False, clock=clock)
+    for user_id in range(1500):
+        assert throttling.allow(user_id, "command")
+    assert throttling.snapshot()["keys"] == 1000 and throttling.evicted == 500
+
+    clock.now += 55
+    throttling.allow(1, "command")
+    # Через минуту счётчики всех, кто молчал два окна подряд, удалены
+    clock.now += 10
+    throttling.allow(2, "command")
+    assert throttling.snapshot()["keys"] == 2
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+from sqlalchemy import func, select
+
+from config import OWNER_IDS
+from database.db import get_db, transition_from_pending
+from database.models import Outbox, Post, User
+from handlers.moderator import approve_post
+from services.mass_approval import approve_pending_batch
+
+
+class FakeCallback:
+    def __init__(self, data: str):
+        self.data = data
+        self.from_user = SimpleNamespace(id=OWNER_IDS[0], username=None, full_name="Owner")
+        self.answers = []
+
+        async def edit_text(*args, **kwargs):
+            return None
+
+        self.message = SimpleNamespace(text="пост", caption=None, edit_text=edit_text)
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+
+def test_concurrent_approvals_publish_once(file_db):
+    async def scenario():
+        async for session in get_db():
+            session.add(User(user_id=1301))
+            post = Post(user_id=1301, post_type="free", content="гонка", status="pending")
+            session.add(post)
+            await session.flush()
+            post_id = post.post_id
+
+        callbacks = [FakeCallback(f"approve_{post_id}") for _ in range(300)]
+        # Массовое одобрение пересекается с одиночными нажатиями
+        results = await asyncio.gather(*(approve_post(cb) for cb in callbacks), approve_pending_batch(OWNER_IDS[0], 100))
+
+        winners = [cb for cb in callbacks if cb.answers[0].startswith("✅")]
+        async for session in get_db():
+            outbox_rows = await session.scalar(select(func.count(Outbox.id)).filter(Outbox.post_id == post_id))
+            assert (await session.get(Post, post_id)).status == "approved"
+        assert outbox_rows == 1
+        assert len(winners) + len(results[-1]) == 1
+
+    asyncio.run(scenario())
+
+
+def test_transition_has_single_winner_across_connections(file_db):
+    async def scenario():
+        async with file_db() as session:
+            session.add(User(user_id=1302))
+            post = Post(user_id=1302, post_type="free", content="гонка", status="pending")
+            session.add(post)
+            await session.commit()
+
+        async def approve(moderator_id: int) -> bool:
+            async with file_db() as session:
+                won = await transition_from_pending(session, Post, post.post_id, "approved", moderator_id=moderator_id)
+                await session.commit()
+                return won is not None
+
+        results = await asyncio.gather(*(approve(n) for n in range(200)))
+        assert results.count(True) == 1
+
+    asyncio.run(scenario())
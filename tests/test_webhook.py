@@ -0,0 +1,49 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from utils.webhook import build_webhook_app
+
+# Апдейт в том виде, в каком его присылает Telegram
+RECORDED_UPDATE = {
+    "update_id": 10001,
+    "message": {
+        "message_id": 5,
+        "date": 1717000000,
+        "chat": {"id": 1501, "type": "private", "first_name": "Тест"},
+        "from": {"id": 1501, "is_bot": False, "first_name": "Тест"},
+        "text": "/start",
+    },
+}
+
+
+def test_webhook_accepts_recorded_update_with_secret():
+    async def scenario():
+        received = []
+        router = Router()
+
+        @router.message()
+        async def record(message: Message):
+            received.append((message.from_user.id, message.text))
+
+        dp = Dispatcher()
+        dp.include_router(router)
+        bot = Bot(token="123456:TEST-token")
+        app = build_webhook_app(dp, bot, path="/webhook", secret_token="s3cret", handle_in_background=False)
+
+        async with TestClient(TestServer(app)) as client:
+            denied = await client.post("/webhook", json=RECORDED_UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+            assert denied.status == 401
+            assert received == []
+
+            accepted = await client.post("/webhook", json=RECORDED_UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+            assert accepted.status == 200
+            assert received == [(1501, "/start")]
+
+            health = await client.get("/health")
+            assert await health.text() == "ok"
+        await bot.session.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,47 @@
+"""
+Фоновые задачи, которые не должны задерживать ответ пользователю
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Coroutine, Optional
+
+logger = logging.getLogger(__name__)
+
+# Держим ссылки на задачи, иначе сборщик мусора может уничтожить их до завершения
+_tasks: set[asyncio.Task] = set()
+
+
+def _on_done(task: asyncio.Task) -> None:
+    _tasks.discard(task)
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error(f"Фоновая задача {task.get_name()} завершилась с ошибкой: {exc!r}", exc_info=exc)
+
+
+def spawn(coro: Coroutine, name: Optional[str] = None) -> asyncio.Task:
+    """Запустить корутину в фоне и залогировать ошибку, если она упадёт"""
+    task = asyncio.create_task(coro, name=name)
+    _tasks.add(task)
+    task.add_done_callback(_on_done)
+    return task
+
+
+def spawn_periodic(interval: float, job: Callable[[], Awaitable[object]], name: str) -> asyncio.Task:
+    """Выполнять `job` каждые `interval` секунд; ошибка одного запуска не останавливает цикл"""
+    async def loop():
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"Периодическая задача {name} завершилась с ошибкой: {e!r}")
+
+    return asyncio.create_task(loop(), name=name)
+
+
+async def drain(timeout: Optional[float] = None) -> None:
+    """Дождаться завершения всех фоновых задач (при остановке бота и в тестах)"""
+    if _tasks:
+        await asyncio.wait(set(_tasks), timeout=timeout)
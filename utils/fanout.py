@@ -0,0 +1,51 @@
+"""
+Параллельная рассылка одного сообщения нескольким получателям
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FanOutResult:
+    """Итог рассылки: кому доставлено и кому нет"""
+    delivered: list[int] = field(default_factory=list)
+    failed: dict[int, BaseException] = field(default_factory=dict)
+
+    @property
+    def any_delivered(self) -> bool:
+        return bool(self.delivered)
+
+
+async def fan_out(
+    recipients: Iterable[int],
+    send: Callable[[int], Awaitable[object]],
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> FanOutResult:
+    """Отправить всем получателям одновременно, но не более `concurrency` запросов сразу.
+
+    Каждая отправка ограничена `timeout` секундами — один медленный чат не задерживает остальных.
+    """
+    concurrency = concurrency or settings.FANOUT_CONCURRENCY
+    timeout = settings.FANOUT_TIMEOUT if timeout is None else timeout
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    result = FanOutResult()
+
+    async def deliver(chat_id: int) -> None:
+        async with semaphore:
+            try:
+                await asyncio.wait_for(send(chat_id), timeout)
+            except Exception as e:
+                result.failed[chat_id] = e
+                logger.warning(f"Не удалось отправить сообщение в чат {chat_id}: {e!r}")
+            else:
+                result.delivered.append(chat_id)
+
+    await asyncio.gather(*(deliver(chat_id) for chat_id in dict.fromkeys(recipients)))
+    return result
@@ -4,6 +4,10 @@
 from datetime import datetime
 from typing import Optional
 
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
 from config import MODERATOR_IDS, OWNER_IDS
 from database.models import Post, User, ChatJoinRequest
 from utils.texts import POST_TYPE_NAMES
@@ -62,6 +66,34 @@ Username: {escape_markdown('@' + (user.username or 'не указан'))}
 {escape_markdown(post.content or '')}"""
 
 
+def extract_media(message: Message) -> tuple[str | None, str | None]:
+    """Достать file_id вложения и его тип ('photo', 'video', 'document')"""
+    if message.photo:
+        return message.photo[-1].file_id, "photo"
+    if message.video:
+        return message.video.file_id, "video"
+    if message.document:
+        return message.document.file_id, "document"
+    return None, None
+
+
+async def send_post_content(bot: Bot, chat_id: int | str, post: Post, text: str, reply_markup=None):
+    """Отправить текст поста вместе с его вложением одним запросом нужного типа"""
+    if not post.media_file_id:
+        return await bot.send_message(chat_id, text, reply_markup=reply_markup)
+    if post.media_kind == "video":
+        return await bot.send_video(chat_id, post.media_file_id, caption=text, reply_markup=reply_markup)
+    if post.media_kind == "document":
+        return await bot.send_document(chat_id, post.media_file_id, caption=text, reply_markup=reply_markup)
+    if post.media_kind == "photo":
+        return await bot.send_photo(chat_id, post.media_file_id, caption=text, reply_markup=reply_markup)
+    # Посты, созданные до появления media_kind: тип неизвестен, пробуем фото, потом документ
+    try:
+        return await bot.send_photo(chat_id, post.media_file_id, caption=text, reply_markup=reply_markup)
+    except TelegramBadRequest:
+        return await bot.send_document(chat_id, post.media_file_id, caption=text, reply_markup=reply_markup)
+
+
 def format_user_info(user: User, posts_count: int = None) -> str:
     """Форматирование информации о пользователе"""
     reg_date = user.registration_date.strftime("%d.%m.%Y") if user.registration_date else "Неизвестно"
@@ -0,0 +1,49 @@
+"""
+Payload счёта на оплату (invoice_payload)
+
+Telegram возвращает payload без изменений в pre_checkout_query и successful_payment,
+поэтому в нём лежит всё, что нужно для зачисления платежа, даже если состояние
+FSM потеряно: тип поста, пользователь и сумма.
+
+Формат: post:1:{post_type}:{user_id}:{amount}:{issued_at} (не длиннее 128 байт).
+Старые счета в формате post_{post_type}_{user_id}_{timestamp} тоже разбираются.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+PAYLOAD_VERSION = 1
+PAID_POST_TYPES = ("ad35", "offtopic50")
+
+
+@dataclass(frozen=True)
+class InvoicePayload:
+    post_type: str
+    user_id: int
+    amount: Optional[int]  # None — счёт старого формата, сумма не записана
+    issued_at: int
+
+
+def encode_invoice_payload(post_type: str, user_id: int, amount: int, issued_at: int) -> str:
+    if post_type not in PAID_POST_TYPES:
+        raise ValueError(f"Неизвестный тип платного поста: {post_type}")
+    return f"post:{PAYLOAD_VERSION}:{post_type}:{user_id}:{amount}:{issued_at}"
+
+
+def decode_invoice_payload(payload: Optional[str]) -> Optional[InvoicePayload]:
+    """Разобрать payload; None — не наш счёт или повреждённые данные"""
+    if not payload:
+        return None
+    try:
+        if payload.startswith("post:"):
+            _, version, post_type, user_id, amount, issued_at = payload.split(":")
+            if int(version) != PAYLOAD_VERSION:
+                return None
+            decoded = InvoicePayload(post_type, int(user_id), int(amount), int(issued_at))
+        elif payload.startswith("post_"):
+            _, post_type, user_id, issued_at = payload.split("_")
+            decoded = InvoicePayload(post_type, int(user_id), None, int(issued_at))
+        else:
+            return None
+    except ValueError:
+        return None
+    return decoded if decoded.post_type in PAID_POST_TYPES else None
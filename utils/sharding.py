@@ -0,0 +1,213 @@
+"""
+Многопроцессный режим: один фронт-процесс принимает апдейты, N процессов их обрабатывают
+
+Фронт не разбирает апдейты в модели aiogram: он получает JSON (getUpdates или
+webhook), по id пользователя выбирает процесс-обработчик и отправляет ему словарь
+через multiprocessing-очередь. Апдейты одного пользователя всегда попадают в один
+и тот же процесс, а внутри процесса обрабатываются строго по порядку — на этом
+держатся FSM (в том числе кэш SQLStorage) и порядок ответов пользователю.
+
+Апдейты модераторов и владельцев идут в процесс 0: только он запускает воркеры
+публикации, планировщик слотов и массовое одобрение (см. bot.py).
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+import aiohttp
+from aiogram import Bot
+from aiohttp import web
+
+from utils.webhook import health
+
+logger = logging.getLogger(__name__)
+
+# Типы апдейтов, у которых есть отправитель или чат
+_EVENT_TYPES = (
+    "message",
+    "edited_message",
+    "callback_query",
+    "pre_checkout_query",
+    "shipping_query",
+    "chat_join_request",
+    "my_chat_member",
+    "chat_member",
+    "inline_query",
+    "chosen_inline_result",
+    "channel_post",
+    "edited_channel_post",
+    "business_message",
+    "message_reaction",
+)
+
+
+def update_owner(update: dict) -> Optional[int]:
+    """id пользователя (или чата, если отправителя нет), которому принадлежит апдейт"""
+    for event_type in _EVENT_TYPES:
+        event = update.get(event_type)
+        if event is None:
+            continue
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return None
+
+
+class ShardRouter:
+    """Выбор процесса-обработчика по стабильному хэшу (id % shards) владельца апдейта"""
+
+    def __init__(self, shards: int, pinned: Optional[Callable[[int], bool]] = None):
+        self.shards = shards
+        self.pinned = pinned  # кого всегда отправлять в процесс 0
+        self.routed = [0] * shards
+
+    def route(self, update: dict) -> int:
+        owner = update_owner(update)
+        if owner is None:
+            shard = update.get("update_id", 0) % self.shards
+        elif self.pinned is not None and self.pinned(owner):
+            shard = 0
+        else:
+            shard = owner % self.shards
+        self.routed[shard] += 1
+        return shard
+
+    def dispatch(self, updates: list[dict], queues: list) -> None:
+        """Разложить пачку апдейтов по очередям процессов, сохранив порядок внутри каждой"""
+        batches: list[list[dict]] = [[] for _ in queues]
+        for update in updates:
+            batches[self.route(update)].append(update)
+        for queue, batch in zip(queues, batches):
+            if batch:
+                queue.put(batch)
+
+    def snapshot(self) -> dict:
+        return {"shards": self.shards, "routed": list(self.routed)}
+
+
+class KeyedSequencer:
+    """Апдейты разных пользователей обрабатываются параллельно, одного — по очереди.
+
+    Каждая задача ждёт предыдущую задачу того же ключа; `limit` ограничивает число
+    принятых в работу апдейтов, чтобы медленный обработчик не раздувал память.
+    """
+
+    def __init__(self, limit: int = 100):
+        self._tails: dict[Hashable, asyncio.Task] = {}
+        self._slots = asyncio.Semaphore(limit)
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable, coro: Awaitable[Any]) -> None:
+        await self._slots.acquire()
+        task = asyncio.create_task(self._run(key, self._tails.get(key), coro))
+        self._tails[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Hashable, previous: Optional[asyncio.Task], coro: Awaitable[Any]) -> None:
+        try:
+            if previous is not None:
+                # Ошибка предыдущего апдейта не должна отменять следующий
+                await asyncio.wait([previous])
+            await coro
+        except Exception as e:
+            logger.error(f"Ошибка обработки апдейта ({key}): {e!r}")
+        finally:
+            self._slots.release()
+            if self._tails.get(key) is asyncio.current_task():
+                del self._tails[key]
+
+    async def drain(self) -> None:
+        if self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+
+async def consume(queue, feed: Callable[[dict], Awaitable[Any]], limit: int = 100) -> None:
+    """Цикл процесса-обработчика: брать пачки из очереди до None и передавать апдейты в `feed`"""
+    loop = asyncio.get_running_loop()
+    sequencer = KeyedSequencer(limit)
+    while True:
+        # Очередь multiprocessing блокирующая — ждём её в потоке, не останавливая цикл событий
+        batch = await loop.run_in_executor(None, queue.get)
+        if batch is None:
+            break
+        for update in batch:
+            await sequencer.submit(update_owner(update) or update.get("update_id"), feed(update))
+    await sequencer.drain()
+
+
+def start_workers(shards: int, target: Callable[..., None], *args: Any) -> tuple[list, list]:
+    """Запустить процессы target(index, shards, queue, *args). Возвращает (процессы, очереди)"""
+    # spawn: дочерний процесс не наследует цикл событий и соединения с БД родителя
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue() for _ in range(shards)]
+    processes = [
+        ctx.Process(target=target, args=(index, shards, queue, *args), name=f"shard_{index}", daemon=False)
+        for index, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+    return processes, queues
+
+
+def stop_workers(processes: list, queues: list, timeout: float = 30.0) -> None:
+    """Попросить процессы доработать очередь и завершиться; зависшие — остановить"""
+    for queue in queues:
+        queue.put(None)
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            logger.warning(f"Процесс {process.name} не завершился за {timeout} с, останавливаем")
+            process.terminate()
+            process.join()
+
+
+async def poll_updates(bot: Bot, router: ShardRouter, queues: list, allowed_updates: list[str]) -> None:
+    """getUpdates без разбора в модели aiogram: апдейты уходят в процессы как есть"""
+    url = bot.session.api.api_url(bot.token, "getUpdates")
+    offset = None
+    backoff = 1.0
+    async with aiohttp.ClientSession() as http:
+        while True:
+            try:
+                async with http.post(
+                    url,
+                    json={"offset": offset, "timeout": 30, "allowed_updates": allowed_updates},
+                    timeout=aiohttp.ClientTimeout(total=40),
+                ) as response:
+                    payload = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                logger.warning(f"getUpdates: {e!r}, повтор через {backoff:.0f} с")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+                continue
+            if not payload.get("ok"):
+                retry_after = (payload.get("parameters") or {}).get("retry_after", 5)
+                logger.warning(f"getUpdates: {payload.get('description')}, повтор через {retry_after} с")
+                await asyncio.sleep(retry_after)
+                continue
+            backoff = 1.0
+            updates = payload["result"]
+            if updates:
+                offset = updates[-1]["update_id"] + 1
+                router.dispatch(updates, queues)
+
+
+def build_front_webhook_app(router: ShardRouter, queues: list, path: str, secret_token: Optional[str]) -> web.Application:
+    """Webhook фронт-процесса: проверить секрет, разобрать JSON и сразу отдать апдейт процессу"""
+
+    async def receive(request: web.Request) -> web.Response:
+        if secret_token and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+            return web.Response(status=401, text="Unauthorized")
+        router.dispatch([await request.json()], queues)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    app.router.add_get("/health", health)
+    return app
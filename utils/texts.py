@@ -113,6 +113,9 @@ MODERATOR_NEW_POST_TEMPLATE = """🆕 Новый пост на модераци
 # Пользователь забанен
 USER_BANNED_MESSAGE = "🚫 Ты заблокирован и не можешь отправлять посты."
 
+# Слишком много сообщений подряд (антифлуд)
+THROTTLE_WARNING_MESSAGE = "⏳ Слишком много сообщений подряд. Подожди немного — пока бот их не обрабатывает."
+
 
 # Действие отменено
 ACTION_CANCELLED_MESSAGE = "❌ Действие отменено."
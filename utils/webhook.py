@@ -0,0 +1,111 @@
+"""
+Приём апдейтов через webhook (aiohttp)
+
+Telegram сам присылает апдейты POST-запросом на WEBHOOK_URL + WEBHOOK_PATH; каждый
+запрос проверяется по заголовку X-Telegram-Bot-Api-Secret-Token. Входящие
+запросы будят хостинг, поэтому внешний пингер в этом режиме не нужен.
+
+GET /metrics отдаёт метрики процесса в формате Prometheus; в режиме polling для
+него поднимается отдельный сервер на METRICS_PORT.
+"""
+import asyncio
+import logging
+import signal
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import settings
+from middlewares.metrics import metrics as metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+async def health(request: web.Request) -> web.Response:
+    """Проверка живости для хостинга"""
+    return web.Response(text="ok")
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """Метрики процесса в текстовом формате Prometheus"""
+    return web.Response(text=metrics_registry.render(), content_type="text/plain", charset="utf-8")
+
+
+def build_webhook_app(
+    dp: Dispatcher,
+    bot: Bot,
+    path: Optional[str] = None,
+    secret_token: Optional[str] = None,
+    handle_in_background: bool = True,
+) -> web.Application:
+    """aiohttp-приложение: POST {path} — апдейты Telegram, GET /health — проверка живости.
+
+    handle_in_background=True отвечает Telegram сразу, а апдейт обрабатывается
+    отдельной задачей (так медленный обработчик не вызывает повторную доставку).
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        handle_in_background=handle_in_background,
+    ).register(app, path=path or settings.WEBHOOK_PATH)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def start_metrics_server(port: int) -> web.AppRunner:
+    """Отдельный сервер с /metrics и /health (режим polling). Остановка — runner.cleanup()"""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/health", health)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, settings.WEBAPP_HOST, port).start()
+    logger.info(f"Метрики: http://{settings.WEBAPP_HOST}:{port}/metrics")
+    return runner
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Поднять веб-сервер, зарегистрировать webhook в Telegram и работать до отмены"""
+    secret_token = settings.WEBHOOK_SECRET or None
+    app = build_webhook_app(dp, bot, settings.WEBHOOK_PATH, secret_token)
+    await serve_webhook(app, bot, dp.resolve_used_update_types())
+
+
+async def serve_webhook(app: web.Application, bot: Bot, allowed_updates: list[str]) -> None:
+    """Запустить `app` на WEBAPP_HOST:WEBAPP_PORT, установить webhook и ждать сигнала остановки"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, settings.WEBAPP_HOST, settings.WEBAPP_PORT)
+    await site.start()
+
+    url = settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH
+    try:
+        await bot.set_webhook(
+            url,
+            secret_token=settings.WEBHOOK_SECRET or None,
+            allowed_updates=allowed_updates,
+        )
+        logger.info(f"Webhook установлен: {url} (слушаем {settings.WEBAPP_HOST}:{settings.WEBAPP_PORT})")
+        await wait_for_stop_signal()
+    finally:
+        await runner.cleanup()
+
+
+async def wait_for_stop_signal() -> None:
+    """Ждать SIGINT/SIGTERM (хостинг останавливает контейнер через SIGTERM)"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остаётся KeyboardInterrupt, который отменит main()
+            pass
+    await stop.wait()
+    logger.info("Получен сигнал остановки")